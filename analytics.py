@@ -0,0 +1,160 @@
+# analytics.py - Columnar conversation analytics with vectorized aggregation
+
+import numpy as np
+
+BUCKET_SECONDS = 3600
+UNMATCHED = -1
+
+
+class ColumnarHistory:
+    """Incoming-message history held as parallel NumPy columns.
+
+    Hourly buckets (message count, unmatched count, latency sum/count) are
+    updated as rows arrive, so per-hour dashboards never rescan history.
+    """
+
+    def __init__(self, capacity=4096):
+        self.size = 0
+        self.ts = np.empty(capacity, dtype=np.float64)
+        self.chat_id = np.empty(capacity, dtype=np.int64)
+        self.keyword_id = np.empty(capacity, dtype=np.int32)
+        self.latency = np.empty(capacity, dtype=np.float32)
+
+        self.keywords = []
+        self._keyword_ids = {}
+
+        self.origin = None
+        self.bucket_messages = np.zeros(0, dtype=np.int64)
+        self.bucket_unmatched = np.zeros(0, dtype=np.int64)
+        self.bucket_latency_sum = np.zeros(0, dtype=np.float64)
+        self.bucket_latency_count = np.zeros(0, dtype=np.int64)
+
+        self.last_record = 0
+
+    def _keyword_id(self, keyword):
+        if keyword is None:
+            return UNMATCHED
+        kid = self._keyword_ids.get(keyword)
+        if kid is None:
+            kid = self._keyword_ids[keyword] = len(self.keywords)
+            self.keywords.append(keyword)
+        return kid
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        if needed <= len(self.ts):
+            return
+        capacity = max(needed, len(self.ts) * 2)
+        for name in ("ts", "chat_id", "keyword_id", "latency"):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def _grow_buckets(self, count):
+        extra = count - len(self.bucket_messages)
+        if extra > 0:
+            self.bucket_messages = np.concatenate([self.bucket_messages, np.zeros(extra, np.int64)])
+            self.bucket_unmatched = np.concatenate([self.bucket_unmatched, np.zeros(extra, np.int64)])
+            self.bucket_latency_sum = np.concatenate([self.bucket_latency_sum, np.zeros(extra, np.float64)])
+            self.bucket_latency_count = np.concatenate([self.bucket_latency_count, np.zeros(extra, np.int64)])
+
+    def extend(self, ts, chat_ids, keywords, latencies):
+        """Append a batch of incoming messages (latency NaN when no reply was sent)"""
+        count = len(ts)
+        if not count:
+            return
+        self._reserve(count)
+        start, end = self.size, self.size + count
+        self.ts[start:end] = ts
+        self.chat_id[start:end] = chat_ids
+        self.keyword_id[start:end] = [self._keyword_id(k) for k in keywords]
+        self.latency[start:end] = latencies
+        self.size = end
+
+        # Fold the new rows into their hour buckets
+        new_ts = self.ts[start:end]
+        if self.origin is None:
+            self.origin = float(np.floor(new_ts.min() / BUCKET_SECONDS) * BUCKET_SECONDS)
+        buckets = np.maximum(((new_ts - self.origin) // BUCKET_SECONDS).astype(np.int64), 0)
+        self._grow_buckets(int(buckets.max()) + 1)
+        size = len(self.bucket_messages)
+        self.bucket_messages += np.bincount(buckets, minlength=size)
+        self.bucket_unmatched += np.bincount(buckets, weights=self.keyword_id[start:end] == UNMATCHED,
+                                             minlength=size).astype(np.int64)
+        latency = self.latency[start:end]
+        replied = ~np.isnan(latency)
+        self.bucket_latency_sum += np.bincount(buckets[replied], weights=latency[replied], minlength=size)
+        self.bucket_latency_count += np.bincount(buckets[replied], minlength=size)
+
+    def update_from_store(self, store, chunk_size=10000):
+        """Pull records added to a ConversationStore since the last update"""
+        batch = []
+        for record_no, record in store.since(self.last_record, chunk_size):
+            self.last_record = record_no + 1
+            if record.get("direction") != "incoming":
+                continue
+            latency = record.get("latency")
+            batch.append((record["ts"], record["chat_id"], record.get("keyword"),
+                          np.nan if latency is None else latency))
+            if len(batch) >= chunk_size:
+                self.extend(*zip(*batch))
+                batch = []
+        if batch:
+            self.extend(*zip(*batch))
+
+    # -- aggregations --------------------------------------------------------
+
+    def _bucket_slice(self, start_ts, end_ts):
+        if self.origin is None:
+            return slice(0, 0)
+        lo = 0 if start_ts is None else max(0, int((start_ts - self.origin) // BUCKET_SECONDS))
+        hi = len(self.bucket_messages) if end_ts is None else max(0, int(-(-(end_ts - self.origin) // BUCKET_SECONDS)))
+        return slice(lo, hi)
+
+    def hourly(self, start_ts=None, end_ts=None):
+        """(bucket start times, messages, unmatched, mean latency) per hour"""
+        window = self._bucket_slice(start_ts, end_ts)
+        messages = self.bucket_messages[window]
+        starts = self.origin + BUCKET_SECONDS * np.arange(window.start, window.start + len(messages)) \
+            if self.origin is not None else np.zeros(0)
+        counts = self.bucket_latency_count[window]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_latency = np.where(counts > 0, self.bucket_latency_sum[window] / counts, np.nan)
+        return starts, messages, self.bucket_unmatched[window], mean_latency
+
+    def _mask(self, start_ts, end_ts):
+        ts = self.ts[:self.size]
+        mask = np.ones(self.size, dtype=bool)
+        if start_ts is not None:
+            mask &= ts >= start_ts
+        if end_ts is not None:
+            mask &= ts < end_ts
+        return mask
+
+    def top_keywords(self, limit=10, start_ts=None, end_ts=None):
+        """[(keyword, hits)] for the most matched keywords"""
+        ids = self.keyword_id[:self.size][self._mask(start_ts, end_ts)]
+        ids = ids[ids != UNMATCHED]
+        if not len(ids):
+            return []
+        hits = np.bincount(ids, minlength=len(self.keywords))
+        limit = min(limit, np.count_nonzero(hits))
+        top = np.argpartition(hits, -limit)[-limit:]
+        top = top[np.argsort(hits[top])[::-1]]
+        return [(self.keywords[i], int(hits[i])) for i in top]
+
+    def summary(self, start_ts=None, end_ts=None):
+        """Totals for a time range"""
+        mask = self._mask(start_ts, end_ts)
+        total = int(np.count_nonzero(mask))
+        unmatched = int(np.count_nonzero(self.keyword_id[:self.size][mask] == UNMATCHED))
+        latency = self.latency[:self.size][mask]
+        latency = latency[~np.isnan(latency)]
+        return {
+            "messages": total,
+            "chats": int(len(np.unique(self.chat_id[:self.size][mask]))),
+            "unmatched_rate": unmatched / total if total else 0.0,
+            "avg_latency": float(latency.mean()) if len(latency) else None,
+            "p95_latency": float(np.percentile(latency, 95)) if len(latency) else None,
+        }
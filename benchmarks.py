@@ -0,0 +1,571 @@
+# benchmarks.py - Performance checks for the bot's data structures
+
+import os
+import sys
+import json
+import time
+import tempfile
+import asyncio
+import argparse
+import tracemalloc
+
+
+def synthetic_responses(count):
+    """Generate a responses.json-shaped dict with a realistic type mix"""
+    responses = {}
+    for i in range(count):
+        if i % 10 == 0:
+            responses[f"photo {i}"] = {"type": "image", "content": f"image_{i}.jpg", "caption": f"Photo number {i}"}
+        elif i % 10 == 1:
+            responses[f"song {i}"] = {"type": "audio", "content": f"song_{i}.mp3"}
+        else:
+            responses[f"keyword {i}"] = {
+                "type": "text",
+                "content": [f"Reply one for {i}", f"Reply two for {i}"],
+            }
+    return responses
+
+
+def measure(label, build):
+    """Run `build` and report the peak traced memory and time it took"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"   {label:<28} {current / (1024 * 1024):8.1f} MB held  "
+          f"{peak / (1024 * 1024):8.1f} MB peak  {elapsed:6.2f}s")
+    return result, current
+
+
+def bench_response_memory(count):
+    """Compare the json.load dict against CompactResponseSet"""
+    from response_model import CompactResponseSet
+    from response_store import iter_json_object
+
+    print(f"\n📊 Response set memory ({count:,} keywords)")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "responses.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(synthetic_responses(count), f)
+
+        def load_dict():
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        def load_compact():
+            with open(path, 'r', encoding='utf-8') as f:
+                return CompactResponseSet.from_items(iter_json_object(f))
+
+        as_dict, dict_bytes = measure("dict (json.load)", load_dict)
+        del as_dict
+        compact, compact_bytes = measure("CompactResponseSet", load_compact)
+
+        keys = [f"keyword {i}" for i in range(2, count, max(1, count // 1000)) if i % 10 > 1]
+        started = time.perf_counter()
+        for key in keys:
+            compact.get(key)
+        per_lookup = (time.perf_counter() - started) / max(1, len(keys))
+        print(f"   Lookup: {per_lookup * 1e6:.2f} µs per keyword")
+        print(f"   Saving: {(1 - compact_bytes / dict_bytes) * 100:.0f}% less memory")
+
+
+class FakeFloodWaitError(Exception):
+    """Stand-in for telethon's FloodWaitError"""
+
+    def __init__(self, seconds):
+        super().__init__(f"A wait of {seconds} seconds is required")
+        self.seconds = seconds
+
+
+class FakeTelegramClient:
+    """Local client that accepts `limit` sends per second and floods beyond that"""
+
+    def __init__(self, limit=30, flood_seconds=1):
+        self.limit = limit
+        self.flood_seconds = flood_seconds
+        self.sent = []
+        self.flood_errors = 0
+        self._window = []
+
+    async def send_message(self, chat_id, text):
+        now = time.monotonic()
+        self._window = [t for t in self._window if now - t < 1.0]
+        if len(self._window) >= self.limit:
+            self.flood_errors += 1
+            raise FakeFloodWaitError(self.flood_seconds)
+        self._window.append(now)
+        self.sent.append((chat_id, text, now))
+        return len(self.sent)
+
+
+def bench_send_scheduler(count):
+    """Group keyword spam plus private chats through SendScheduler and a flooding fake client"""
+    import asyncio
+    from send_scheduler import SendScheduler
+
+    group_messages = min(count, 5000)
+    private_chats = 50
+    print(f"\n📨 Send scheduler ({group_messages:,} group triggers, {private_chats} private chats)")
+
+    async def scenario():
+        client = FakeTelegramClient(limit=30, flood_seconds=1)
+        scheduler = SendScheduler(global_rate=40, global_burst=40)
+        scheduler.start()
+
+        group_replies = []
+        for i in range(group_messages):
+            text = "Today's offer!"
+            group_replies.append(scheduler.submit(
+                -100, lambda: client.send_message(-100, text), is_private=False, dedupe_key=text))
+
+        latencies = []
+
+        async def private_reply(chat_id):
+            started = time.monotonic()
+            await scheduler.submit(chat_id, lambda: client.send_message(chat_id, "Hi!"))
+            latencies.append(time.monotonic() - started)
+
+        await asyncio.gather(*(private_reply(chat_id) for chat_id in range(1, private_chats + 1)))
+        await asyncio.gather(*group_replies, return_exceptions=True)
+        await scheduler.stop()
+        return client, scheduler, sorted(latencies)
+
+    started = time.perf_counter()
+    client, scheduler, latencies = asyncio.run(scenario())
+    print(f"   Sends: {len(client.sent)}  coalesced: {scheduler.stats['coalesced']:,}  "
+          f"flood waits: {client.flood_errors}  in {time.perf_counter() - started:.2f}s")
+    print(f"   Private reply latency: p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+          f"max {latencies[-1] * 1000:.0f} ms")
+
+
+def bench_ingress(count):
+    """Private reply latency while a group floods the bot: plain FIFO against IngressQueue"""
+    import asyncio
+    from ingress_queue import IngressQueue
+
+    group_messages = min(count, 20000)
+    private_chats = 50
+    print(f"\n🌊 Ingress ({group_messages:,} group messages, {private_chats} private chats, 1 ms per message)")
+
+    async def storm(put, handled):
+        # Groups arrive in bursts between private messages
+        per_burst = group_messages // private_chats
+        for chat_id in range(1, private_chats + 1):
+            for i in range(per_burst):
+                # A quarter repeat a few spam lines, the rest are distinct
+                text = f"spam {i % 50}" if i % 4 == 0 else f"message {chat_id}.{i}"
+                put(-100 - i % 5, text, (-100, time.monotonic()), False)
+            put(chat_id, "hi", (chat_id, time.monotonic()), True)
+            await asyncio.sleep(0.005)
+        while len(handled) < private_chats:
+            await asyncio.sleep(0.01)
+
+    def report(label, latencies, processed):
+        latencies.sort()
+        print(f"   {label:<14} private p50 {latencies[len(latencies) // 2] * 1000:7.0f} ms  "
+              f"max {latencies[-1] * 1000:7.0f} ms  messages handled {processed:,}")
+
+    async def fifo():
+        queue = asyncio.Queue()
+        latencies, processed = [], [0]
+
+        async def worker():
+            while True:
+                chat_id, queued_at = await queue.get()
+                await asyncio.sleep(0.001)
+                processed[0] += 1
+                if chat_id > 0:
+                    latencies.append(time.monotonic() - queued_at)
+
+        task = asyncio.ensure_future(worker())
+        await storm(lambda chat_id, text, item, private: queue.put_nowait(item), latencies)
+        task.cancel()
+        return latencies, processed[0], queue.qsize()
+
+    async def shedding():
+        queue = IngressQueue(max_pending=1000)
+        latencies = []
+
+        async def handle(item):
+            chat_id, queued_at = item
+            await asyncio.sleep(0.001)
+            if chat_id > 0:
+                latencies.append(time.monotonic() - queued_at)
+
+        queue.start(handle, workers=1)
+        await storm(queue.put, latencies)
+        await queue.stop()
+        return latencies, queue.stats["handled"], queue
+
+    latencies, processed, backlog = asyncio.run(fifo())
+    report("FIFO", latencies, processed)
+    print(f"   {'':<14} backlog left: {backlog:,}")
+    latencies, processed, queue = asyncio.run(shedding())
+    report("IngressQueue", latencies, processed)
+    print(f"   {'':<14} shed: {queue.stats['shed_duplicate']:,} duplicate, "
+          f"{queue.stats['shed_oldest']:,} oldest, {queue.stats['shed_stale']:,} stale")
+
+
+class FakeLifecycleClient:
+    """Connected client that keeps its event handlers in a list"""
+
+    def __init__(self):
+        self.handlers = []
+
+    def is_connected(self):
+        return True
+
+    async def disconnect(self):
+        pass
+
+    def add_event_handler(self, callback, event=None):
+        self.handlers.append((callback, event))
+
+    def remove_event_handler(self, callback, event=None):
+        self.handlers.remove((callback, event))
+
+    def list_event_handlers(self):
+        return list(self.handlers)
+
+    def deliver(self, chat_id):
+        for callback, _ in list(self.handlers):
+            callback(chat_id)
+
+
+class FakeLifecycleBot:
+    """Queues every update on an IngressQueue and counts the replies its workers make"""
+
+    def __init__(self, ingress_queue):
+        self.client = FakeLifecycleClient()
+        self.ingress_queue = ingress_queue
+        self.replied = 0
+
+    async def handle(self, chat_id):
+        self.replied += 1
+
+    async def start(self):
+        self.client.add_event_handler(lambda chat_id: self.ingress_queue.put(chat_id, None, chat_id))
+        self.ingress_queue.start(self.handle)
+        await asyncio.Event().wait()
+
+
+def bench_lifecycle(count):
+    """Stop/start round trips of BotLifecycle: replies must keep flowing after every warm restart"""
+    from bot_lifecycle import BotLifecycle
+    from ingress_queue import IngressQueue
+
+    rounds = 5
+    per_round = min(count, 1000)
+    print(f"\n🔁 Lifecycle ({rounds} stop/start round trips, {per_round:,} messages each)")
+
+    bot = FakeLifecycleBot(IngressQueue(dedupe_window=0))
+    lifecycle = BotLifecycle(bot, ingress_queue=bot.ingress_queue)
+    restarts = []
+    try:
+        lifecycle.start().result(5)
+        for round_no in range(rounds):
+            if round_no:
+                lifecycle.stop().result(5)
+                started = time.perf_counter()
+                lifecycle.start().result(5)
+                restarts.append(time.perf_counter() - started)
+            expected = bot.replied + per_round
+            for chat_id in range(per_round):
+                lifecycle.loop.call_soon_threadsafe(bot.client.deliver, chat_id + 1)
+            deadline = time.monotonic() + 5
+            while bot.replied < expected and time.monotonic() < deadline:
+                time.sleep(0.01)
+            if bot.replied < expected:
+                print(f"   ❌ round {round_no + 1}: {bot.replied - expected + per_round} of {per_round} answered")
+                return
+    finally:
+        lifecycle.shutdown()
+    print(f"   ✅ all {rounds * per_round:,} messages answered, warm restart "
+          f"{sum(restarts) / len(restarts) * 1000:.1f} ms on average")
+
+
+def bench_sessions(count):
+    """Memory per active chat: a dict of dicts against SessionStore's slotted records"""
+    from session_store import SessionStore
+
+    steps = ["How many would you like?", "Deliver {1} to which address?", "Order placed for {1}."]
+    print(f"\n💬 Flow sessions ({count:,} active chats)")
+
+    def build_dicts():
+        sessions = {}
+        for chat_id in range(count):
+            sessions[chat_id] = {"flow": "order", "step": 1, "answers": [str(chat_id % 10)],
+                                 "last_seen": time.time()}
+        return sessions
+
+    def build_store():
+        sessions = SessionStore(max_active=count + 1)
+        for chat_id in range(count):
+            sessions.start_flow(chat_id, "order", steps)
+            sessions.continue_flow(chat_id, str(chat_id % 10), lambda keyword: steps)
+        return sessions
+
+    _, dict_bytes = measure("dict of dicts", build_dicts)
+    sessions, store_bytes = measure("SessionStore", build_store)
+    print(f"   Per chat: {dict_bytes / count:.0f} bytes as dicts, {store_bytes / count:.0f} bytes in SessionStore")
+
+    started = time.perf_counter()
+    for chat_id in range(count):
+        sessions.get(chat_id)
+    print(f"   Lookup: {(time.perf_counter() - started) / count * 1e6:.2f} µs per chat")
+
+
+class FakeUploadEndpoint:
+    """Local TCP sink standing in for Telegram's upload servers, with a client that feeds it"""
+
+    def __init__(self):
+        self.received = 0
+        self.uploads = 0
+        self.server = None
+
+    async def _sink(self, reader, writer):
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            self.received += len(data)
+        writer.write(b"ok")
+        await writer.drain()
+        writer.close()
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._sink, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def upload_file(self, stream, file_size=None, file_name=None, part_size_kb=512):
+        # Sends the file part by part like telethon's upload_file
+        reader, writer = await asyncio.open_connection("127.0.0.1", self.port)
+        while True:
+            part = stream.read(part_size_kb * 1024)
+            if not part:
+                break
+            writer.write(part)
+            await writer.drain()
+        writer.write_eof()
+        await reader.read()
+        writer.close()
+        await writer.wait_closed()
+        self.uploads += 1
+        return ("InputFile", file_name, self.uploads)
+
+    async def send_file(self, chat_id, handle, **kwargs):
+        return chat_id, handle
+
+
+def bench_media(count):
+    """50 chats asking for the same 10 MB song: whole-file reads against MediaStreamer"""
+    import io
+    from media_stream import MediaStreamer
+
+    chats = 50
+    print(f"\n🎵 Media uploads ({chats} chats, one 10 MB file)")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "song.mp3")
+        with open(path, 'wb') as f:
+            f.write(os.urandom(10 * 1024 * 1024))
+
+        async def read_whole(endpoint):
+            with open(path, 'rb') as f:
+                stream = io.BytesIO(f.read())
+            return await endpoint.upload_file(stream, file_name="song.mp3")
+
+        async def run(send):
+            async with FakeUploadEndpoint() as endpoint:
+                await asyncio.gather(*(send(endpoint, chat_id) for chat_id in range(chats)))
+            return endpoint
+
+        streamer = MediaStreamer()
+        for label, send in [("whole-file reads", lambda endpoint, chat_id: read_whole(endpoint)),
+                            ("MediaStreamer", lambda endpoint, chat_id: streamer.send_file(endpoint, chat_id, path))]:
+            endpoint, _ = measure(label, lambda: asyncio.run(run(send)))
+            print(f"   {'':<28} {endpoint.uploads} uploads, {endpoint.received / (1024 * 1024):.0f} MB sent")
+
+
+def bench_analytics(count):
+    """Aggregate a large synthetic history with ColumnarHistory"""
+    import numpy as np
+    from analytics import ColumnarHistory
+
+    rows = max(count, 1000000)
+    print(f"\n📈 Analytics ({rows:,} messages)")
+    rng = np.random.default_rng(0)
+    now = time.time()
+    ts = np.sort(now - rng.random(rows) * 30 * 86400)
+    chats = rng.integers(1, 50000, rows)
+    keywords = [None if k < 0 else f"keyword {k}" for k in rng.integers(-100, 900, rows)]
+    latencies = rng.gamma(2.0, 0.2, rows)
+
+    history = ColumnarHistory()
+    started = time.perf_counter()
+    for start in range(0, rows, 100000):
+        history.extend(ts[start:start + 100000], chats[start:start + 100000],
+                       keywords[start:start + 100000], latencies[start:start + 100000])
+    print(f"   Ingest: {time.perf_counter() - started:.2f}s")
+
+    since = now - 7 * 86400
+    for label, run in [("hourly (7 days)", lambda: history.hourly(start_ts=since)),
+                       ("top keywords (7 days)", lambda: history.top_keywords(20, start_ts=since)),
+                       ("summary (7 days)", lambda: history.summary(start_ts=since))]:
+        started = time.perf_counter()
+        run()
+        print(f"   {label:<24} {(time.perf_counter() - started) * 1000:8.1f} ms")
+
+
+def bench_history(count):
+    """Write conversation history, reopen it read-only, promote() and read it back intact"""
+    from conversation_store import ConversationStore, APP_EVENTS_CHAT
+
+    records = min(count, 100000)
+    print(f"\n🗂️ Conversation history ({records:,} records, read-only → promote)")
+    with tempfile.TemporaryDirectory() as directory:
+        store = ConversationStore(directory)
+        started = time.perf_counter()
+        for i in range(records):
+            store.append(i % 100 + 1, "incoming", f"message {i}", user_id=i % 100 + 1)
+        store.close()
+        print(f"   Write: {time.perf_counter() - started:.2f}s")
+
+        # Same sequence as the GUI: history opened read-only, events logged, then Start Bot
+        store = ConversationStore(directory, readonly=True)
+        store.append(APP_EVENTS_CHAT, "system", "Logged before the bot started")
+        started = time.perf_counter()
+        if not store.promote():
+            print("   ❌ promote() could not take the writer lock")
+            return
+        print(f"   Promote: {(time.perf_counter() - started) * 1000:.1f} ms")
+        store.append(1, "incoming", "after promote", user_id=1)
+        store.close()
+
+        reopened = ConversationStore(directory, readonly=True)
+        try:
+            last = reopened.last_for_chat(1, limit=1)
+            event = reopened.last_for_chat(APP_EVENTS_CHAT, limit=1)
+        except ValueError as e:
+            print(f"   ❌ history unreadable after promote: {e}")
+            return
+        if len(reopened) != records + 2 or last[0]["text"] != "after promote" or not event:
+            print(f"   ❌ {len(reopened):,} of {records + 2:,} records survived promote()")
+            return
+    print(f"   ✅ all {records + 2:,} records read back after promote()")
+
+
+def bench_normalizer(count):
+    """Message normalization throughput: TextNormalizer against nltk's tokenizer and stemmer"""
+    import random
+    from text_normalizer import TextNormalizer
+
+    rng = random.Random(0)
+    vocab = [f"word{i}" for i in range(3000)] + ["price", "prices", "running", "offers", "menu", "delivery",
+                                                 "kya", "hai", "bhai", "kitna", "the", "is", "what"]
+    messages = [" ".join(rng.choice(vocab) for _ in range(rng.randint(2, 12))) + rng.choice(["?", "!!", ".", " 😀", ""])
+                for _ in range(count)]
+
+    print(f"\n📊 Message normalization ({count:,} messages)")
+
+    def run(label, normalize):
+        started = time.perf_counter()
+        for message in messages:
+            normalize(message)
+        elapsed = time.perf_counter() - started
+        print(f"   {label:<28} {count / elapsed:12,.0f} msg/s  {elapsed * 1e6 / count:7.1f} µs/msg")
+
+    normalizer = TextNormalizer()
+    run("TextNormalizer (cached)", normalizer.tokens)
+    print(f"   stem cache: {normalizer.cache_info()}")
+    run("TextNormalizer (no cache)", TextNormalizer(cache_size=0).tokens)
+
+    from hinglish_lexicon import HinglishLexicon
+    with tempfile.TemporaryDirectory() as tmp:
+        lexicon = HinglishLexicon(os.path.join(tmp, "hinglish.lex"), os.path.join(tmp, "overlay.json"))
+        run("+ Hinglish lexicon (cached)", TextNormalizer(lexicon=lexicon).tokens)
+        run("+ Hinglish lexicon (no cache)", TextNormalizer(cache_size=0, lexicon=lexicon).tokens)
+        lexicon.close()
+
+    try:
+        from nltk.stem import PorterStemmer
+        from nltk.tokenize import wordpunct_tokenize
+    except ImportError:
+        print("   nltk not installed, skipping the nltk comparison")
+        return
+    stemmer = PorterStemmer()
+    run("nltk wordpunct + Porter", lambda m: [stemmer.stem(t) for t in wordpunct_tokenize(m.lower())])
+
+
+def bench_typo_index(count):
+    """Build a TypoIndex over single-word keywords and time misspelled lookups"""
+    import random
+    import string
+    from typo_index import TypoIndex
+
+    rng = random.Random(0)
+    words = {"".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))) for _ in range(count)}
+    words = sorted(words)
+
+    def misspell(word):
+        i = rng.randrange(len(word))
+        edit = rng.choice(("drop", "swap", "replace"))
+        if edit == "drop":
+            return word[:i] + word[i + 1:]
+        if edit == "swap" and i < len(word) - 1:
+            return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+
+    print(f"\n📊 Typo index ({len(words):,} single-word keywords)")
+    def build():
+        index = TypoIndex()
+        index.rebuild(words)
+        return index
+
+    index, _ = measure("TypoIndex build", build)
+
+    queries = [misspell(rng.choice(words)) for _ in range(20000)]
+    started = time.perf_counter()
+    found = sum(1 for q in queries if index.best(q) is not None)
+    elapsed = time.perf_counter() - started
+    print(f"   lookup: {elapsed * 1e6 / len(queries):.1f} µs/query, {found / len(queries):.0%} matched")
+
+    started = time.perf_counter()
+    index.add("freshword")
+    index.remove("freshword")
+    print(f"   add + remove one keyword: {(time.perf_counter() - started) * 1e6:.0f} µs")
+
+
+BENCHMARKS = {
+    "analytics": bench_analytics,
+    "history": bench_history,
+    "ingress": bench_ingress,
+    "lifecycle": bench_lifecycle,
+    "media": bench_media,
+    "normalizer": bench_normalizer,
+    "responses": bench_response_memory,
+    "scheduler": bench_send_scheduler,
+    "sessions": bench_sessions,
+    "typo": bench_typo_index,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Telegram Bot Manager benchmarks")
+    parser.add_argument("names", nargs="*", metavar="name", help=f"One of: {', '.join(sorted(BENCHMARKS))}")
+    parser.add_argument("--count", type=int, default=100000, help="Number of synthetic items")
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    for name in args.names or sorted(BENCHMARKS):
+        BENCHMARKS[name](args.count)
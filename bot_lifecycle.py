@@ -0,0 +1,190 @@
+# bot_lifecycle.py - Start/stop/restart of the bot on one long-lived event loop
+
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+STOPPED = "stopped"
+STARTING = "starting"
+RUNNING = "running"
+STOPPING = "stopping"
+
+
+class BotLifecycle:
+    """Runs a TelegramBot on a single event loop thread owned for the app's lifetime.
+
+    Stopping detaches the bot's event handlers and drains the send scheduler
+    but leaves the bot task (and with it the Telegram connection) alive.
+    Starting again re-attaches the handlers to that same authenticated client,
+    so a stop/start cycle costs no reconnect, no new thread and no new loop.
+    Without a connected client the bot task is cancelled and started afresh.
+    """
+
+    def __init__(self, bot, send_scheduler=None, prepare=None, on_state=None, drain_timeout=5.0,
+                 ingress_queue=None, broadcasts=None):
+        self.bot = bot
+        self.send_scheduler = send_scheduler
+        self.ingress_queue = ingress_queue
+        self.broadcasts = broadcasts
+        self.prepare = prepare
+        self.on_state = on_state
+        self.drain_timeout = drain_timeout
+        self.state = STOPPED
+
+        self._loop = None
+        self._thread = None
+        self._bot_task = None
+        self._parked_handlers = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._thread is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="bot-loop", daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def _set_state(self, state, error=None):
+        self.state = state
+        if self.on_state:
+            self.on_state(state, error)
+
+    @property
+    def client(self):
+        return getattr(self.bot, 'client', None)
+
+    def _client_connected(self):
+        client = self.client
+        return client is not None and client.is_connected()
+
+    # -- public API (any thread) ---------------------------------------------
+
+    def start(self):
+        """Start or warm-restart the bot; returns a concurrent future"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._start(), loop)
+
+    def stop(self):
+        """Stop replying, keeping the Telegram session; returns a concurrent future"""
+        if self._loop is None:
+            return None
+        return asyncio.run_coroutine_threadsafe(self._stop(), self._loop)
+
+    def shutdown(self, timeout=10.0):
+        """Stop, disconnect and end the loop thread (application exit)"""
+        if self._loop is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        try:
+            future.result(timeout)
+        except Exception as e:
+            logger.warning(f"Bot shutdown incomplete: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._loop.close()
+        self._loop = self._thread = None
+
+    # -- loop side -----------------------------------------------------------
+
+    async def _start(self):
+        if self.state in (STARTING, RUNNING):
+            return
+        self._set_state(STARTING)
+        try:
+            if self.prepare:
+                await asyncio.get_running_loop().run_in_executor(None, self.prepare)
+            if self.state != STARTING:
+                # Stopped while preparing
+                return
+            if self.send_scheduler:
+                self.send_scheduler.start()
+
+            warm = self._bot_task is not None and not self._bot_task.done()
+            if warm and self._parked_handlers is not None and self._client_connected():
+                # Warm restart: same client, same connection, handlers back on
+                for callback, event in self._parked_handlers:
+                    self.client.add_event_handler(callback, event)
+                # stop() cancelled the workers; bot.start() is not run again to restart them
+                if self.ingress_queue:
+                    self.ingress_queue.resume()
+            else:
+                await self._cancel_bot_task()
+                self._bot_task = asyncio.ensure_future(self.bot.start())
+                self._bot_task.add_done_callback(self._on_bot_task_done)
+            self._parked_handlers = None
+            if self.broadcasts:
+                self.broadcasts.start()
+        except Exception as e:
+            self._set_state(STOPPED, e)
+            return
+
+        self._set_state(RUNNING)
+
+    def _on_bot_task_done(self, task):
+        if task is not self._bot_task:
+            return
+        self._bot_task = None
+        self._parked_handlers = None
+        if self.state == RUNNING:
+            error = None if task.cancelled() else task.exception()
+            self._set_state(STOPPED, error)
+
+    async def _cancel_bot_task(self):
+        task, self._bot_task = self._bot_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _stop(self):
+        if self.state not in (STARTING, RUNNING):
+            return
+        self._set_state(STOPPING)
+
+        # No new messages are handled from here on; the connection stays up
+        client = self.client
+        warm = client is not None and self._client_connected()
+        if warm:
+            self._parked_handlers = client.list_event_handlers()
+            for callback, event in self._parked_handlers:
+                client.remove_event_handler(callback, event)
+
+        # A broadcast run stops between batches and resumes on the next start
+        if self.broadcasts:
+            await self.broadcasts.stop()
+
+        # Messages still waiting for a worker would only be answered late
+        if self.ingress_queue:
+            await self.ingress_queue.stop()
+
+        # Let replies already being sent go out
+        if self.send_scheduler:
+            if not await self.send_scheduler.drain(self.drain_timeout):
+                logger.warning("Send queue not drained before stop")
+            await self.send_scheduler.stop()
+
+        if not warm:
+            await self._cancel_bot_task()
+        self._set_state(STOPPED)
+
+    async def _shutdown(self):
+        await self._stop()
+        self._parked_handlers = None
+        await self._cancel_bot_task()
+        client = self.client
+        if client is not None and self._client_connected():
+            await client.disconnect()
+        # Anything else still scheduled on this loop belongs to the bot
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,345 @@
+# broadcast.py - Scheduled, throttled message fan-out to known chats
+
+import time
+import sqlite3
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from conversation_store import APP_EVENTS_CHAT
+
+BROADCASTS_FILE = "broadcasts.db"
+AUDIENCES = ("all", "private", "groups")
+
+SCHEDULED = "scheduled"
+RUNNING = "running"
+PAUSED = "paused"
+DONE = "done"
+CANCELLED = "cancelled"
+
+logger = logging.getLogger(__name__)
+
+
+def _cron_field(text, low, high):
+    """Set of values a cron field allows: *, a, a-b, */n, a-b/n and comma lists"""
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"bad step in {text!r}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"{text!r} is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week (0 = Sunday)"""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("cron needs 5 fields: minute hour day month weekday")
+        self.expression = expression
+        self.minutes = _cron_field(fields[0], 0, 59)
+        self.hours = _cron_field(fields[1], 0, 23)
+        self.days = _cron_field(fields[2], 1, 31)
+        self.months = _cron_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _cron_field(fields[4], 0, 7)}
+        # Like cron: when both day fields are restricted, either may match
+        self._any_day = fields[2] != "*" and fields[4] != "*"
+
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        return (day_ok or weekday_ok) if self._any_day else (day_ok and weekday_ok)
+
+    def next_after(self, ts):
+        """Timestamp of the first matching minute after `ts` (local time)"""
+        moment = datetime.fromtimestamp(ts).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f"cron {self.expression!r} never fires")
+
+
+def audience_filter(audience):
+    """Chat id test for an audience; Telegram gives users positive ids and groups negative ones"""
+    if audience == "private":
+        return lambda chat_id: isinstance(chat_id, int) and chat_id > 0
+    if audience == "groups":
+        return lambda chat_id: isinstance(chat_id, int) and chat_id < 0
+    # History also holds app events, which no message can be sent to
+    return lambda chat_id: isinstance(chat_id, int) and chat_id != APP_EVENTS_CHAT
+
+
+class BroadcastStore:
+    """Broadcast jobs and the targets of their current run, in SQLite.
+
+    A run's targets are frozen when it starts and `position` only moves
+    after a batch has been sent, so a run interrupted by a restart resumes
+    where it stopped (a crash mid-batch re-sends at most that batch). Safe to use from the GUI
+    and the bot thread at once.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            text TEXT NOT NULL,
+            audience TEXT NOT NULL,
+            cron TEXT,
+            run_at REAL,
+            status TEXT NOT NULL,
+            created REAL NOT NULL,
+            run_total INTEGER NOT NULL DEFAULT 0,
+            position INTEGER NOT NULL DEFAULT 0,
+            run_sent INTEGER NOT NULL DEFAULT 0,
+            run_failed INTEGER NOT NULL DEFAULT 0,
+            sent_total INTEGER NOT NULL DEFAULT 0,
+            failed_total INTEGER NOT NULL DEFAULT 0,
+            runs INTEGER NOT NULL DEFAULT 0,
+            last_run REAL,
+            last_error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, run_at);
+        CREATE TABLE IF NOT EXISTS targets (
+            job_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            PRIMARY KEY (job_id, position)
+        ) WITHOUT ROWID;
+    """
+
+    COLUMNS = ("id", "name", "text", "audience", "cron", "run_at", "status", "created", "run_total",
+               "position", "run_sent", "run_failed", "sent_total", "failed_total", "runs", "last_run",
+               "last_error")
+
+    def __init__(self, path=BROADCASTS_FILE):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        # One connection per thread, as in SqliteResponseStore
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _job(self, row):
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def add(self, name, text, audience="all", run_at=None, cron=None):
+        """Schedule a job: once at `run_at` (default now) or repeatedly on a cron expression"""
+        if audience not in AUDIENCES:
+            raise ValueError(f"unknown audience: {audience}")
+        if not text.strip():
+            raise ValueError("message text is empty")
+        now = time.time()
+        if cron:
+            run_at = CronSchedule(cron).next_after(now)
+        with self._conn() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (name, text, audience, cron, run_at, status, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name or text[:30], text, audience, cron or None, run_at or now, SCHEDULED, now))
+        return cursor.lastrowid
+
+    def get(self, job_id):
+        row = self._conn().execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?",
+                                   (job_id,)).fetchone()
+        return self._job(row)
+
+    def jobs(self):
+        rows = self._conn().execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs ORDER BY id DESC").fetchall()
+        return [self._job(row) for row in rows]
+
+    def next_job(self, now):
+        """A job to work on now (an interrupted run first), else None"""
+        row = self._conn().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE status = ? OR (status = ? AND run_at <= ?) "
+            "ORDER BY status = ? DESC, run_at LIMIT 1", (RUNNING, SCHEDULED, now, RUNNING)).fetchone()
+        return self._job(row)
+
+    def next_run_at(self):
+        row = self._conn().execute("SELECT MIN(run_at) FROM jobs WHERE status = ?", (SCHEDULED,)).fetchone()
+        return row[0]
+
+    def set_status(self, job_id, status):
+        with self._conn() as conn:
+            conn.execute("UPDATE jobs SET status = ? WHERE id = ?", (status, job_id))
+            if status == CANCELLED:
+                conn.execute("DELETE FROM targets WHERE job_id = ?", (job_id,))
+
+    def resume(self, job_id):
+        """Continue a paused job: its run if one was under way, else its next scheduled time"""
+        with self._conn() as conn:
+            conn.execute("UPDATE jobs SET status = CASE WHEN run_total > 0 THEN ? ELSE ? END "
+                         "WHERE id = ? AND status = ?", (RUNNING, SCHEDULED, job_id, PAUSED))
+
+    def delete(self, job_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM targets WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def begin_run(self, job_id, chat_ids):
+        """Freeze the targets of a run"""
+        with self._conn() as conn:
+            conn.execute("DELETE FROM targets WHERE job_id = ?", (job_id,))
+            conn.executemany("INSERT INTO targets (job_id, position, chat_id) VALUES (?, ?, ?)",
+                             ((job_id, i, chat_id) for i, chat_id in enumerate(chat_ids)))
+            conn.execute("UPDATE jobs SET status = ?, run_total = ?, position = 0, run_sent = 0, "
+                         "run_failed = 0, last_run = ?, last_error = NULL WHERE id = ?",
+                         (RUNNING, len(chat_ids), time.time(), job_id))
+
+    def targets(self, job_id, position, limit):
+        rows = self._conn().execute(
+            "SELECT chat_id FROM targets WHERE job_id = ? AND position >= ? ORDER BY position LIMIT ?",
+            (job_id, position, limit)).fetchall()
+        return [row[0] for row in rows]
+
+    def record_batch(self, job_id, count, sent, failed, error=None):
+        """Move the run past a finished batch"""
+        with self._conn() as conn:
+            conn.execute("UPDATE jobs SET position = position + ?, run_sent = run_sent + ?, "
+                         "run_failed = run_failed + ?, sent_total = sent_total + ?, "
+                         "failed_total = failed_total + ?, last_error = COALESCE(?, last_error) WHERE id = ?",
+                         (count, sent, failed, sent, failed, error, job_id))
+
+    def finish_run(self, job_id, next_run_at=None):
+        """End a run; a recurring job is scheduled again, a one-shot job is done"""
+        with self._conn() as conn:
+            conn.execute("DELETE FROM targets WHERE job_id = ?", (job_id,))
+            conn.execute("UPDATE jobs SET status = ?, run_at = COALESCE(?, run_at), runs = runs + 1, "
+                         "run_total = 0, position = 0 WHERE id = ? AND status = ?",
+                         (SCHEDULED if next_run_at else DONE, next_run_at, job_id, RUNNING))
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class BroadcastEngine:
+    """Runs due broadcast jobs on the bot's event loop.
+
+    Messages go through the bot's SendScheduler at bulk priority, behind
+    every private and group reply but under the same account-wide rate
+    limit, so a broadcast slows down instead of tripping flood waits or
+    delaying replies. `send_message(chat_id, text)` is the coroutine that
+    sends one message. Jobs added, paused or cancelled from the GUI are
+    picked up between batches.
+    """
+
+    def __init__(self, store, send_scheduler, send_message, chats, batch_size=20, poll_interval=5.0):
+        self.store = store
+        self.send_scheduler = send_scheduler
+        self.send_message = send_message
+        self.chats = chats
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._task = None
+        self._batch = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await loop.run_in_executor(None, self.store.next_job, time.time())
+            if job is None:
+                next_at = await loop.run_in_executor(None, self.store.next_run_at)
+                delay = self.poll_interval if next_at is None else min(self.poll_interval, next_at - time.time())
+                await asyncio.sleep(max(delay, 0.1))
+                continue
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Broadcast {job['id']} failed: {e}")
+                await loop.run_in_executor(None, self.store.set_status, job['id'], PAUSED)
+
+    async def _run_job(self, job):
+        loop = asyncio.get_running_loop()
+        job_id = job['id']
+        if job['status'] == SCHEDULED:
+            wanted = audience_filter(job['audience'])
+            chat_ids = [chat_id for chat_id in self.chats() if wanted(chat_id)]
+            await loop.run_in_executor(None, self.store.begin_run, job_id, chat_ids)
+            logger.info(f"Broadcast {job_id} '{job['name']}' started for {len(chat_ids)} chats")
+
+        position = (await loop.run_in_executor(None, self.store.get, job_id))['position']
+        while True:
+            current = await loop.run_in_executor(None, self.store.get, job_id)
+            if current is None or current['status'] != RUNNING:
+                return
+            batch = await loop.run_in_executor(None, self.store.targets, job_id, position, self.batch_size)
+            if not batch:
+                break
+            # A batch always finishes and is recorded, even when the engine is stopped meanwhile
+            self._batch = loop.create_task(self._send_batch(job, batch))
+            await asyncio.shield(self._batch)
+            position += len(batch)
+
+        next_run_at = CronSchedule(job['cron']).next_after(time.time()) if job['cron'] else None
+        await loop.run_in_executor(None, self.store.finish_run, job_id, next_run_at)
+        logger.info(f"Broadcast {job_id} '{job['name']}' finished")
+
+    async def _send_batch(self, job, batch):
+        results = await asyncio.gather(*(self._send(chat_id, job['text']) for chat_id in batch),
+                                       return_exceptions=True)
+        errors = [r for r in results if isinstance(r, Exception)]
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.store.record_batch, job['id'], len(batch), len(batch) - len(errors), len(errors),
+            str(errors[-1]) if errors else None)
+
+    def _send(self, chat_id, text):
+        return self.send_scheduler.submit(chat_id, lambda: self.send_message(chat_id, text),
+                                          is_private=chat_id > 0, bulk=True)
+
+    def start(self):
+        """Start the engine on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def stop(self, timeout=10.0):
+        """Stop after the batch being sent; a run under way resumes on the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._batch is not None and not self._batch.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self._batch), timeout)
+            except asyncio.TimeoutError:
+                # Still waiting on a flood wait; those sends may be repeated on resume
+                logger.warning("Broadcast batch not finished before stop")
+        self._batch = None
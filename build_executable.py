@@ -3,12 +3,178 @@
 import os
 import sys
 import subprocess
+import re
 import shutil
+import time
+import zipfile
+import argparse
+import importlib.metadata
 
-def build_executable():
+# Build profiles. "fast_start" produces an onedir bundle so nothing has to be
+# unpacked to a temp directory on launch; "portable" keeps the single .exe.
+BUILD_PROFILES = {
+    "fast_start": {
+        "mode": "--onedir",
+        "exclude_modules": [
+            "tkinter.test", "unittest", "pydoc", "doctest",
+            "matplotlib", "IPython", "pandas", "plotly",
+            "nltk.app", "nltk.draw", "nltk.test", "nltk.twitter",
+            "nltk.parse", "nltk.sem", "nltk.inference", "nltk.ccg",
+            "sklearn.datasets", "sklearn.ensemble", "sklearn.neural_network",
+            "sklearn.svm", "sklearn.tree", "sklearn.gaussian_process",
+            "scipy.io", "scipy.signal", "scipy.ndimage",
+        ],
+        "hidden_imports": [
+            "PIL._tkinter_finder",
+            "pystray",
+            "tkinterdnd2",
+            "telethon",
+        ],
+        "bundle_nltk_data": True,
+        "startup_budget_seconds": {"first": 6.0, "warm": 2.5},
+        "size_budget_mb": 220,
+    },
+    "portable": {
+        "mode": "--onefile",
+        "exclude_modules": [],
+        "hidden_imports": [
+            "PIL._tkinter_finder",
+            "pystray",
+            "tkinterdnd2",
+            "telethon",
+            "nltk",
+            "sklearn",
+        ],
+        "bundle_nltk_data": False,
+        "startup_budget_seconds": {"first": 20.0, "warm": 12.0},
+        "size_budget_mb": 400,
+    },
+}
+
+# Only the NLTK resources the bot actually uses are packed
+NLTK_RESOURCES = [
+    "corpora/stopwords",
+    "corpora/wordnet",
+]
+
+def punkt_resource():
+    """Sentence tokenizer data the installed nltk loads"""
+    # Read from the package metadata so the tokenizer stack is never imported
+    try:
+        version = importlib.metadata.version("nltk")
+    except importlib.metadata.PackageNotFoundError:
+        return "tokenizers/punkt"
+    parts = tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+    # nltk 3.8.2+ reads the pickle-free punkt_tab tables; older releases,
+    # including the 3.8.1 in requirements_desktop.txt, unpickle punkt
+    return "tokenizers/punkt_tab" if parts >= (3, 8, 2) else "tokenizers/punkt"
+
+STARTUP_PROBE_ENV = "TELEGRAM_BOT_STARTUP_PROBE"
+
+def bundle_nltk_data(target_zip="build_files/nltk_data.zip"):
+    """Pack the required NLTK resources into one compressed archive"""
+    try:
+        import nltk
+    except ImportError:
+        print("⚠️ nltk not installed, skipping NLP data bundle")
+        return None
+    
+    packed = 0
+    with zipfile.ZipFile(target_zip, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        for resource in [punkt_resource()] + NLTK_RESOURCES:
+            try:
+                path = nltk.data.find(resource)
+            except LookupError:
+                print(f"⚠️ NLTK resource not found: {resource}")
+                continue
+            
+            if isinstance(path, nltk.data.ZipFilePathPointer):
+                # nltk ships some corpora zipped (corpora/wordnet.zip); copy the resource's members across
+                entry = path.entry
+                with zipfile.ZipFile(path.zipfile.filename) as src:
+                    for name in src.namelist():
+                        if name.startswith(entry) and not name.endswith("/"):
+                            zf.writestr(os.path.join(os.path.dirname(resource), name), src.read(name))
+                packed += 1
+                continue
+            
+            path = str(path)
+            if os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    for file in files:
+                        full = os.path.join(root, file)
+                        arcname = os.path.join(resource, os.path.relpath(full, path))
+                        zf.write(full, arcname)
+            else:
+                zf.write(path, resource)
+            packed += 1
+    
+    size_kb = os.path.getsize(target_zip) / 1024
+    print(f"📦 Bundled {packed} NLTK resources ({size_kb:.1f} KB)")
+    return target_zip
+
+def get_artifact_size(path):
+    """Return artifact size in bytes (file or whole onedir folder)"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            total += os.path.getsize(os.path.join(root, file))
+    return total
+
+def measure_startup(exe_path, runs=3, timeout=120):
+    """Launch the built app in probe mode and time it until it is ready.
+    
+    Reports the first launch and the best of the following ones. Neither is a
+    true cold start: the build has just written the files, so the OS file
+    cache already holds them; "first" still includes one-time work such as
+    unpacking a onefile build or compiling the Hinglish lexicon.
+    """
+    env = dict(os.environ)
+    env[STARTUP_PROBE_ENV] = "1"
+    
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([exe_path], env=env, check=True, timeout=timeout,
+                       cwd=os.path.dirname(exe_path) or ".")
+        timings.append(time.perf_counter() - started)
+    
+    return {"first": timings[0], "warm": min(timings[1:]) if len(timings) > 1 else timings[0]}
+
+def check_budget(profile, exe_path, artifact_path):
+    """Record startup time and size and fail if either is over budget"""
+    print("\n⏱️ Measuring startup time...")
+    startup = measure_startup(exe_path)
+    size_mb = get_artifact_size(artifact_path) / (1024 * 1024)
+    
+    budget = profile["startup_budget_seconds"]
+    print(f"   First start: {startup['first']:.2f}s (budget {budget['first']:.1f}s)")
+    print(f"   Warm start: {startup['warm']:.2f}s (budget {budget['warm']:.1f}s)")
+    print(f"   Size: {size_mb:.1f} MB (budget {profile['size_budget_mb']} MB)")
+    
+    with open("build_metrics.txt", 'a', encoding='utf-8') as f:
+        f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} first={startup['first']:.3f} "
+                f"warm={startup['warm']:.3f} size_mb={size_mb:.1f}\n")
+    
+    ok = True
+    if startup["first"] > budget["first"] or startup["warm"] > budget["warm"]:
+        print("❌ Startup time over budget")
+        ok = False
+    if size_mb > profile["size_budget_mb"]:
+        print("❌ Artifact size over budget")
+        ok = False
+    return ok
+
+def build_executable(profile_name="fast_start", benchmark=True):
     """Build Windows executable using PyInstaller"""
     
+    profile = BUILD_PROFILES[profile_name]
+    
     print("Building Telegram Bot Desktop Application...")
+    print(f"Profile: {profile_name} ({profile['mode']})")
     print("=" * 50)
     
     # Check if required files exist
@@ -35,6 +201,29 @@ def build_executable():
         "desktop_app.py",
         "bot.py",
         "config.py", 
+        "matcher_index.py",
+        "response_store.py",
+        "response_model.py",
+        "send_scheduler.py",
+        "conversation_store.py",
+        "analytics.py",
+        "unmatched_clusters.py",
+        "bot_lifecycle.py",
+        "service.py",
+        "control_api.py",
+        "response_transfer.py",
+        "log_export.py",
+        "text_normalizer.py",
+        "hinglish_lexicon.py",
+        "typo_index.py",
+        "ingress_queue.py",
+        "session_store.py",
+        "shard_manager.py",
+        "response_sync.py",
+        "broadcast.py",
+        "media_stream.py",
+        "keyword_stats.py",
+        "tray.py",
         "responses.json"
     ]
     
@@ -51,6 +240,9 @@ API_ID=your_api_id_here
 API_HASH=your_api_hash_here
 PHONE=your_phone_number_here
 
+# Response storage: json (responses.json) or sqlite (responses.db)
+RESPONSES_BACKEND=json
+
 # Flask Settings  
 SECRET_KEY=your_secret_key_here
 DEBUG=False
@@ -60,18 +252,27 @@ DEBUG=False
     # PyInstaller command
     pyinstaller_cmd = [
         "pyinstaller",
-        "--onefile",  # Single executable file
+        profile["mode"],
         "--windowed",  # Hide console window
+        "--noconfirm",
         "--name=TelegramBotManager",
         "--icon=icon.ico",  # You can add custom icon
         "--add-data=responses.json;.",
         "--add-data=.env;.",
         "--add-data=media;media",
-        "--hidden-import=PIL._tkinter_finder",
-        "--hidden-import=pystray",
-        "--hidden-import=telethon",
-        "--hidden-import=nltk",
-        "--hidden-import=sklearn",
+    ]
+    
+    if profile["bundle_nltk_data"]:
+        nltk_zip = bundle_nltk_data()
+        if nltk_zip:
+            pyinstaller_cmd.append(f"--add-data={nltk_zip};.")
+    
+    for module in profile["hidden_imports"]:
+        pyinstaller_cmd.append(f"--hidden-import={module}")
+    for module in profile["exclude_modules"]:
+        pyinstaller_cmd.append(f"--exclude-module={module}")
+    
+    pyinstaller_cmd += [
         "--distpath=dist",
         "--workpath=build_temp",
         "desktop_app.py"
@@ -86,8 +287,11 @@ DEBUG=False
         install_dir = "TelegramBotManager_Portable"
         os.makedirs(install_dir, exist_ok=True)
         
-        # Copy executable
-        shutil.copy2("dist/TelegramBotManager.exe", install_dir + "/")
+        # Copy executable (onedir builds ship the whole folder)
+        if profile["mode"] == "--onedir":
+            shutil.copytree("dist/TelegramBotManager", install_dir, dirs_exist_ok=True)
+        else:
+            shutil.copy2("dist/TelegramBotManager.exe", install_dir + "/")
         
         # Copy required directories
         os.makedirs(install_dir + "/media", exist_ok=True)
@@ -114,6 +318,12 @@ DEBUG=False
             for file in files:
                 print(f"{subindent}{file}")
         
+        if benchmark:
+            exe_path = os.path.join(install_dir, "TelegramBotManager.exe")
+            artifact = install_dir if profile["mode"] == "--onedir" else exe_path
+            if not check_budget(profile, exe_path, artifact):
+                return False
+        
         return True
         
     except subprocess.CalledProcessError as e:
@@ -252,6 +462,11 @@ def install_requirements():
         return False
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the Telegram Bot Manager executable")
+    parser.add_argument("--profile", choices=sorted(BUILD_PROFILES), default="fast_start")
+    parser.add_argument("--no-benchmark", action="store_true", help="Skip the startup/size budget check")
+    args = parser.parse_args()
+    
     print("Telegram Bot Manager - Executable Builder")
     print("=" * 50)
     
@@ -261,7 +476,7 @@ if __name__ == "__main__":
         sys.exit(1)
     
     # Build executable
-    if build_executable():
+    if build_executable(args.profile, benchmark=not args.no_benchmark):
         print("\n🎉 Build completed successfully!")
         print("\nNext steps:")
         print("1. Configure the .env file in TelegramBotManager_Portable/")
@@ -0,0 +1,194 @@
+# control_api.py - Localhost HTTP API for bulk response management and stats
+
+import os
+import json
+import logging
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from response_store import validate_response
+from response_transfer import response_to_record
+
+CONTROL_API_HOST = "127.0.0.1"
+CONTROL_API_PORT = int(os.getenv("CONTROL_API_PORT", "8766"))
+CONTROL_TOKEN_FILE = "control_api.token"
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def _metric_lines(stats):
+    """Prometheus text exposition of BotRuntime.stats()"""
+    yield "# TYPE telegram_bot_up gauge"
+    yield f"telegram_bot_up {1 if stats['state'] == 'running' else 0}"
+    yield "# TYPE telegram_bot_uptime_seconds gauge"
+    yield f"telegram_bot_uptime_seconds {stats['uptime']:.3f}"
+    yield "# TYPE telegram_bot_responses gauge"
+    yield f"telegram_bot_responses {stats['responses']}"
+    yield "# TYPE telegram_bot_messages_today gauge"
+    yield f"telegram_bot_messages_today {stats['messages_today']}"
+    yield "# TYPE telegram_bot_messages_total counter"
+    yield f"telegram_bot_messages_total {stats['messages_total']}"
+    yield "# TYPE telegram_bot_send_queue gauge"
+    yield f"telegram_bot_send_queue {stats['send_queue']}"
+    yield "# TYPE telegram_bot_sends_total counter"
+    for name, value in sorted(stats['sends'].items()):
+        if isinstance(value, (int, float)):
+            yield f'telegram_bot_sends_total{{result="{name}"}} {value}'
+    yield "# TYPE telegram_bot_ingress_queue gauge"
+    yield f"telegram_bot_ingress_queue {stats['ingress_queue']}"
+    yield "# TYPE telegram_bot_ingress_total counter"
+    for name, value in sorted(stats['ingress'].items()):
+        yield f'telegram_bot_ingress_total{{result="{name}"}} {value}'
+    yield "# TYPE telegram_bot_flow_sessions gauge"
+    yield f'telegram_bot_flow_sessions{{where="memory"}} {stats["sessions"]["active"]}'
+    yield f'telegram_bot_flow_sessions{{where="disk"}} {stats["sessions"]["on_disk"]}'
+    yield "# TYPE telegram_bot_media_uploads_total counter"
+    yield f'telegram_bot_media_uploads_total{{result="uploaded"}} {stats["media"]["uploads"]}'
+    yield f'telegram_bot_media_uploads_total{{result="reused"}} {stats["media"]["reused"]}'
+    yield "# TYPE telegram_bot_media_cache_bytes gauge"
+    yield f"telegram_bot_media_cache_bytes {stats['media']['cached_bytes']}"
+    yield "# TYPE telegram_bot_private_wait_seconds gauge"
+    yield f"telegram_bot_private_wait_seconds {stats['private_wait']:.6f}"
+
+
+class ControlRequestHandler(BaseHTTPRequestHandler):
+    """Routes requests to the server's BotRuntime; every request needs the bearer token"""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def runtime(self):
+        return self.server.runtime
+
+    def log_message(self, format, *args):
+        logger.debug(f"control api: {format % args}")
+
+    def _authorized(self):
+        header = self.headers.get("Authorization", "")
+        token = header[len("Bearer "):] if header.startswith("Bearer ") else ""
+        if secrets.compare_digest(token, self.server.token):
+            return True
+        self._send_json(401, {"error": "unauthorized"})
+        return False
+
+    def _send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send_body(status, json.dumps(payload).encode('utf-8'), "application/json")
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/health":
+            self._send_json(200, {"ok": True, "state": self.runtime.lifecycle.state})
+        elif self.path == "/stats":
+            self._send_json(200, self.runtime.stats())
+        elif self.path == "/metrics":
+            text = "\n".join(_metric_lines(self.runtime.stats())) + "\n"
+            self._send_body(200, text.encode('utf-8'), "text/plain; version=0.0.4")
+        elif self.path == "/responses/export":
+            self._export_responses()
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path == "/responses/bulk":
+            self._bulk_responses()
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _export_responses(self):
+        """Stream every response as one JSON line, chunked, without building the whole set"""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        chunk = []
+        size = 0
+        for keyword, data in self.runtime.store.items():
+            line = json.dumps(response_to_record(keyword, data), ensure_ascii=False).encode('utf-8') + b"\n"
+            chunk.append(line)
+            size += len(line)
+            if size >= 64 * 1024:
+                self._write_chunk(b"".join(chunk))
+                chunk, size = [], 0
+        if chunk:
+            self._write_chunk(b"".join(chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+
+    def _bulk_responses(self):
+        """{"upsert": {keyword: response}, "delete": [keyword]} applied in one write and one reindex"""
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json(413, {"error": "request too large"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            upserts = body.get("upsert") or {}
+            deletes = body.get("delete") or []
+            if not isinstance(upserts, dict) or not isinstance(deletes, list):
+                raise ValueError("upsert must be an object and delete a list")
+            for keyword, data in upserts.items():
+                if not keyword.strip():
+                    raise ValueError("empty keyword")
+                try:
+                    validate_response(data)
+                except ValueError as e:
+                    raise ValueError(f"{keyword}: {e}")
+            if not all(isinstance(k, str) for k in deletes):
+                raise ValueError("delete must list keywords")
+        except (ValueError, AttributeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            self.runtime.store.bulk_apply(list(upserts.items()), deletes)
+            self.runtime.reload_matcher()
+        except Exception as e:
+            logger.error(f"Bulk response update failed: {e}")
+            self._send_json(500, {"error": str(e)})
+            return
+        logger.info(f"Bulk update: {len(upserts)} upserted, {len(deletes)} deleted")
+        self._send_json(200, {"upserted": len(upserts), "deleted": len(deletes),
+                              "responses": self.runtime.store.count()})
+
+
+class ControlServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, runtime, host=CONTROL_API_HOST, port=CONTROL_API_PORT, token_file=CONTROL_TOKEN_FILE):
+        super().__init__((host, port), ControlRequestHandler)
+        self.runtime = runtime
+        self.token = secrets.token_hex(16)
+        self.token_file = token_file
+
+        # Only processes that can read this file may call the API
+        with open(token_file, 'w') as f:
+            f.write(f"{self.server_address[1]}\n{self.token}\n")
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.token_file):
+            os.remove(self.token_file)
+
+
+def start_control_api(runtime, port=CONTROL_API_PORT):
+    """Serve the control API from a daemon thread; returns the server (shutdown() to stop)"""
+    server = ControlServer(runtime, port=port)
+    threading.Thread(target=server.serve_forever, name="control-api", daemon=True).start()
+    logger.info(f"Control API listening on {CONTROL_API_HOST}:{server.server_address[1]}")
+    return server
@@ -0,0 +1,359 @@
+# conversation_store.py - Segmented, append-only conversation history with indexes
+
+import os
+import json
+import time
+import queue
+import struct
+import bisect
+import logging
+import threading
+from array import array
+from collections import deque
+
+SEGMENT_PREFIX = "seg-"
+LOG_SUFFIX = ".log"
+INDEX_SUFFIX = ".idx"
+WRITER_LOCK = "writer.lock"
+# Not a Telegram peer: app events (bot started, response added) are kept under it
+APP_EVENTS_CHAT = 0
+# Records appended while read-only, written out by promote()
+READONLY_BUFFER = 1000
+
+logger = logging.getLogger(__name__)
+
+# Fixed-size index entry per record: timestamp, chat id, user id, offset, length
+_ENTRY = struct.Struct("<dqqQI")
+
+
+def segments_dir_for(conversation_file):
+    """Directory holding the segments for CONVERSATION_FILE"""
+    return os.path.splitext(conversation_file)[0] + "_segments"
+
+
+class ConversationStore:
+    """Conversation history split into append-only segment files.
+
+    Every record is one JSON line in a segment log; a parallel binary index
+    holds its timestamp, chat, user and location. The index is loaded into
+    compact arrays so per-chat, per-user and time-range reads only touch the
+    records they return. Only one process writes a directory; a read-only
+    store (a worker process, or a second app instance) neither repairs
+    segments nor starts a writer, and picks up new records via refresh()
+    until promote() makes it the writer. Records appended meanwhile are held
+    (up to READONLY_BUFFER) and written by promote().
+    """
+
+    def __init__(self, directory, segment_max_bytes=16 * 1024 * 1024, batch_size=500, flush_interval=0.5,
+                 readonly=False):
+        self.directory = directory
+        self.readonly = readonly
+        self.segment_max_bytes = segment_max_bytes
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._timestamps = array('d')
+        self._segments = array('I')
+        self._offsets = array('Q')
+        self._lengths = array('I')
+        self._by_chat = {}
+        self._by_user = {}
+        self._segment_names = []
+        self._idx_loaded = {}
+        self._valid_end = {}
+        self._lock_file = None
+        self._held = deque(maxlen=READONLY_BUFFER)
+        self._warned_readonly = False
+
+        if not readonly and not self._acquire_writer_lock():
+            logger.warning(f"{directory} is being written by another process, opening read-only")
+            self.readonly = True
+
+        self._load()
+        if not self.readonly:
+            self._start_writer()
+
+    def _start_writer(self):
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-writer", daemon=True)
+        self._writer.start()
+
+    def promote(self):
+        """Become the writer of a store opened read-only; False if another process still writes it"""
+        with self._lock:
+            if not self.readonly:
+                return True
+            if not self._acquire_writer_lock():
+                return False
+            self.readonly = False
+            # Catch up with (and repair) what the previous writer left
+            self._load_new_segments()
+            self._open_active(self._segment_names[-1])
+            self._warned_readonly = False
+            self._start_writer()
+            while self._held:
+                self._queue.put(self._held.popleft())
+        logger.info(f"Writing conversation history to {self.directory}")
+        return True
+
+    # -- loading -------------------------------------------------------------
+
+    def _segment_path(self, segment_id, suffix):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment_id:06d}{suffix}")
+
+    def _acquire_writer_lock(self):
+        """Only one process may write a segment directory; False if another one does"""
+        self._lock_file = open(os.path.join(self.directory, WRITER_LOCK), 'a+b')
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._lock_file.seek(0)
+                msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def _segment_ids(self):
+        return sorted(int(name[len(SEGMENT_PREFIX):-len(LOG_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.startswith(SEGMENT_PREFIX) and name.endswith(LOG_SUFFIX))
+
+    def _load(self):
+        ids = self._segment_ids()
+        self._segment_names = ids or [1]
+        for segment_id in ids:
+            self._load_segment(segment_id)
+        if not self.readonly:
+            self._open_active(self._segment_names[-1])
+
+    def refresh(self):
+        """Pick up records written by another process (read-only stores)"""
+        if not self.readonly:
+            return
+        with self._lock:
+            self._load_new_segments()
+
+    def _load_new_segments(self):
+        last = self._segment_names[-1] if self._segment_names else 0
+        for segment_id in self._segment_ids():
+            if segment_id >= last:
+                self._load_segment(segment_id)
+                if segment_id not in self._segment_names:
+                    self._segment_names.append(segment_id)
+
+    def _load_segment(self, segment_id):
+        log_path = self._segment_path(segment_id, LOG_SUFFIX)
+        idx_path = self._segment_path(segment_id, INDEX_SUFFIX)
+        log_size = os.path.getsize(log_path)
+        consumed = self._idx_loaded.get(segment_id, 0)
+        loaded = consumed
+
+        # Records already indexed by an earlier load stay valid
+        valid_end = self._valid_end.get(segment_id, 0)
+        idx_size = 0
+        if os.path.exists(idx_path):
+            with open(idx_path, 'rb') as f:
+                f.seek(consumed)
+                data = f.read()
+            idx_size = consumed + len(data)
+            usable = len(data) - len(data) % _ENTRY.size
+            for ts, chat_id, user_id, offset, length in _ENTRY.iter_unpack(data[:usable]):
+                if offset + length > log_size:
+                    break
+                self._add_to_index(ts, chat_id, user_id, segment_id, offset, length)
+                consumed += _ENTRY.size
+                valid_end = offset + length
+        self._idx_loaded[segment_id] = consumed
+        self._valid_end[segment_id] = valid_end
+
+        if self.readonly:
+            return
+        # Drop index entries whose records never reached the log
+        if consumed != idx_size:
+            with open(idx_path, 'r+b') as f:
+                f.truncate(consumed)
+        # Drop log bytes that were written but never indexed (interrupted batch);
+        # only past entries read just now, never on a reload that found none
+        if consumed > loaded and log_size > valid_end:
+            with open(log_path, 'r+b') as f:
+                f.truncate(valid_end)
+
+    def _open_active(self, segment_id):
+        self._active_id = segment_id
+        self._log = open(self._segment_path(segment_id, LOG_SUFFIX), 'ab')
+        self._idx = open(self._segment_path(segment_id, INDEX_SUFFIX), 'ab')
+        if segment_id not in self._segment_names:
+            self._segment_names.append(segment_id)
+
+    def _add_to_index(self, ts, chat_id, user_id, segment_id, offset, length):
+        record_no = len(self._offsets)
+        # Keep the time index sorted even if a clock steps backwards
+        if self._timestamps and ts < self._timestamps[-1]:
+            ts = self._timestamps[-1]
+        self._timestamps.append(ts)
+        self._segments.append(segment_id)
+        self._offsets.append(offset)
+        self._lengths.append(length)
+        self._by_chat.setdefault(chat_id, array('Q')).append(record_no)
+        if user_id:
+            self._by_user.setdefault(user_id, array('Q')).append(record_no)
+
+    # -- writing -------------------------------------------------------------
+
+    def append(self, chat_id, direction, text, user_id=0, keyword=None, ts=None, **extra):
+        """Queue a record; written by the background writer in batches"""
+        record = {"ts": ts or time.time(), "chat_id": chat_id, "user_id": user_id or 0,
+                  "direction": direction, "text": text}
+        if keyword is not None:
+            record["keyword"] = keyword
+        record.update(extra)
+        if self.readonly:
+            with self._lock:
+                if self.readonly:
+                    # Held for promote(); the oldest are dropped once the buffer is full
+                    if len(self._held) == self._held.maxlen and not self._warned_readonly:
+                        self._warned_readonly = True
+                        logger.warning(f"{self.directory} is read-only in this process; "
+                                       f"keeping only the last {READONLY_BUFFER} records until it becomes the writer")
+                    self._held.append(record)
+                    return
+        self._queue.put(record)
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written"""
+        if self.readonly:
+            return
+        if not self._writer.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # A flush or close request ends the batch at once instead of waiting out the interval
+            while len(batch) < self.batch_size and isinstance(batch[-1], dict):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            records = [r for r in batch if isinstance(r, dict)]
+            if records:
+                try:
+                    self._write_batch(records)
+                except Exception as e:
+                    # Keep the writer alive: flush() and close() wait on it
+                    logger.error(f"Failed to write {len(records)} history records: {e}")
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if any(item is None for item in batch):
+                return
+
+    def _write_batch(self, records):
+        lines = [json.dumps(r, ensure_ascii=False).encode('utf-8') + b"\n" for r in records]
+        with self._lock:
+            if self._log.tell() >= self.segment_max_bytes:
+                self._log.close()
+                self._idx.close()
+                self._open_active(self._active_id + 1)
+
+            offset = self._log.tell()
+            entries = []
+            for record, line in zip(records, lines):
+                entries.append((record["ts"], record["chat_id"], record["user_id"], offset, len(line)))
+                offset += len(line)
+
+            # Log first, then index: a crash in between is repaired on load
+            self._log.write(b"".join(lines))
+            self._log.flush()
+            self._idx.write(b"".join(_ENTRY.pack(*e) for e in entries))
+            self._idx.flush()
+            for ts, chat_id, user_id, offset, length in entries:
+                self._add_to_index(ts, chat_id, user_id, self._active_id, offset, length)
+
+    # -- reading -------------------------------------------------------------
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def _read(self, record_numbers):
+        """Read records by number, opening each segment once"""
+        records = []
+        handles = {}
+        try:
+            for record_no in record_numbers:
+                segment_id = self._segments[record_no]
+                f = handles.get(segment_id)
+                if f is None:
+                    f = handles[segment_id] = open(self._segment_path(segment_id, LOG_SUFFIX), 'rb')
+                f.seek(self._offsets[record_no])
+                records.append(json.loads(f.read(self._lengths[record_no])))
+        finally:
+            for f in handles.values():
+                f.close()
+        return records
+
+    def last_for_chat(self, chat_id, limit=100):
+        """Most recent `limit` records of a chat, oldest first"""
+        self.refresh()
+        with self._lock:
+            numbers = self._by_chat.get(chat_id, array('Q'))[-limit:]
+        return self._read(numbers)
+
+    def last_for_user(self, user_id, limit=100):
+        """Most recent `limit` records from a user, oldest first"""
+        self.refresh()
+        with self._lock:
+            numbers = self._by_user.get(user_id, array('Q'))[-limit:]
+        return self._read(numbers)
+
+    def record_range(self, start_ts=None, end_ts=None):
+        """Record numbers with start_ts <= ts < end_ts"""
+        self.refresh()
+        with self._lock:
+            lo = bisect.bisect_left(self._timestamps, start_ts) if start_ts is not None else 0
+            hi = bisect.bisect_left(self._timestamps, end_ts) if end_ts is not None else len(self._timestamps)
+        return range(lo, hi)
+
+    def between(self, start_ts=None, end_ts=None, chunk_size=1000):
+        """Yield records with start_ts <= ts < end_ts, reading in chunks"""
+        numbers = self.record_range(start_ts, end_ts)
+        for start in range(0, len(numbers), chunk_size):
+            yield from self._read(numbers[start:start + chunk_size])
+
+    def since(self, record_no, chunk_size=1000):
+        """Yield (record_no, record) for every record from `record_no` on"""
+        self.refresh()
+        end = len(self)
+        for start in range(record_no, end, chunk_size):
+            numbers = range(start, min(start + chunk_size, end))
+            yield from zip(numbers, self._read(numbers))
+
+    def chats(self):
+        self.refresh()
+        with self._lock:
+            return list(self._by_chat)
+
+    def close(self):
+        """Flush pending records and stop the writer"""
+        if self.readonly:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._log.close()
+            self._idx.close()
+        self._lock_file.close()
@@ -3,8 +3,9 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 import threading
-import json
 import os
+import math
+import shutil
 import time
 from datetime import datetime
 import webbrowser
@@ -12,29 +13,133 @@ import sys
 from PIL import Image, ImageTk
 import pystray
 from pystray import MenuItem as item
-import asyncio
 import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Fast-start builds ship the NLTK resources as one compressed archive
+NLTK_BUNDLE = os.path.join(getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__))), 'nltk_data.zip')
+if os.path.exists(NLTK_BUNDLE):
+    import nltk
+    nltk.data.path.insert(0, NLTK_BUNDLE)
 
 # Import bot components
-from bot import TelegramBot
+from service import BotRuntime, ServiceClient, main as run_service
+from shard_manager import ShardManager
+from tray import TrayThread, NotificationCoalescer
+from broadcast import CronSchedule, AUDIENCES, SCHEDULED, RUNNING as BROADCAST_RUNNING, PAUSED, CANCELLED
+from response_sync import ResponseSync, SyncState, open_transport
+from control_api import start_control_api
+from response_transfer import import_responses, export_responses, TransferCancelled
+from log_export import export_log, LOG_DIRECTIONS
+from conversation_store import APP_EVENTS_CHAT
+from bot_lifecycle import STARTING, RUNNING, STOPPING, STOPPED
+from analytics import ColumnarHistory
+from unmatched_clusters import cluster_unmatched
 from config import (
     SECRET_KEY, DEBUG, RESPONSES_FILE,
     IMAGES_DIR, AUDIO_DIR, CONVERSATION_FILE,
     API_ID, API_HASH, PHONE
 )
 
+# Drag-and-drop of files needs the optional tkinterdnd2 package
+try:
+    from tkinterdnd2 import TkinterDnD, DND_FILES
+except ImportError:
+    TkinterDnD = None
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".bmp")
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg", ".m4a")
+
+
+def media_type_for(path):
+    """'image' or 'audio' by file extension, None for anything else"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    if ext in AUDIO_EXTENSIONS:
+        return "audio"
+    return None
+
+
+def list_media_files(directory):
+    """(filename, size) of the files in a media folder, skipping unfinished copies"""
+    if not os.path.exists(directory):
+        return []
+    with os.scandir(directory) as entries:
+        return sorted((entry.name, entry.stat().st_size) for entry in entries
+                      if entry.is_file() and not entry.name.endswith(".part"))
+
+
+def copy_media_file(source, target_dir, task, chunk_size=1024 * 1024):
+    """Copy `source` into `target_dir` in chunks with progress; a cancelled copy leaves nothing behind"""
+    os.makedirs(target_dir, exist_ok=True)
+    target = os.path.join(target_dir, os.path.basename(source))
+    partial = target + ".part"
+    total = os.path.getsize(source)
+    copied = 0
+    try:
+        with open(source, 'rb') as src, open(partial, 'wb') as dst:
+            while True:
+                if task.cancelled:
+                    raise TransferCancelled()
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                copied += len(chunk)
+                task.progress(copied, total)
+        shutil.copystat(source, partial)
+        os.replace(partial, target)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return target
+
 class TelegramBotDesktopApp:
     def __init__(self):
-        self.root = tk.Tk()
+        self.root = None
+        if TkinterDnD is not None:
+            try:
+                self.root = TkinterDnD.Tk()
+            except RuntimeError as e:
+                # tkdnd library missing from this Tk installation
+                print(f"Drag and drop unavailable: {e}")
+        if self.root is None:
+            self.root = tk.Tk()
         self.root.title("Telegram Bot Manager v2.0")
         self.root.geometry("1000x700")
         self.root.minsize(800, 600)
         
-        # Bot instance
-        self.bot = TelegramBot()
-        self.bot_thread = None
+        # Bot, response store and conversation history (shared with service.py)
+        self.runtime = BotRuntime()
+        self.runtime.state_listeners.append(self.on_bot_state)
+        self.bot = self.runtime.bot
+        self.store = self.runtime.store
+        self.conversations = self.runtime.conversations
+        self.lifecycle = self.runtime.lifecycle
         self.bot_running = False
-        self.message_queue = []
+        
+        # Connection to a headless bot service, when attached
+        self.service_client = None
+        
+        # Worker processes for additional accounts
+        self.shard_manager = ShardManager(self.store, self.on_shard_event, normalizer=self.runtime.normalizer)
+        
+        # File copies, deletes, scans and store writes run off the Tk thread
+        self.tasks = BackgroundTasks(self.root, self.show_task_progress)
+        
+        self.responses_page = 0
+        self.responses_page_size = 500
+        self.analytics = ColumnarHistory()
+        self.analytics_task = None
+        self.analytics_after = None
+        self.cluster_executor = None
+        self.cluster_future = None
+        self.message_queue = deque()
+        self.notifier = NotificationCoalescer()
         
         # Setup logging for message monitoring
         self.setup_logging()
@@ -46,9 +151,19 @@ class TelegramBotDesktopApp:
         # Start message monitor
         self.start_message_monitor()
         
+        # Local API for scripted bulk edits and monitoring
+        try:
+            self.control_api = start_control_api(self.runtime)
+        except OSError as e:
+            self.control_api = None
+            logging.warning(f"Control API not started: {e}")
+        
         # Load initial data
         self.refresh_responses()
         self.refresh_media_files()
+        self.refresh_analytics()
+        self.refresh_load_stats()
+        self.refresh_broadcasts()
         
         # Handle window close
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -82,7 +197,19 @@ class TelegramBotDesktopApp:
         # Tab 4: Live Messages
         self.setup_messages_tab(notebook)
         
-        # Tab 5: Settings
+        # Tab 5: Analytics
+        self.setup_analytics_tab(notebook)
+        
+        # Tab 6: Suggestions from unmatched messages
+        self.setup_suggestions_tab(notebook)
+        
+        # Tab 7: Shards (one worker process per account)
+        self.setup_shards_tab(notebook)
+        
+        # Tab 8: Broadcasts (scheduled messages to known chats)
+        self.setup_broadcasts_tab(notebook)
+        
+        # Tab 9: Settings
         self.setup_settings_tab(notebook)
         
         # Status bar
@@ -124,6 +251,19 @@ class TelegramBotDesktopApp:
         self.stats_media = ttk.Label(stats_frame, text="Media Files: 0")
         self.stats_media.pack(anchor=tk.W)
         
+        self.stats_load = ttk.Label(stats_frame, text="Incoming Queue: 0   Shed: 0")
+        self.stats_load.pack(anchor=tk.W)
+        
+        # Headless service
+        service_frame = ttk.LabelFrame(frame, text="Background Service", padding=10)
+        service_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        self.service_label = ttk.Label(service_frame, text="Running the bot inside this window")
+        self.service_label.pack(side=tk.LEFT)
+        
+        self.attach_btn = ttk.Button(service_frame, text="🔌 Attach", command=self.toggle_service_attach)
+        self.attach_btn.pack(side=tk.RIGHT, padx=5)
+        
         # Configuration check
         config_frame = ttk.LabelFrame(frame, text="Configuration", padding=10)
         config_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -146,22 +286,54 @@ class TelegramBotDesktopApp:
         ttk.Button(toolbar, text="✏️ Edit", command=self.edit_response).pack(side=tk.LEFT, padx=5)
         ttk.Button(toolbar, text="🗑️ Delete", command=self.delete_response).pack(side=tk.LEFT, padx=5)
         ttk.Button(toolbar, text="🔄 Refresh", command=self.refresh_responses).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="📥 Import", command=self.import_responses_file).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="📤 Export", command=self.export_responses_file).pack(side=tk.LEFT, padx=5)
+        
+        # Search and paging
+        ttk.Button(toolbar, text="▶", width=3, command=lambda: self.change_responses_page(1)).pack(side=tk.RIGHT)
+        self.responses_page_label = ttk.Label(toolbar, text="Page 1 / 1")
+        self.responses_page_label.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(toolbar, text="◀", width=3, command=lambda: self.change_responses_page(-1)).pack(side=tk.RIGHT)
+        
+        self.responses_search_var = tk.StringVar()
+        search_entry = ttk.Entry(toolbar, textvariable=self.responses_search_var, width=20)
+        search_entry.pack(side=tk.RIGHT, padx=10)
+        search_entry.bind("<Return>", lambda e: self.search_responses())
+        ttk.Label(toolbar, text="Search:").pack(side=tk.RIGHT)
+        
+        # Usage filter: keywords that stopped (or never started) matching
+        usage_bar = ttk.Frame(frame)
+        usage_bar.pack(fill=tk.X, padx=10)
+        
+        self.unused_only_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(usage_bar, text="Only keywords not matched in", variable=self.unused_only_var,
+                        command=self.search_responses).pack(side=tk.LEFT, padx=5)
+        self.unused_days_var = tk.StringVar(value="30")
+        days_spin = ttk.Spinbox(usage_bar, from_=1, to=3650, width=5, textvariable=self.unused_days_var,
+                                command=self.search_responses)
+        days_spin.pack(side=tk.LEFT)
+        days_spin.bind("<Return>", lambda e: self.search_responses())
+        ttk.Label(usage_bar, text="days").pack(side=tk.LEFT, padx=5)
+        ttk.Button(usage_bar, text="🗑️ Delete All Listed", command=self.delete_listed_responses).pack(side=tk.LEFT, padx=10)
         
         # Responses list
         list_frame = ttk.Frame(frame)
         list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
         
         # Treeview for responses
-        columns = ("keyword", "type", "content_preview")
+        columns = ("keyword", "type", "hits", "last_hit", "latency", "content_preview")
         self.responses_tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=15)
         
-        self.responses_tree.heading("keyword", text="Keyword")
-        self.responses_tree.heading("type", text="Type")
-        self.responses_tree.heading("content_preview", text="Content Preview")
-        
-        self.responses_tree.column("keyword", width=200)
-        self.responses_tree.column("type", width=100)
-        self.responses_tree.column("content_preview", width=400)
+        # Keyword and usage columns sort on click (again to reverse)
+        self.responses_sort = ("keyword", False)
+        for column, text, width in (("keyword", "Keyword", 200), ("type", "Type", 80), ("hits", "Hits", 70),
+                                    ("last_hit", "Last Hit", 130), ("latency", "Avg Reply", 80),
+                                    ("content_preview", "Content Preview", 350)):
+            if column in ("keyword", "hits", "last_hit", "latency"):
+                self.responses_tree.heading(column, text=text, command=lambda c=column: self.sort_responses(c))
+            else:
+                self.responses_tree.heading(column, text=text)
+            self.responses_tree.column(column, width=width)
         
         # Scrollbars
         v_scroll = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.responses_tree.yview)
@@ -186,6 +358,9 @@ class TelegramBotDesktopApp:
         ttk.Button(toolbar, text="🎵 Upload Audio", command=lambda: self.upload_media("audio")).pack(side=tk.LEFT, padx=5)
         ttk.Button(toolbar, text="🗑️ Delete", command=self.delete_media).pack(side=tk.LEFT, padx=5)
         ttk.Button(toolbar, text="🔄 Refresh", command=self.refresh_media_files).pack(side=tk.LEFT, padx=5)
+        if hasattr(self.root, 'drop_target_register'):
+            ttk.Label(toolbar, text="Drop image or audio files on the list to upload them",
+                      foreground="gray").pack(side=tk.RIGHT, padx=5)
         
         # Media list
         list_frame = ttk.Frame(frame)
@@ -209,6 +384,10 @@ class TelegramBotDesktopApp:
         
         self.media_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         media_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        if hasattr(self.root, 'drop_target_register'):
+            self.media_tree.drop_target_register(DND_FILES)
+            self.media_tree.dnd_bind('<<Drop>>', self.on_media_drop)
     
     def setup_messages_tab(self, notebook):
         """Setup live messages monitoring tab"""
@@ -220,7 +399,7 @@ class TelegramBotDesktopApp:
         toolbar.pack(fill=tk.X, padx=10, pady=5)
         
         ttk.Button(toolbar, text="🧹 Clear Log", command=self.clear_message_log).pack(side=tk.LEFT, padx=5)
-        ttk.Button(toolbar, text="💾 Save Log", command=self.save_message_log).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="💾 Export Log", command=self.save_message_log).pack(side=tk.LEFT, padx=5)
         
         # Auto-scroll checkbox
         self.auto_scroll_var = tk.BooleanVar(value=True)
@@ -234,8 +413,153 @@ class TelegramBotDesktopApp:
         self.messages_text.tag_configure("incoming", foreground="blue")
         self.messages_text.tag_configure("outgoing", foreground="green")
         self.messages_text.tag_configure("system", foreground="red")
+        self.messages_text.tag_configure("log", foreground="gray")
         self.messages_text.tag_configure("timestamp", foreground="gray")
     
+    def setup_analytics_tab(self, notebook):
+        """Setup analytics dashboard tab"""
+        frame = ttk.Frame(notebook)
+        notebook.add(frame, text="📊 Analytics")
+        
+        # Toolbar
+        toolbar = ttk.Frame(frame)
+        toolbar.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Button(toolbar, text="🔄 Refresh", command=self.refresh_analytics).pack(side=tk.LEFT, padx=5)
+        self.analytics_summary = ttk.Label(toolbar, text="No messages yet")
+        self.analytics_summary.pack(side=tk.LEFT, padx=10)
+        
+        # Traffic chart (last 24 hours)
+        chart_frame = ttk.LabelFrame(frame, text="Traffic per Hour (last 24h)", padding=5)
+        chart_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.analytics_canvas = tk.Canvas(chart_frame, height=200, background="white")
+        self.analytics_canvas.pack(fill=tk.BOTH, expand=True)
+        
+        # Top keywords
+        keywords_frame = ttk.LabelFrame(frame, text="Top Matched Keywords (last 24h)", padding=5)
+        keywords_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        columns = ("keyword", "hits")
+        self.top_keywords_tree = ttk.Treeview(keywords_frame, columns=columns, show="headings", height=8)
+        self.top_keywords_tree.heading("keyword", text="Keyword")
+        self.top_keywords_tree.heading("hits", text="Hits")
+        self.top_keywords_tree.column("keyword", width=300)
+        self.top_keywords_tree.column("hits", width=100)
+        self.top_keywords_tree.pack(fill=tk.BOTH, expand=True)
+    
+    def setup_suggestions_tab(self, notebook):
+        """Setup suggested responses tab"""
+        frame = ttk.Frame(notebook)
+        notebook.add(frame, text="💡 Suggestions")
+        
+        # Toolbar
+        toolbar = ttk.Frame(frame)
+        toolbar.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Button(toolbar, text="🔍 Analyze Unmatched", command=self.analyze_unmatched).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="➕ Create Response", command=self.create_suggested_response).pack(side=tk.LEFT, padx=5)
+        self.suggestions_status = ttk.Label(toolbar, text="Group messages that matched no keyword")
+        self.suggestions_status.pack(side=tk.LEFT, padx=10)
+        
+        # Clusters list
+        list_frame = ttk.Frame(frame)
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        columns = ("size", "keyword", "examples")
+        self.suggestions_tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=15)
+        
+        self.suggestions_tree.heading("size", text="Messages")
+        self.suggestions_tree.heading("keyword", text="Suggested Keyword")
+        self.suggestions_tree.heading("examples", text="Representative Phrases")
+        
+        self.suggestions_tree.column("size", width=80)
+        self.suggestions_tree.column("keyword", width=200)
+        self.suggestions_tree.column("examples", width=500)
+        
+        suggestions_scroll = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.suggestions_tree.yview)
+        self.suggestions_tree.configure(yscrollcommand=suggestions_scroll.set)
+        
+        self.suggestions_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        suggestions_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+    
+    def setup_shards_tab(self, notebook):
+        """Setup per-account worker process tab"""
+        frame = ttk.Frame(notebook)
+        notebook.add(frame, text="🧩 Shards")
+        
+        # Toolbar
+        toolbar = ttk.Frame(frame)
+        toolbar.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Button(toolbar, text="➕ Add Account", command=self.add_shard_account).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="🗑️ Remove", command=self.remove_shard_account).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="▶ Start", command=lambda: self.shard_action("start")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="⏹ Stop", command=lambda: self.shard_action("stop")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="▶ Start All", command=lambda: self.run_shard_task(self.shard_manager.start_all)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="🔄 Push Responses", command=lambda: self.run_shard_task(self.shard_manager.publish_snapshot)).pack(side=tk.LEFT, padx=5)
+        
+        # Shards list
+        list_frame = ttk.Frame(frame)
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        columns = ("shard", "phone", "state", "messages", "queue", "shed")
+        self.shards_tree = ttk.Treeview(list_frame, columns=columns, show="headings", height=6)
+        
+        for column, text, width in (("shard", "Shard", 120), ("phone", "Phone", 140), ("state", "State", 120),
+                                    ("messages", "Messages Today", 110), ("queue", "Send Queue", 90),
+                                    ("shed", "Shed", 80)):
+            self.shards_tree.heading(column, text=text)
+            self.shards_tree.column(column, width=width)
+        self.shards_tree.pack(fill=tk.BOTH, expand=True)
+        
+        self.shards_summary = ttk.Label(frame, text="No shards running")
+        self.shards_summary.pack(anchor=tk.W, padx=10)
+        
+        # Messages from every shard, tagged with the shard name
+        self.shard_messages_text = scrolledtext.ScrolledText(frame, wrap=tk.WORD, height=12)
+        self.shard_messages_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        self.shard_messages_text.tag_configure("shard", foreground="purple")
+        
+        self.refresh_shards()
+    
+    def setup_broadcasts_tab(self, notebook):
+        """Setup scheduled broadcasts tab"""
+        frame = ttk.Frame(notebook)
+        notebook.add(frame, text="📣 Broadcasts")
+        
+        # Toolbar
+        toolbar = ttk.Frame(frame)
+        toolbar.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Button(toolbar, text="➕ New Broadcast", command=self.new_broadcast).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="⏸ Pause", command=lambda: self.broadcast_action("pause")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="▶ Resume", command=lambda: self.broadcast_action("resume")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="✖ Cancel", command=lambda: self.broadcast_action("cancel")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(toolbar, text="🗑️ Delete", command=lambda: self.broadcast_action("delete")).pack(side=tk.LEFT, padx=5)
+        
+        # Jobs list
+        list_frame = ttk.Frame(frame)
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        columns = ("name", "audience", "schedule", "status", "progress", "delivered", "next_run")
+        self.broadcasts_tree = ttk.Treeview(list_frame, columns=columns, show="headings")
+        
+        for column, text, width in (("name", "Name", 160), ("audience", "Audience", 80),
+                                    ("schedule", "Schedule", 110), ("status", "Status", 90),
+                                    ("progress", "Current Run", 110), ("delivered", "Sent / Failed", 110),
+                                    ("next_run", "Next Run", 140)):
+            self.broadcasts_tree.heading(column, text=text)
+            self.broadcasts_tree.column(column, width=width)
+        
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.broadcasts_tree.yview)
+        self.broadcasts_tree.configure(yscrollcommand=scrollbar.set)
+        self.broadcasts_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.broadcasts_error = ttk.Label(frame, text="", foreground="red")
+        self.broadcasts_error.pack(anchor=tk.W, padx=10, pady=(0, 5))
+        self.broadcasts_tree.bind('<<TreeviewSelect>>', lambda e: self.show_broadcast_error())
+    
     def setup_settings_tab(self, notebook):
         """Setup settings tab"""
         frame = ttk.Frame(notebook)
@@ -276,6 +600,36 @@ class TelegramBotDesktopApp:
         # Save button
         ttk.Button(app_frame, text="💾 Save Settings", command=self.save_settings).pack(pady=10)
         
+        # Hinglish spelling variants
+        lexicon_frame = ttk.LabelFrame(frame, text="Hinglish Lexicon", padding=10)
+        lexicon_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(lexicon_frame, text="Variant:").grid(row=0, column=0, sticky=tk.W, pady=2)
+        self.variant_entry = ttk.Entry(lexicon_frame, width=20)
+        self.variant_entry.grid(row=0, column=1, sticky=tk.W, padx=10, pady=2)
+        ttk.Label(lexicon_frame, text="Means:").grid(row=0, column=2, sticky=tk.W, pady=2)
+        self.canonical_entry = ttk.Entry(lexicon_frame, width=20)
+        self.canonical_entry.grid(row=0, column=3, sticky=tk.W, padx=10, pady=2)
+        ttk.Button(lexicon_frame, text="➕ Add", command=self.add_lexicon_variant).grid(row=0, column=4, padx=5)
+        
+        self.lexicon_status = ttk.Label(lexicon_frame, text=f"{len(self.runtime.lexicon)} variants "
+                                                            f"({len(self.runtime.lexicon.overlay)} added here)")
+        self.lexicon_status.grid(row=1, column=0, columnspan=5, sticky=tk.W, pady=(5, 0))
+        
+        # Replication with other installations
+        sync_frame = ttk.LabelFrame(frame, text="Sync Responses", padding=10)
+        sync_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        ttk.Label(sync_frame, text="Shared folder or peer (host:port):").grid(row=0, column=0, sticky=tk.W, pady=2)
+        self.sync_target_entry = ttk.Entry(sync_frame, width=40)
+        self.sync_target_entry.grid(row=0, column=1, padx=5, pady=2)
+        ttk.Button(sync_frame, text="📁", width=3, command=self.browse_sync_folder).grid(row=0, column=2)
+        
+        ttk.Label(sync_frame, text="Peer token:").grid(row=1, column=0, sticky=tk.W, pady=2)
+        self.sync_token_entry = ttk.Entry(sync_frame, width=40, show="*")
+        self.sync_token_entry.grid(row=1, column=1, padx=5, pady=2)
+        ttk.Button(sync_frame, text="🔁 Sync Now", command=self.sync_responses).grid(row=1, column=2, padx=5)
+        
         # About section
         about_frame = ttk.LabelFrame(frame, text="About", padding=10)
         about_frame.pack(fill=tk.X, padx=10, pady=5)
@@ -303,10 +657,33 @@ Created with Python and Tkinter
         self.status_text = ttk.Label(self.status_bar, text="Ready")
         self.status_text.pack(side=tk.LEFT, padx=10)
         
+        # Background task progress, shown while tasks run
+        self.task_frame = ttk.Frame(self.status_bar)
+        self.task_label = ttk.Label(self.task_frame, text="")
+        self.task_label.pack(side=tk.LEFT, padx=5)
+        self.task_progress = ttk.Progressbar(self.task_frame, length=150, mode="determinate")
+        self.task_progress.pack(side=tk.LEFT, padx=5)
+        ttk.Button(self.task_frame, text="✖", width=3, command=self.tasks.cancel_all).pack(side=tk.LEFT)
+        
         # Bot status indicator
         self.bot_indicator = ttk.Label(self.status_bar, text="● Stopped", foreground="red")
         self.bot_indicator.pack(side=tk.RIGHT, padx=10)
     
+    def show_task_progress(self, tasks):
+        """Status bar view of the running background tasks"""
+        if not tasks:
+            self.task_frame.pack_forget()
+            return
+        if not self.task_frame.winfo_ismapped():
+            self.task_frame.pack(side=tk.LEFT, padx=10)
+        
+        text = tasks[0].title
+        if len(tasks) > 1:
+            text += f" (+{len(tasks) - 1} more)"
+        self.task_label.config(text=text)
+        total = sum(task.progress_total for task in tasks)
+        self.task_progress["value"] = 100.0 * sum(task.progress_done for task in tasks) / total if total else 0
+    
     def setup_system_tray(self):
         """Setup system tray integration"""
         # Create tray icon
@@ -314,20 +691,24 @@ Created with Python and Tkinter
             # Create a simple icon (you can replace with actual icon file)
             image = Image.new('RGB', (64, 64), color='blue')
             
+            # Menu clicks arrive on the tray thread; Tk work is handed to the Tk thread
+            self.tray = TrayThread(None, lambda callback: self.root.after(0, callback))
             menu = pystray.Menu(
-                item('Show', self.show_window),
-                item('Hide', self.hide_window),
+                item('Show', self.tray.action(self.show_window)),
+                item('Hide', self.tray.action(self.hide_window)),
                 pystray.Menu.SEPARATOR,
-                item('Start Bot', self.start_bot),
-                item('Stop Bot', self.stop_bot),
+                item('Start Bot', self.tray.action(self.start_bot)),
+                item('Stop Bot', self.tray.action(self.stop_bot)),
                 pystray.Menu.SEPARATOR,
-                item('Exit', self.quit_app)
+                item('Exit', self.tray.action(self.quit_app))
             )
             
-            self.tray_icon = pystray.Icon("TelegramBot", image, "Telegram Bot Manager", menu)
+            # One tray thread for the app's lifetime, whether the window is shown or hidden
+            self.tray.icon = pystray.Icon("TelegramBot", image, "Telegram Bot Manager", menu)
+            self.tray.start()
         except Exception as e:
             print(f"System tray setup failed: {e}")
-            self.tray_icon = None
+            self.tray = None
     
     def check_configuration(self):
         """Check if bot is properly configured"""
@@ -363,17 +744,15 @@ Created with Python and Tkinter
             return
             
         try:
-            self.bot_thread = threading.Thread(target=self.run_bot, daemon=True)
-            self.bot_thread.start()
+            if self.service_client:
+                self.service_client.send({"cmd": "start"})
+            else:
+                self.lifecycle.start()
             self.bot_running = True
             
             # Update GUI
             self.start_btn.config(state=tk.DISABLED)
             self.stop_btn.config(state=tk.NORMAL)
-            self.status_label.config(text="Bot Status: Starting...")
-            self.bot_indicator.config(text="● Starting", foreground="orange")
-            
-            self.log_message("Bot started successfully", "system")
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to start bot: {str(e)}")
@@ -385,40 +764,297 @@ Created with Python and Tkinter
             return
             
         try:
+            if self.service_client:
+                self.service_client.send({"cmd": "stop"})
+            else:
+                self.lifecycle.stop()
             self.bot_running = False
             
             # Update GUI
             self.start_btn.config(state=tk.NORMAL)
             self.stop_btn.config(state=tk.DISABLED)
-            self.status_label.config(text="Bot Status: Stopped")
-            self.bot_indicator.config(text="● Stopped", foreground="red")
-            
-            self.log_message("Bot stopped", "system")
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to stop bot: {str(e)}")
     
-    def run_bot(self):
-        """Run bot in separate thread"""
+    def toggle_service_attach(self):
+        """Attach to or detach from a headless bot service"""
+        if self.service_client:
+            self.service_client.close()
+            return
+        
+        if self.lifecycle.state != STOPPED:
+            messagebox.showwarning("Warning", "Stop the local bot before attaching to a service")
+            return
+        
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(self.bot.start())
-        except Exception as e:
-            self.log_message(f"Bot error: {str(e)}", "system")
+            self.service_client = ServiceClient(self.on_service_event)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"No bot service found: {str(e)}\n\nStart it with: service.py")
+            return
+        
+        self.attach_btn.config(text="⏏ Detach")
+        self.service_label.config(text="Attached to background service")
+        self.log_message("Attached to bot service", "system")
+    
+    def on_service_event(self, event):
+        """Event from the attached service (called from its reader thread)"""
+        self.root.after(0, self.handle_service_event, event)
+    
+    def handle_service_event(self, event):
+        """Apply a service event on the Tk thread"""
+        kind = event.get("event")
+        if kind == "state":
+            error = event.get("error")
+            self.update_bot_status(event["state"], error)
+            if event["state"] != STOPPED:
+                self.bot_running = True
+                self.start_btn.config(state=tk.DISABLED)
+                self.stop_btn.config(state=tk.NORMAL)
+        elif kind == "log":
+            self.log_message(event["text"], event.get("type", "incoming"), event.get("chat_id"))
+        elif kind == "stats":
+            self.stats_messages.config(text=f"Messages Today: {event['messages_today']}")
+            self.stats_responses.config(text=f"Total Responses: {event['responses']}")
+            self.show_load_stats(event['ingress_queue'], event['ingress'], event['private_wait'])
+        elif kind == "error":
+            self.log_message(f"Service error: {event['error']}", "system")
+        elif kind == "detached":
+            self.service_client = None
+            self.attach_btn.config(text="🔌 Attach")
+            self.service_label.config(text="Running the bot inside this window")
+            self.update_bot_status(STOPPED)
+            self.log_message("Detached from bot service", "system")
+    
+    def on_bot_state(self, state, error=None):
+        """Lifecycle state callback (called from the bot loop thread)"""
+        self.root.after(0, self.update_bot_status, state, error)
+    
+    def update_bot_status(self, state, error=None):
+        """Reflect the bot lifecycle state in the GUI"""
+        labels = {
+            STARTING: ("Starting...", "● Starting", "orange"),
+            RUNNING: ("Running", "● Running", "green"),
+            STOPPING: ("Stopping...", "● Stopping", "orange"),
+            STOPPED: ("Stopped", "● Stopped", "red"),
+        }
+        text, indicator, color = labels[state]
+        self.status_label.config(text=f"Bot Status: {text}")
+        self.bot_indicator.config(text=indicator, foreground=color)
+        
+        if state == STOPPED:
             self.bot_running = False
+            self.start_btn.config(state=tk.NORMAL)
+            self.stop_btn.config(state=tk.DISABLED)
+        
+        if error:
+            self.log_message(f"Bot error: {str(error)}", "system")
+        elif state in (RUNNING, STOPPED):
+            self.log_message(f"Bot {state}", "system")
+    
+    def refresh_shards(self):
+        """Redraw the shards list and the totals"""
+        self.shards_tree.delete(*self.shards_tree.get_children())
+        for name, shard in self.shard_manager.shards.items():
+            stats = shard.stats if shard.running else {}
+            ingress = stats.get("ingress", {})
+            shed = sum(ingress.get(key, 0) for key in ("shed_oldest", "shed_duplicate", "shed_stale"))
+            self.shards_tree.insert("", tk.END, iid=name, values=(
+                name, shard.account.get("phone", ""), shard.state, stats.get("messages_today", ""),
+                stats.get("send_queue", ""), shed if stats else ""))
+        
+        totals = self.shard_manager.totals()
+        self.shards_summary.config(text=f"{totals['running']} of {len(self.shard_manager.shards)} shards running   "
+                                        f"Messages today: {totals['messages_today']}   "
+                                        f"Send queue: {totals['send_queue']}   Shed: {totals['shed']}")
+    
+    def on_shard_event(self, name, event):
+        """Event from a shard (called from its reader thread)"""
+        self.root.after(0, self.handle_shard_event, name, event)
+    
+    def handle_shard_event(self, name, event):
+        """Apply a shard event on the Tk thread"""
+        kind = event.get("event")
+        if kind in ("state", "stats", "detached"):
+            self.refresh_shards()
+            if kind == "state" and event.get("error"):
+                self.append_shard_message(name, f"Error: {event['error']}")
+        elif kind in ("log", "error"):
+            self.append_shard_message(name, event.get("text") or event.get("error", ""))
+    
+    def append_shard_message(self, name, text):
+        self.shard_messages_text.insert(tk.END, f"[{name}] ", "shard")
+        self.shard_messages_text.insert(tk.END, f"{text}\n")
+        # Keep the merged stream bounded
+        lines = int(self.shard_messages_text.index('end-1c').split('.')[0])
+        if lines > 5000:
+            self.shard_messages_text.delete(1.0, f"{lines - 5000}.0")
+        if self.auto_scroll_var.get():
+            self.shard_messages_text.see(tk.END)
+    
+    def selected_shard(self):
+        selection = self.shards_tree.selection()
+        if not selection:
+            messagebox.showwarning("Warning", "Please select a shard")
+            return None
+        return selection[0]
+    
+    def add_shard_account(self):
+        """Add an account to run as a shard"""
+        ShardAccountDialog(self.root, self)
+    
+    def remove_shard_account(self):
+        """Stop and forget the selected shard's account"""
+        name = self.selected_shard()
+        if name and messagebox.askyesno("Confirm Delete", f"Remove shard '{name}'?"):
+            self.run_shard_task(self.shard_manager.remove_account, name)
+    
+    def shard_action(self, action):
+        """Start or stop the selected shard"""
+        name = self.selected_shard()
+        if name:
+            method = self.shard_manager.start if action == "start" else self.shard_manager.stop
+            self.run_shard_task(method, name)
+    
+    def run_shard_task(self, method, *args):
+        """Run a shard manager call off the Tk thread; it may compile or wait for processes"""
+        def run():
+            try:
+                method(*args)
+            except Exception as e:
+                self.root.after(0, messagebox.showerror, "Error", f"Shard operation failed: {str(e)}")
+            self.root.after(0, self.refresh_shards)
+        threading.Thread(target=run, daemon=True).start()
+    
+    def refresh_broadcasts(self):
+        """Keep the broadcasts list current while runs progress"""
+        self.draw_broadcasts()
+        self.root.after(3000, self.refresh_broadcasts)
+    
+    def draw_broadcasts(self):
+        """Redraw the broadcast jobs with their delivery counts"""
+        try:
+            selection = self.broadcasts_tree.selection()
+            self.broadcasts_tree.delete(*self.broadcasts_tree.get_children())
+            self.broadcast_jobs = {}
+            for job in self.runtime.broadcast_store.jobs():
+                iid = str(job['id'])
+                self.broadcast_jobs[iid] = job
+                progress = f"{job['position']} / {job['run_total']}" if job['run_total'] else ""
+                next_run = datetime.fromtimestamp(job['run_at']).strftime('%Y-%m-%d %H:%M') \
+                    if job['status'] == SCHEDULED and job['run_at'] else ""
+                self.broadcasts_tree.insert("", tk.END, iid=iid, values=(
+                    job['name'], job['audience'], job['cron'] or "once", job['status'], progress,
+                    f"{job['sent_total']} / {job['failed_total']}", next_run))
+            self.broadcasts_tree.selection_set([iid for iid in selection if iid in self.broadcast_jobs])
+        except Exception as e:
+            self.log_message(f"Broadcast refresh failed: {str(e)}", "system")
+    
+    def show_broadcast_error(self):
+        selection = self.broadcasts_tree.selection()
+        job = self.broadcast_jobs.get(selection[0]) if selection else None
+        error = job and job['last_error']
+        self.broadcasts_error.config(text=f"Last error: {error}" if error else "")
+    
+    def new_broadcast(self):
+        """Schedule a new broadcast"""
+        BroadcastDialog(self.root, self)
+    
+    def broadcast_action(self, action):
+        """Pause, resume, cancel or delete the selected broadcast"""
+        selection = self.broadcasts_tree.selection()
+        if not selection:
+            messagebox.showwarning("Warning", "Please select a broadcast")
+            return
+        job = self.broadcast_jobs[selection[0]]
+        store = self.runtime.broadcast_store
+        
+        if action == "pause":
+            if job['status'] in (SCHEDULED, BROADCAST_RUNNING):
+                store.set_status(job['id'], PAUSED)
+        elif action == "resume":
+            store.resume(job['id'])
+        elif action == "cancel":
+            if messagebox.askyesno("Confirm", f"Cancel broadcast '{job['name']}'?"):
+                store.set_status(job['id'], CANCELLED)
+        elif action == "delete":
+            if job['status'] == BROADCAST_RUNNING:
+                messagebox.showwarning("Warning", "Pause or cancel the broadcast first")
+                return
+            if messagebox.askyesno("Confirm Delete", f"Delete broadcast '{job['name']}'?"):
+                store.delete(job['id'])
+        self.log_message(f"Broadcast '{job['name']}': {action}", "system")
+        self.draw_broadcasts()
+    
+    def search_responses(self):
+        """Apply the search box and go back to the first page"""
+        self.responses_page = 0
+        self.refresh_responses()
+    
+    def change_responses_page(self, step):
+        """Move the responses list by `step` pages"""
+        self.responses_page = max(0, self.responses_page + step)
+        self.refresh_responses()
+    
+    def sort_responses(self, column):
+        """Sort the responses list by a column; usage columns start with the largest"""
+        current, descending = self.responses_sort
+        self.responses_sort = (column, not descending if column == current else column != "keyword")
+        self.responses_page = 0
+        self.refresh_responses()
+    
+    def listed_keywords(self, search, usage):
+        """Every keyword the search, usage filter and sort select, in display order"""
+        needle = search.casefold() if search else None
+        keywords = [k for k in self.store.keywords() if needle is None or needle in k.casefold()]
+        
+        if self.unused_only_var.get():
+            days = int(self.unused_days_var.get())
+            cutoff = time.time() - days * 86400
+            # Keywords never seen by the counters start their clock now
+            untracked = [k for k in keywords if k not in usage]
+            if untracked:
+                self.runtime.keyword_stats.track(untracked)
+            keywords = [k for k in keywords if self.runtime.keyword_stats.unused(usage, k, cutoff)]
+        
+        column, descending = self.responses_sort
+        if column == "keyword":
+            sort_key = str.casefold
+        elif column == "hits":
+            sort_key = lambda k: usage[k].hits if k in usage else 0
+        elif column == "last_hit":
+            sort_key = lambda k: (usage[k].last_hit or 0) if k in usage else 0
+        else:
+            # Keywords never timed sort below every timed one
+            sort_key = lambda k: usage[k].avg_latency if k in usage and usage[k].avg_latency is not None else -1
+        keywords.sort(key=sort_key, reverse=descending)
+        return keywords
     
     def refresh_responses(self):
         """Refresh responses list"""
         # Clear existing items
-        for item in self.responses_tree.get_children():
-            self.responses_tree.delete(item)
+        self.responses_tree.delete(*self.responses_tree.get_children())
         
         try:
-            with open(RESPONSES_FILE, 'r', encoding='utf-8') as f:
-                responses = json.load(f)
+            search = self.responses_search_var.get().strip() or None
+            usage = self.runtime.keyword_stats.usage()
+            
+            if self.responses_sort == ("keyword", False) and not self.unused_only_var.get():
+                # The store pages in keyword order itself
+                total = self.store.count(search=search)
+                pages = max(1, (total + self.responses_page_size - 1) // self.responses_page_size)
+                self.responses_page = min(self.responses_page, pages - 1)
+                responses = self.store.page(self.responses_page * self.responses_page_size,
+                                            self.responses_page_size, search=search)
+            else:
+                keywords = self.listed_keywords(search, usage)
+                pages = max(1, (len(keywords) + self.responses_page_size - 1) // self.responses_page_size)
+                self.responses_page = min(self.responses_page, pages - 1)
+                start = self.responses_page * self.responses_page_size
+                responses = [(k, self.store.get(k)) for k in keywords[start:start + self.responses_page_size]]
+                responses = [(k, data) for k, data in responses if data is not None]
             
-            for keyword, data in responses.items():
+            for keyword, data in responses:
                 response_type = data.get('type', 'unknown')
                 content = data.get('content', [])
                 
@@ -430,48 +1066,145 @@ Created with Python and Tkinter
                 else:
                     preview = str(content)[:50] + "..." if len(str(content)) > 50 else str(content)
                 
-                self.responses_tree.insert("", tk.END, values=(keyword, response_type, preview))
+                entry = usage.get(keyword)
+                hits = entry.hits if entry else 0
+                last_hit = datetime.fromtimestamp(entry.last_hit).strftime('%Y-%m-%d %H:%M') \
+                    if entry and entry.last_hit else "never"
+                latency = f"{entry.avg_latency * 1000:.0f} ms" if entry and entry.avg_latency is not None else ""
+                
+                self.responses_tree.insert("", tk.END, values=(keyword, response_type, hits, last_hit,
+                                                               latency, preview))
+            
+            self.responses_page_label.config(text=f"Page {self.responses_page + 1} / {pages}")
             
             # Update stats
-            self.stats_responses.config(text=f"Total Responses: {len(responses)}")
+            self.stats_responses.config(text=f"Total Responses: {self.store.count()}")
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load responses: {str(e)}")
     
-    def refresh_media_files(self):
-        """Refresh media files list"""
-        # Clear existing items
-        for item in self.media_tree.get_children():
-            self.media_tree.delete(item)
-        
-        total_files = 0
-        
+    def refresh_analytics(self):
+        """Pull new history into the analytics columns off the Tk thread, then redraw the dashboard"""
+        # The Refresh button and the timer share one schedule
+        if self.analytics_after is not None:
+            self.root.after_cancel(self.analytics_after)
+            self.analytics_after = None
+        if self.analytics_task is not None:
+            # Already updating; it schedules the next refresh when done
+            return
+        since = time.time() - 24 * 3600
+        
+        def work(task):
+            # Only this task touches the columns, one at a time
+            self.analytics.update_from_store(self.conversations)
+            return (self.analytics.summary(start_ts=since), self.analytics.hourly(start_ts=since)[1:],
+                    self.analytics.top_keywords(20, start_ts=since))
+        
+        def done(result, error):
+            self.analytics_task = None
+            if error is None:
+                self.draw_analytics(*result)
+            elif not isinstance(error, TransferCancelled):
+                self.log_message(f"Analytics refresh failed: {str(error)}", "system")
+            # Keep the dashboard current
+            self.analytics_after = self.root.after(30000, self.refresh_analytics)
+        
+        self.analytics_task = self.tasks.submit("Updating analytics", work, done)
+    
+    def draw_analytics(self, summary, hourly, top_keywords):
+        """Show the last 24 hours computed by refresh_analytics"""
         try:
-            # Load images
-            if os.path.exists(IMAGES_DIR):
-                for filename in os.listdir(IMAGES_DIR):
-                    filepath = os.path.join(IMAGES_DIR, filename)
-                    if os.path.isfile(filepath):
-                        size = os.path.getsize(filepath)
-                        size_str = f"{size / 1024:.1f} KB"
-                        self.media_tree.insert("", tk.END, values=(filename, "Image", size_str))
-                        total_files += 1
-            
-            # Load audio
-            if os.path.exists(AUDIO_DIR):
-                for filename in os.listdir(AUDIO_DIR):
-                    filepath = os.path.join(AUDIO_DIR, filename)
-                    if os.path.isfile(filepath):
-                        size = os.path.getsize(filepath)
-                        size_str = f"{size / 1024:.1f} KB"
-                        self.media_tree.insert("", tk.END, values=(filename, "Audio", size_str))
-                        total_files += 1
+            text = f"Messages: {summary['messages']}   Chats: {summary['chats']}   " \
+                   f"Unmatched: {summary['unmatched_rate'] * 100:.1f}%"
+            if summary['avg_latency'] is not None:
+                text += f"   Avg reply: {summary['avg_latency'] * 1000:.0f} ms (p95 {summary['p95_latency'] * 1000:.0f} ms)"
+            self.analytics_summary.config(text=text)
             
-            # Update stats
-            self.stats_media.config(text=f"Media Files: {total_files}")
+            self.draw_traffic_chart(*hourly)
+            
+            self.top_keywords_tree.delete(*self.top_keywords_tree.get_children())
+            for keyword, hits in top_keywords:
+                self.top_keywords_tree.insert("", tk.END, values=(keyword, hits))
             
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to load media files: {str(e)}")
+            self.log_message(f"Analytics refresh failed: {str(e)}", "system")
+    
+    def refresh_load_stats(self):
+        """Show the in-process bot's incoming queue and shed counts"""
+        if self.service_client is None:
+            queue = self.runtime.ingress_queue
+            self.show_load_stats(queue.queued(), queue.stats, queue.private_wait)
+        self.root.after(2000, self.refresh_load_stats)
+    
+    def show_load_stats(self, queued, ingress, private_wait):
+        shed = ingress['shed_oldest'] + ingress['shed_duplicate'] + ingress['shed_stale']
+        self.stats_load.config(text=f"Incoming Queue: {queued}   Shed: {shed} "
+                                    f"({ingress['shed_oldest']} oldest, {ingress['shed_duplicate']} duplicate, "
+                                    f"{ingress['shed_stale']} stale)   "
+                                    f"Private wait: {private_wait * 1000:.0f} ms")
+    
+    def draw_traffic_chart(self, messages, unmatched, latency):
+        """Draw hourly message bars, unmatched part in red, with mean reply latency as a line"""
+        canvas = self.analytics_canvas
+        canvas.delete("all")
+        if not len(messages):
+            return
+        
+        width = max(canvas.winfo_width(), 400)
+        height = max(canvas.winfo_height(), 200)
+        bar_width = width / len(messages)
+        peak = max(int(messages.max()), 1)
+        
+        for i, (total, missed) in enumerate(zip(messages, unmatched)):
+            x0 = i * bar_width + 2
+            x1 = (i + 1) * bar_width - 2
+            y_total = height - (height - 20) * total / peak
+            y_missed = height - (height - 20) * missed / peak
+            canvas.create_rectangle(x0, y_total, x1, height, fill="#1FB8CD", outline="")
+            canvas.create_rectangle(x0, y_missed, x1, height, fill="#DB4545", outline="")
+        canvas.create_text(5, 5, anchor=tk.NW, text=f"peak {peak}/h", fill="gray")
+        
+        # Latency has its own scale; hours without replies break the line
+        means = [float(mean) for mean in latency]
+        slowest = max((mean for mean in means if not math.isnan(mean)), default=0)
+        if slowest > 0:
+            def draw_run(points):
+                if len(points) >= 4:
+                    canvas.create_line(*points, fill="#FFA500", width=2)
+                elif points:
+                    x, y = points
+                    canvas.create_oval(x - 2, y - 2, x + 2, y + 2, fill="#FFA500", outline="")
+            
+            points = []
+            for i, mean in enumerate(means):
+                if math.isnan(mean):
+                    draw_run(points)
+                    points = []
+                else:
+                    points += [(i + 0.5) * bar_width, height - (height - 20) * mean / slowest]
+            draw_run(points)
+            canvas.create_text(width - 5, 5, anchor=tk.NE, text=f"reply latency, peak {slowest * 1000:.0f} ms",
+                               fill="#FFA500")
+    
+    def refresh_media_files(self):
+        """Refresh media files list (the folders are scanned in the background)"""
+        def scan(task):
+            return list_media_files(IMAGES_DIR), list_media_files(AUDIO_DIR)
+        
+        def done(result, error):
+            if error:
+                messagebox.showerror("Error", f"Failed to load media files: {str(error)}")
+                return
+            self.media_tree.delete(*self.media_tree.get_children())
+            images, audio = result
+            for file_type, files in (("Image", images), ("Audio", audio)):
+                for filename, size in files:
+                    self.media_tree.insert("", tk.END, values=(filename, file_type, f"{size / 1024:.1f} KB"))
+            
+            # Update stats
+            self.stats_media.config(text=f"Media Files: {len(images) + len(audio)}")
+        
+        self.tasks.submit("Scanning media files", scan, done)
     
     def add_response(self):
         """Open add response dialog"""
@@ -499,99 +1232,371 @@ Created with Python and Tkinter
         keyword = item['values'][0]
         
         if messagebox.askyesno("Confirm Delete", f"Delete response for '{keyword}'?"):
-            try:
-                with open(RESPONSES_FILE, 'r', encoding='utf-8') as f:
-                    responses = json.load(f)
-                
-                del responses[keyword]
-                
-                with open(RESPONSES_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(responses, f, indent=4)
-                
+            keyword = str(keyword)
+            
+            def work(task):
+                self.store.delete(keyword)
+                self.runtime.keyword_stats.forget([keyword])
+            
+            def done(result, error):
+                if error:
+                    messagebox.showerror("Error", f"Failed to delete response: {str(error)}")
+                    return
+                self.runtime.responses_changed(removed=[keyword])
                 self.refresh_responses()
                 self.log_message(f"Deleted response: {keyword}", "system")
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to delete response: {str(e)}")
+            
+            self.tasks.submit(f"Deleting '{keyword}'", work, done)
+    
+    def delete_listed_responses(self):
+        """Delete every response the current search and usage filter list (all pages)"""
+        try:
+            keywords = self.listed_keywords(self.responses_search_var.get().strip() or None,
+                                            self.runtime.keyword_stats.usage())
+        except ValueError:
+            messagebox.showwarning("Warning", "Please enter a number of days")
+            return
+        if not keywords:
+            messagebox.showinfo("Delete", "No responses are listed")
+            return
+        if not self.unused_only_var.get() and not self.responses_search_var.get().strip():
+            messagebox.showwarning("Warning", "Search or filter the list before deleting in bulk")
+            return
+        if not messagebox.askyesno("Confirm Delete", f"Delete {len(keywords)} listed responses?"):
+            return
+        
+        def work(progress, cancel):
+            deleted = 0
+            for start in range(0, len(keywords), 1000):
+                if cancel.is_set():
+                    break
+                batch = keywords[start:start + 1000]
+                self.store.bulk_apply(deletes=batch)
+                self.runtime.keyword_stats.forget(batch)
+                deleted += len(batch)
+                progress(deleted, len(keywords))
+            if deleted:
+                self.runtime.reload_matcher()
+                if any(shard.running for shard in self.shard_manager.shards.values()):
+                    self.shard_manager.publish_snapshot()
+            return deleted
+        
+        def done(deleted, error):
+            self.refresh_responses()
+            if error:
+                messagebox.showerror("Error", f"Failed to delete responses: {str(error)}")
+                return
+            self.log_message(f"Deleted {deleted} listed responses", "system")
+        
+        ProgressDialog(self.root, "Deleting Responses", work, done)
+    
+    def import_responses_file(self):
+        """Stream responses from a CSV/JSONL file in the background"""
+        filename = filedialog.askopenfilename(
+            filetypes=[("CSV or JSON Lines", "*.csv *.jsonl"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        
+        def work(progress, cancel):
+            summary = import_responses(self.store, filename, {"image": IMAGES_DIR, "audio": AUDIO_DIR},
+                                       progress=progress, cancel=cancel)
+            if summary["imported"]:
+                self.runtime.reload_matcher()
+                if any(shard.running for shard in self.shard_manager.shards.values()):
+                    self.shard_manager.publish_snapshot()
+            return summary
+        
+        def done(summary, error):
+            self.refresh_responses()
+            if error:
+                messagebox.showerror("Error", f"Import failed: {str(error)}")
+                return
+            text = f"Imported {summary['imported']} responses, skipped {summary['skipped']}"
+            if summary["cancelled"]:
+                text += " (cancelled; earlier batches were kept)"
+            self.log_message(f"{text} from {os.path.basename(filename)}", "system")
+            if summary["errors"]:
+                text += "\n\n" + "\n".join(summary["errors"][:10])
+            messagebox.showinfo("Import", text)
+        
+        ProgressDialog(self.root, "Importing Responses", work, done)
+    
+    def export_responses_file(self):
+        """Stream all responses to a CSV/JSONL file in the background"""
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".jsonl",
+            filetypes=[("JSON Lines", "*.jsonl"), ("CSV", "*.csv")]
+        )
+        if not filename:
+            return
+        
+        def work(progress, cancel):
+            return export_responses(self.store, filename, progress=progress, cancel=cancel)
+        
+        def done(count, error):
+            if isinstance(error, TransferCancelled):
+                return
+            if error:
+                messagebox.showerror("Error", f"Export failed: {str(error)}")
+                return
+            self.log_message(f"Exported {count} responses to {os.path.basename(filename)}", "system")
+            messagebox.showinfo("Export", f"Exported {count} responses")
+        
+        ProgressDialog(self.root, "Exporting Responses", work, done)
+    
+    def analyze_unmatched(self):
+        """Cluster unmatched messages in a worker process"""
+        if self.cluster_future and not self.cluster_future.done():
+            messagebox.showwarning("Warning", "Analysis is already running")
+            return
+        
+        try:
+            self.conversations.flush(timeout=5)
+            if self.cluster_executor is None:
+                self.cluster_executor = ProcessPoolExecutor(max_workers=1)
+            self.cluster_future = self.cluster_executor.submit(cluster_unmatched, self.conversations.directory)
+            self.suggestions_status.config(text="Analyzing unmatched messages...")
+            self.root.after(500, self.poll_cluster_job)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to start analysis: {str(e)}")
+    
+    def poll_cluster_job(self):
+        """Show clustering results once the worker is done"""
+        if not self.cluster_future.done():
+            self.root.after(500, self.poll_cluster_job)
+            return
+        
+        try:
+            result = self.cluster_future.result()
+        except Exception as e:
+            self.suggestions_status.config(text="Analysis failed")
+            messagebox.showerror("Error", f"Failed to analyze messages: {str(e)}")
+            return
+        
+        self.suggestions_tree.delete(*self.suggestions_tree.get_children())
+        for cluster in result["clusters"]:
+            self.suggestions_tree.insert("", tk.END, values=(
+                cluster["size"], cluster["keyword"], " | ".join(cluster["examples"])))
+        
+        self.suggestions_status.config(
+            text=f"{len(result['clusters'])} groups from {result['messages']} unmatched messages")
+    
+    def create_suggested_response(self):
+        """Open the add dialog pre-filled with the selected suggestion"""
+        selection = self.suggestions_tree.selection()
+        if not selection:
+            messagebox.showwarning("Warning", "Please select a suggestion")
+            return
+        
+        keyword = str(self.suggestions_tree.item(selection[0])['values'][1])
+        AddResponseDialog(self.root, self, keyword=keyword)
     
     def upload_media(self, media_type):
-        """Upload media file"""
+        """Upload media files"""
         if media_type == "image":
-            filetypes = [("Image files", "*.jpg *.jpeg *.png *.gif *.bmp")]
-            target_dir = IMAGES_DIR
+            filetypes = [("Image files", " ".join(f"*{ext}" for ext in IMAGE_EXTENSIONS))]
         else:
-            filetypes = [("Audio files", "*.mp3 *.wav *.ogg *.m4a")]
-            target_dir = AUDIO_DIR
+            filetypes = [("Audio files", " ".join(f"*{ext}" for ext in AUDIO_EXTENSIONS))]
         
-        filename = filedialog.askopenfilename(filetypes=filetypes)
-        if filename:
-            try:
-                import shutil
-                target_path = os.path.join(target_dir, os.path.basename(filename))
-                shutil.copy2(filename, target_path)
-                
-                self.refresh_media_files()
-                self.log_message(f"Uploaded {media_type}: {os.path.basename(filename)}", "system")
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to upload file: {str(e)}")
+        filenames = filedialog.askopenfilenames(filetypes=filetypes)
+        if filenames:
+            self.upload_files(filenames, media_type)
+    
+    def on_media_drop(self, event):
+        """Files dropped on the media list"""
+        paths = [path for path in self.root.tk.splitlist(event.data) if os.path.isfile(path)]
+        if paths:
+            self.upload_files(paths)
+        return event.action
+    
+    def upload_files(self, paths, media_type=None):
+        """Copy files into the media folders, several at once; the type comes from the extension unless given"""
+        jobs, skipped = [], []
+        for path in paths:
+            kind = media_type or media_type_for(path)
+            if kind is None:
+                skipped.append(os.path.basename(path))
+            else:
+                jobs.append((path, kind))
+        if skipped:
+            messagebox.showwarning("Warning", f"Not an image or audio file: {', '.join(skipped[:10])}")
+        if not jobs:
+            return
+        
+        remaining = [len(jobs)]
+        failed = []
+        
+        def finished(path, kind):
+            def done(target, error):
+                name = os.path.basename(path)
+                if error is None:
+                    # A replaced file must not be served from old cached bytes
+                    self.runtime.media_streamer.forget(target)
+                    self.log_message(f"Uploaded {kind}: {name}", "system")
+                elif not isinstance(error, TransferCancelled):
+                    failed.append(f"{name}: {error}")
+                remaining[0] -= 1
+                if not remaining[0]:
+                    self.refresh_media_files()
+                    if failed:
+                        messagebox.showerror("Error", "Failed to upload file:\n" + "\n".join(failed[:10]))
+            return done
+        
+        for path, kind in jobs:
+            target_dir = IMAGES_DIR if kind == "image" else AUDIO_DIR
+            self.tasks.submit(f"Uploading {os.path.basename(path)}",
+                              lambda task, path=path, target_dir=target_dir: copy_media_file(path, target_dir, task),
+                              finished(path, kind))
     
     def delete_media(self):
-        """Delete selected media file"""
+        """Delete selected media files"""
         selection = self.media_tree.selection()
         if not selection:
             messagebox.showwarning("Warning", "Please select a media file to delete")
             return
         
-        item = self.media_tree.item(selection[0])
-        filename = item['values'][0]
-        file_type = item['values'][1]
+        files = []
+        for iid in selection:
+            filename, file_type = self.media_tree.item(iid)['values'][:2]
+            directory = IMAGES_DIR if file_type == "Image" else AUDIO_DIR
+            files.append(os.path.join(directory, str(filename)))
         
-        if messagebox.askyesno("Confirm Delete", f"Delete {filename}?"):
-            try:
-                if file_type == "Image":
-                    filepath = os.path.join(IMAGES_DIR, filename)
-                else:
-                    filepath = os.path.join(AUDIO_DIR, filename)
-                
+        prompt = f"Delete {os.path.basename(files[0])}?" if len(files) == 1 else f"Delete {len(files)} files?"
+        if not messagebox.askyesno("Confirm Delete", prompt):
+            return
+        
+        def work(task):
+            for done, filepath in enumerate(files):
+                if task.cancelled:
+                    raise TransferCancelled()
+                self.runtime.media_streamer.forget(filepath)
                 os.remove(filepath)
-                self.refresh_media_files()
-                self.log_message(f"Deleted media file: {filename}", "system")
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to delete file: {str(e)}")
+                task.progress(done + 1, len(files))
+        
+        def done(result, error):
+            self.refresh_media_files()
+            if error and not isinstance(error, TransferCancelled):
+                messagebox.showerror("Error", f"Failed to delete file: {str(error)}")
+                return
+            if not error:
+                self.log_message(f"Deleted media file: {', '.join(os.path.basename(f) for f in files)}", "system")
+        
+        self.tasks.submit(f"Deleting {len(files)} file(s)", work, done)
     
-    def log_message(self, message, msg_type="system"):
+    def log_message(self, message, msg_type="system", chat_id=None):
         """Add message to log"""
         timestamp = datetime.now().strftime("%H:%M:%S")
         formatted_msg = f"[{timestamp}] {message}\n"
         
         self.messages_text.insert(tk.END, formatted_msg, msg_type)
         
+        # Chat messages are recorded by the bot; keep app events with them for log export
+        if msg_type == "system":
+            self.conversations.append(APP_EVENTS_CHAT, "system", message)
+        
         if self.auto_scroll_var.get():
             self.messages_text.see(tk.END)
         
-        # Show notification if enabled
+        # Show notification if enabled, batched so busy chats do not flood the desktop
         if self.notifications_var.get() and msg_type == "incoming":
-            self.show_notification(message)
+            self.show_notification(message, chat_id)
     
     def clear_message_log(self):
         """Clear message log"""
         self.messages_text.delete(1.0, tk.END)
     
     def save_message_log(self):
-        """Save message log to file"""
-        filename = filedialog.asksaveasfilename(
-            defaultextension=".txt",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
-        )
-        if filename:
+        """Export the message history (not just the widget) to a file"""
+        LogExportDialog(self.root, self)
+    
+    def export_message_log(self, filename, start_ts, end_ts, directions):
+        """Stream the selected history to `filename` in the background"""
+        def work(progress, cancel):
+            self.conversations.flush(timeout=5)
+            return export_log(self.conversations, filename, start_ts, end_ts, directions,
+                              progress=progress, cancel=cancel)
+        
+        def done(count, error):
+            if isinstance(error, TransferCancelled):
+                return
+            if error:
+                messagebox.showerror("Error", f"Failed to export log: {str(error)}")
+                return
+            messagebox.showinfo("Success", f"Exported {count} log entries")
+        
+        ProgressDialog(self.root, "Exporting Message Log", work, done)
+    
+    def add_lexicon_variant(self):
+        """Teach the matcher another spelling of a Hinglish word"""
+        lexicon = self.runtime.lexicon
+        variant = self.variant_entry.get()
+        canonical = self.canonical_entry.get()
+        try:
+            lexicon.add_variant(variant, canonical)
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e))
+            return
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to save lexicon: {str(e)}")
+            return
+        
+        self.variant_entry.delete(0, tk.END)
+        self.canonical_entry.delete(0, tk.END)
+        self.lexicon_status.config(text=f"{len(lexicon)} variants ({len(lexicon.overlay)} added here) - "
+                                        f"last: {variant.strip()} → {canonical.strip()} "
+                                        f"({lexicon.to_devanagari(canonical.strip().casefold())})")
+        self.log_message(f"Hinglish variant added: {variant.strip()} → {canonical.strip()}", "system")
+        # Keywords are compiled through the lexicon, so they are recompiled with the new variant
+        def done(result, error):
+            if error:
+                self.log_message(f"Recompiling keywords failed: {str(error)}", "system")
+        
+        self.tasks.submit("Recompiling keywords", lambda task: self.runtime.reload_matcher(), done)
+    
+    def browse_sync_folder(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            self.sync_target_entry.delete(0, tk.END)
+            self.sync_target_entry.insert(0, folder)
+    
+    def sync_responses(self):
+        """Exchange response changes with the other installations in the background"""
+        target = self.sync_target_entry.get().strip()
+        if not target:
+            messagebox.showwarning("Warning", "Please enter a shared folder or peer address")
+            return
+        token = self.sync_token_entry.get().strip() or None
+        
+        def work(progress, cancel):
+            transport = open_transport(target, token)
             try:
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(self.messages_text.get(1.0, tk.END))
-                messagebox.showinfo("Success", "Message log saved successfully")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save log: {str(e)}")
+                summary = ResponseSync(self.store, transport, {"image": IMAGES_DIR, "audio": AUDIO_DIR},
+                                       SyncState()).sync()
+            finally:
+                transport.close()
+            if summary["pulled"]:
+                self.runtime.reload_matcher()
+                if any(shard.running for shard in self.shard_manager.shards.values()):
+                    self.shard_manager.publish_snapshot()
+            return summary
+        
+        def done(summary, error):
+            if error:
+                messagebox.showerror("Error", f"Sync failed: {str(error)}")
+                return
+            self.refresh_responses()
+            self.refresh_media_files()
+            text = f"Sent {summary['pushed']} changes, received {summary['pulled']}"
+            if summary["conflicts"]:
+                text += f", {summary['conflicts']} edited on both sides"
+            self.log_message(f"Sync: {text} ({summary['bytes_sent']} bytes out, "
+                             f"{summary['bytes_received']} bytes in)", "system")
+            if summary["errors"]:
+                text += "\n\n" + "\n".join(summary["errors"][:10])
+            messagebox.showinfo("Sync", text)
+        
+        ProgressDialog(self.root, "Syncing Responses", work, done)
     
     def save_settings(self):
         """Save application settings"""
@@ -599,20 +1604,25 @@ Created with Python and Tkinter
         messagebox.showinfo("Info", "Settings saved successfully")
     
     def start_message_monitor(self):
-        """Start monitoring messages in a separate thread"""
-        def monitor():
-            while True:
-                if self.message_queue:
-                    message = self.message_queue.pop(0)
-                    self.log_message(message, "incoming")
-                time.sleep(0.1)
-        
-        threading.Thread(target=monitor, daemon=True).start()
+        """Move captured log messages into the log on the Tk thread"""
+        # A bounded batch per tick keeps the window responsive during a flood
+        for _ in range(min(len(self.message_queue), 500)):
+            message, chat_id = self.message_queue.popleft()
+            # Only the bot's chat messages carry a chat id; the rest is module logging, never notified
+            self.log_message(message, "incoming" if chat_id is not None else "log", chat_id)
+        self.root.after(100, self.start_message_monitor)
+    
+    def show_notification(self, message, chat_id=None):
+        """Queue a system notification for the next digest"""
+        delay = self.notifier.add(message, chat_id)
+        if delay is not None:
+            self.root.after(int(delay * 1000), self.flush_notifications)
     
-    def show_notification(self, message):
-        """Show system notification"""
-        if self.tray_icon:
-            self.tray_icon.notify("New Message", message[:100])
+    def flush_notifications(self):
+        """Show the pending messages as one notification"""
+        digest = self.notifier.digest()
+        if digest and self.tray and self.notifications_var.get():
+            self.tray.notify(*digest)
     
     def show_window(self):
         """Show main window"""
@@ -625,21 +1635,34 @@ Created with Python and Tkinter
     
     def on_closing(self):
         """Handle window close event"""
-        if self.minimize_to_tray_var.get() and self.tray_icon:
+        if self.minimize_to_tray_var.get() and self.tray and self.tray.running:
             self.hide_window()
-            if self.tray_icon:
-                threading.Thread(target=self.tray_icon.run, daemon=True).start()
         else:
             self.quit_app()
     
     def quit_app(self):
         """Quit the application"""
-        if self.bot_running:
-            self.stop_bot()
+        # An attached service keeps running on its own
+        if self.service_client:
+            self.service_client.close()
+        
+        if self.tray:
+            self.tray.stop()
+        
+        if self.cluster_executor:
+            self.cluster_executor.shutdown(wait=False, cancel_futures=True)
+        
+        self.tasks.shutdown()
         
-        if self.tray_icon:
-            self.tray_icon.stop()
+        if self.control_api:
+            self.control_api.shutdown()
+            self.control_api.server_close()
         
+        # Shard processes belong to this window
+        self.shard_manager.shutdown()
+        
+        # Stop replying, disconnect and end the bot loop thread
+        self.runtime.close()
         self.root.quit()
         sys.exit()
     
@@ -658,13 +1681,14 @@ class MessageHandler(logging.Handler):
         self.message_queue = message_queue
     
     def emit(self, record):
+        # Any thread; the Tk thread drains the queue
         message = self.format(record)
-        self.message_queue.append(message)
+        self.message_queue.append((message, getattr(record, 'chat_id', None)))
 
 
 class AddResponseDialog:
     """Dialog for adding new responses"""
-    def __init__(self, parent, app):
+    def __init__(self, parent, app, keyword=""):
         self.app = app
         self.dialog = tk.Toplevel(parent)
         self.dialog.title("Add New Response")
@@ -672,6 +1696,7 @@ class AddResponseDialog:
         self.dialog.resizable(False, False)
         
         self.setup_dialog()
+        self.keyword_entry.insert(0, keyword)
         self.dialog.transient(parent)
         self.dialog.grab_set()
     
@@ -691,6 +1716,7 @@ class AddResponseDialog:
         ttk.Radiobutton(type_frame, text="Text", variable=self.type_var, value="text", command=self.on_type_change).pack(side=tk.LEFT)
         ttk.Radiobutton(type_frame, text="Image", variable=self.type_var, value="image", command=self.on_type_change).pack(side=tk.LEFT, padx=10)
         ttk.Radiobutton(type_frame, text="Audio", variable=self.type_var, value="audio", command=self.on_type_change).pack(side=tk.LEFT)
+        ttk.Radiobutton(type_frame, text="Flow", variable=self.type_var, value="flow", command=self.on_type_change).pack(side=tk.LEFT, padx=10)
         
         # Content frame (changes based on type)
         self.content_frame = ttk.Frame(self.dialog)
@@ -716,6 +1742,8 @@ class AddResponseDialog:
             self.setup_text_content()
         elif response_type == "image":
             self.setup_image_content()
+        elif response_type == "flow":
+            self.setup_flow_content()
         else:  # audio
             self.setup_audio_content()
     
@@ -725,6 +1753,12 @@ class AddResponseDialog:
         self.text_content = tk.Text(self.content_frame, height=8, wrap=tk.WORD)
         self.text_content.pack(fill=tk.BOTH, expand=True, pady=5)
     
+    def setup_flow_content(self):
+        """Setup flow step widgets"""
+        ttk.Label(self.content_frame, text="Flow Steps (one prompt per line, {1}, {2}... insert earlier answers):").pack(anchor=tk.W)
+        self.text_content = tk.Text(self.content_frame, height=8, wrap=tk.WORD)
+        self.text_content.pack(fill=tk.BOTH, expand=True, pady=5)
+    
     def setup_image_content(self):
         """Setup image content widgets"""
         ttk.Label(self.content_frame, text="Select Image:").pack(anchor=tk.W)
@@ -732,11 +1766,8 @@ class AddResponseDialog:
         self.image_combo = ttk.Combobox(self.content_frame, textvariable=self.image_var, state="readonly")
         
         # Load available images
-        try:
-            images = [f for f in os.listdir(IMAGES_DIR) if os.path.isfile(os.path.join(IMAGES_DIR, f))]
-            self.image_combo['values'] = images
-        except:
-            pass
+        self.app.tasks.submit("Listing images", lambda task: list_media_files(IMAGES_DIR),
+                              self.fill_media_choices(self.image_combo))
         
         self.image_combo.pack(fill=tk.X, pady=5)
         
@@ -751,14 +1782,18 @@ class AddResponseDialog:
         self.audio_combo = ttk.Combobox(self.content_frame, textvariable=self.audio_var, state="readonly")
         
         # Load available audio files
-        try:
-            audio = [f for f in os.listdir(AUDIO_DIR) if os.path.isfile(os.path.join(AUDIO_DIR, f))]
-            self.audio_combo['values'] = audio
-        except:
-            pass
+        self.app.tasks.submit("Listing audio files", lambda task: list_media_files(AUDIO_DIR),
+                              self.fill_media_choices(self.audio_combo))
         
         self.audio_combo.pack(fill=tk.X, pady=5)
     
+    def fill_media_choices(self, combo):
+        """Task callback putting scanned file names into `combo`, if the dialog is still open"""
+        def done(files, error):
+            if error is None and combo.winfo_exists():
+                combo['values'] = [filename for filename, size in files]
+        return done
+    
     def save(self):
         """Save the response"""
         keyword = self.keyword_entry.get().strip()
@@ -769,12 +1804,8 @@ class AddResponseDialog:
         response_type = self.type_var.get()
         
         try:
-            # Load existing responses
-            with open(RESPONSES_FILE, 'r', encoding='utf-8') as f:
-                responses = json.load(f)
-            
             # Check if keyword already exists
-            if keyword in responses:
+            if self.app.store.get(keyword) is not None:
                 messagebox.showwarning("Warning", "Keyword already exists")
                 return
             
@@ -786,6 +1817,13 @@ class AddResponseDialog:
                     return
                 response_data = {"type": "text", "content": content}
             
+            elif response_type == "flow":
+                content = [line.strip() for line in self.text_content.get(1.0, tk.END).split('\n') if line.strip()]
+                if len(content) < 2:
+                    messagebox.showwarning("Warning", "A flow needs at least two steps")
+                    return
+                response_data = {"type": "flow", "content": content}
+            
             elif response_type == "image":
                 image_file = self.image_var.get()
                 if not image_file:
@@ -804,21 +1842,345 @@ class AddResponseDialog:
                     return
                 response_data = {"type": "audio", "content": audio_file}
             
-            # Save response
-            responses[keyword] = response_data
-            
-            with open(RESPONSES_FILE, 'w', encoding='utf-8') as f:
-                json.dump(responses, f, indent=4)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save response: {str(e)}")
+            return
+        
+        def done(result, error):
+            if error:
+                messagebox.showerror("Error", f"Failed to save response: {str(error)}")
+                return
+            self.app.runtime.responses_changed(added=[keyword])
             
             # Refresh parent app
             self.app.refresh_responses()
             self.app.log_message(f"Added response: {keyword}", "system")
             
-            self.dialog.destroy()
+            if self.dialog.winfo_exists():
+                self.dialog.destroy()
             messagebox.showinfo("Success", "Response added successfully")
-            
+        
+        # Save response; a JSON store rewrites the whole file
+        self.app.tasks.submit(f"Saving '{keyword}'", lambda task: self.app.store.put(keyword, response_data), done)
+
+
+class ShardAccountDialog:
+    """Dialog for adding an account to run as a shard"""
+    def __init__(self, parent, app):
+        self.app = app
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Add Shard Account")
+        self.dialog.geometry("400x260")
+        self.dialog.resizable(False, False)
+        
+        self.entries = {}
+        for field, label in (("name", "Shard Name:"), ("api_id", "API ID:"),
+                             ("api_hash", "API Hash:"), ("phone", "Phone Number:")):
+            ttk.Label(self.dialog, text=label).pack(anchor=tk.W, padx=10, pady=(5, 0))
+            entry = ttk.Entry(self.dialog, width=50, show="*" if field == "api_hash" else "")
+            entry.pack(padx=10, pady=2)
+            self.entries[field] = entry
+        
+        btn_frame = ttk.Frame(self.dialog)
+        btn_frame.pack(pady=10)
+        ttk.Button(btn_frame, text="Save", command=self.save).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Cancel", command=self.dialog.destroy).pack(side=tk.LEFT, padx=5)
+        
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+    
+    def save(self):
+        account = {field: entry.get().strip() for field, entry in self.entries.items()}
+        try:
+            self.app.shard_manager.add_account(account)
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e), parent=self.dialog)
+            return
+        self.app.refresh_shards()
+        self.app.log_message(f"Added shard account: {account['name']}", "system")
+        self.dialog.destroy()
+
+
+class BroadcastDialog:
+    """Message, audience and schedule for a new broadcast"""
+    def __init__(self, parent, app):
+        self.app = app
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("New Broadcast")
+        self.dialog.geometry("480x430")
+        self.dialog.resizable(False, False)
+        
+        ttk.Label(self.dialog, text="Name:").pack(anchor=tk.W, padx=10, pady=(10, 0))
+        self.name_entry = ttk.Entry(self.dialog, width=60)
+        self.name_entry.pack(padx=10, pady=2)
+        
+        ttk.Label(self.dialog, text="Message:").pack(anchor=tk.W, padx=10, pady=(5, 0))
+        self.text_widget = scrolledtext.ScrolledText(self.dialog, height=6, width=55, wrap=tk.WORD)
+        self.text_widget.pack(padx=10, pady=2)
+        
+        ttk.Label(self.dialog, text="Send to:").pack(anchor=tk.W, padx=10, pady=(5, 0))
+        audience_frame = ttk.Frame(self.dialog)
+        audience_frame.pack(anchor=tk.W, padx=10)
+        self.audience_var = tk.StringVar(value="all")
+        for value, text in zip(AUDIENCES, ("All chats", "Private chats", "Groups")):
+            ttk.Radiobutton(audience_frame, text=text, variable=self.audience_var, value=value).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(self.dialog, text="When:").pack(anchor=tk.W, padx=10, pady=(5, 0))
+        self.when_var = tk.StringVar(value="now")
+        when_frame = ttk.Frame(self.dialog)
+        when_frame.pack(fill=tk.X, padx=10)
+        
+        ttk.Radiobutton(when_frame, text="Now", variable=self.when_var, value="now").grid(row=0, column=0, sticky=tk.W)
+        ttk.Radiobutton(when_frame, text="At (YYYY-MM-DD HH:MM):", variable=self.when_var, value="at").grid(row=1, column=0, sticky=tk.W)
+        self.at_entry = ttk.Entry(when_frame, width=20)
+        self.at_entry.insert(0, datetime.now().strftime('%Y-%m-%d %H:%M'))
+        self.at_entry.grid(row=1, column=1, sticky=tk.W, padx=5)
+        ttk.Radiobutton(when_frame, text="Repeat (cron):", variable=self.when_var, value="cron").grid(row=2, column=0, sticky=tk.W)
+        self.cron_entry = ttk.Entry(when_frame, width=20)
+        self.cron_entry.insert(0, "0 9 * * 1")
+        self.cron_entry.grid(row=2, column=1, sticky=tk.W, padx=5)
+        ttk.Label(when_frame, text="minute hour day month weekday", foreground="gray").grid(row=3, column=1, sticky=tk.W, padx=5)
+        
+        btn_frame = ttk.Frame(self.dialog)
+        btn_frame.pack(pady=10)
+        ttk.Button(btn_frame, text="Schedule", command=self.save).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Cancel", command=self.dialog.destroy).pack(side=tk.LEFT, padx=5)
+        
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+    
+    def save(self):
+        text = self.text_widget.get(1.0, tk.END).strip()
+        when = self.when_var.get()
+        run_at = cron = None
+        try:
+            if when == "at":
+                run_at = datetime.strptime(self.at_entry.get().strip(), '%Y-%m-%d %H:%M').timestamp()
+            elif when == "cron":
+                cron = self.cron_entry.get().strip()
+                CronSchedule(cron)
+            self.app.runtime.broadcast_store.add(self.name_entry.get().strip(), text,
+                                                 self.audience_var.get(), run_at=run_at, cron=cron)
+        except ValueError as e:
+            messagebox.showwarning("Warning", f"Invalid broadcast: {str(e)}", parent=self.dialog)
+            return
+        
+        self.app.draw_broadcasts()
+        self.app.log_message(f"Broadcast scheduled: {self.name_entry.get().strip() or text[:30]}", "system")
+        if not self.app.bot_running:
+            messagebox.showinfo("Broadcast", "The broadcast will be sent while the bot is running", parent=self.dialog)
+        self.dialog.destroy()
+
+
+class LogExportDialog:
+    """Time range, message types and output file for a log export"""
+    def __init__(self, parent, app):
+        self.app = app
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title("Export Message Log")
+        self.dialog.geometry("380x260")
+        self.dialog.transient(parent)
+        self.dialog.grab_set()
+        
+        range_frame = ttk.LabelFrame(self.dialog, text="Time Range (YYYY-MM-DD HH:MM, blank = unlimited)")
+        range_frame.pack(fill=tk.X, padx=10, pady=10)
+        ttk.Label(range_frame, text="From:").grid(row=0, column=0, sticky=tk.W, padx=5, pady=2)
+        self.start_entry = ttk.Entry(range_frame, width=20)
+        self.start_entry.grid(row=0, column=1, padx=5, pady=2)
+        ttk.Label(range_frame, text="To:").grid(row=1, column=0, sticky=tk.W, padx=5, pady=2)
+        self.end_entry = ttk.Entry(range_frame, width=20)
+        self.end_entry.grid(row=1, column=1, padx=5, pady=2)
+        
+        types_frame = ttk.LabelFrame(self.dialog, text="Message Types")
+        types_frame.pack(fill=tk.X, padx=10, pady=5)
+        self.direction_vars = {}
+        for direction in LOG_DIRECTIONS:
+            self.direction_vars[direction] = tk.BooleanVar(value=True)
+            ttk.Checkbutton(types_frame, text=direction.capitalize(),
+                            variable=self.direction_vars[direction]).pack(side=tk.LEFT, padx=5)
+        
+        btn_frame = ttk.Frame(self.dialog)
+        btn_frame.pack(pady=10)
+        ttk.Button(btn_frame, text="Export...", command=self.export).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Cancel", command=self.dialog.destroy).pack(side=tk.LEFT, padx=5)
+    
+    def parse_time(self, entry):
+        text = entry.get().strip()
+        if not text:
+            return None
+        for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                return datetime.strptime(text, fmt).timestamp()
+            except ValueError:
+                pass
+        raise ValueError(f"Invalid date: {text}")
+    
+    def export(self):
+        try:
+            start_ts = self.parse_time(self.start_entry)
+            end_ts = self.parse_time(self.end_entry)
+        except ValueError as e:
+            messagebox.showwarning("Warning", str(e), parent=self.dialog)
+            return
+        
+        directions = [d for d, var in self.direction_vars.items() if var.get()]
+        if not directions:
+            messagebox.showwarning("Warning", "Please select at least one message type", parent=self.dialog)
+            return
+        
+        filename = filedialog.asksaveasfilename(
+            parent=self.dialog,
+            defaultextension=".txt.gz",
+            filetypes=[("Compressed text", "*.txt.gz"), ("Compressed JSON Lines", "*.jsonl.gz"),
+                       ("Text files", "*.txt"), ("JSON Lines", "*.jsonl")]
+        )
+        if filename:
+            self.dialog.destroy()
+            self.app.export_message_log(filename, start_ts, end_ts, directions)
+
+
+class BackgroundTask:
+    """One piece of work on the app's thread pool.
+    
+    work(task) runs on a worker thread and may call task.progress(done, total)
+    and check task.cancelled; done(result, error) is called on the Tk thread.
+    """
+    def __init__(self, title, work, done):
+        self.title = title
+        self.work = work
+        self.done = done
+        self.progress_done = 0
+        self.progress_total = 0
+        self.future = None
+        self._cancel_event = threading.Event()
+    
+    def progress(self, done, total):
+        # Worker thread: plain values only, the Tk thread reads them when polling
+        self.progress_done, self.progress_total = done, total
+    
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+    
+    def cancel(self):
+        self._cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+
+class BackgroundTasks:
+    """Thread pool for blocking GUI work (file copies, deletes, directory scans, store writes).
+    
+    Finished tasks are collected by polling on the Tk thread, so done
+    callbacks can touch widgets; on_change(tasks) is called there whenever
+    the running set or its progress changes.
+    """
+    def __init__(self, root, on_change, max_workers=4, poll_ms=100):
+        self.root = root
+        self.on_change = on_change
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gui-task")
+        self.tasks = []
+        self._polling = False
+    
+    def submit(self, title, work, done=None):
+        task = BackgroundTask(title, work, done)
+        task.future = self.executor.submit(task.work, task)
+        self.tasks.append(task)
+        self.on_change(self.tasks)
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+        return task
+    
+    def _poll(self):
+        finished = [task for task in self.tasks if task.future.done()]
+        for task in finished:
+            self.tasks.remove(task)
+        self.on_change(self.tasks)
+        
+        for task in finished:
+            if task.future.cancelled():
+                result, error = None, TransferCancelled()
+            else:
+                error = task.future.exception()
+                result = None if error else task.future.result()
+            if task.done:
+                try:
+                    task.done(result, error)
+                except Exception as e:
+                    logging.error(f"Task '{task.title}' completion failed: {e}")
+        
+        if self.tasks:
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
+    
+    def cancel_all(self):
+        for task in self.tasks:
+            task.cancel()
+    
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ProgressDialog:
+    """Runs work(progress, cancel) on a worker thread with a progress bar and Cancel button.
+    
+    done(result, error) is called on the Tk thread when the work finishes.
+    """
+    def __init__(self, parent, title, work, done):
+        self.work = work
+        self.done = done
+        self.cancel_event = threading.Event()
+        self.state = {"done": 0, "total": 0, "finished": False, "result": None, "error": None}
+        
+        self.dialog = tk.Toplevel(parent)
+        self.dialog.title(title)
+        self.dialog.geometry("400x130")
+        self.dialog.transient(parent)
+        self.dialog.protocol("WM_DELETE_WINDOW", self.cancel)
+        
+        self.label = ttk.Label(self.dialog, text="Starting...")
+        self.label.pack(pady=(15, 5))
+        self.progress_bar = ttk.Progressbar(self.dialog, length=350, mode="determinate")
+        self.progress_bar.pack(pady=5)
+        self.cancel_btn = ttk.Button(self.dialog, text="Cancel", command=self.cancel)
+        self.cancel_btn.pack(pady=5)
+        
+        threading.Thread(target=self.run, daemon=True).start()
+        self.dialog.after(200, self.poll)
+    
+    def progress(self, done, total):
+        # Worker thread: only plain values are shared, Tk is touched by poll()
+        self.state["done"], self.state["total"] = done, total
+    
+    def run(self):
+        try:
+            self.state["result"] = self.work(self.progress, self.cancel_event)
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to save response: {str(e)}")
+            self.state["error"] = e
+        self.state["finished"] = True
+    
+    def cancel(self):
+        self.cancel_event.set()
+        self.cancel_btn.config(state=tk.DISABLED)
+        self.label.config(text="Cancelling...")
+    
+    def poll(self):
+        done, total = self.state["done"], self.state["total"]
+        if total:
+            self.progress_bar["value"] = 100.0 * done / total
+            if not self.cancel_event.is_set():
+                self.label.config(text=f"{100.0 * done / total:.0f}%")
+        
+        if not self.state["finished"]:
+            self.dialog.after(200, self.poll)
+            return
+        
+        self.dialog.destroy()
+        self.done(self.state["result"], self.state["error"])
 
 
 class EditResponseDialog(AddResponseDialog):
@@ -832,12 +2194,9 @@ class EditResponseDialog(AddResponseDialog):
     def load_existing_response(self):
         """Load existing response data"""
         try:
-            with open(RESPONSES_FILE, 'r', encoding='utf-8') as f:
-                responses = json.load(f)
+            response_data = self.app.store.get(self.keyword)
             
-            if self.keyword in responses:
-                response_data = responses[self.keyword]
-                
+            if response_data is not None:
                 # Set keyword (readonly)
                 self.keyword_entry.insert(0, self.keyword)
                 self.keyword_entry.config(state="readonly")
@@ -848,7 +2207,7 @@ class EditResponseDialog(AddResponseDialog):
                 self.on_type_change()
                 
                 # Set content based on type
-                if response_type == "text":
+                if response_type in ("text", "flow"):
                     content = response_data.get('content', [])
                     if isinstance(content, list):
                         self.text_content.insert(1.0, '\n'.join(content))
@@ -870,10 +2229,6 @@ class EditResponseDialog(AddResponseDialog):
         response_type = self.type_var.get()
         
         try:
-            # Load existing responses
-            with open(RESPONSES_FILE, 'r', encoding='utf-8') as f:
-                responses = json.load(f)
-            
             # Create response data
             if response_type == "text":
                 content = [line.strip() for line in self.text_content.get(1.0, tk.END).split('\n') if line.strip()]
@@ -882,6 +2237,13 @@ class EditResponseDialog(AddResponseDialog):
                     return
                 response_data = {"type": "text", "content": content}
             
+            elif response_type == "flow":
+                content = [line.strip() for line in self.text_content.get(1.0, tk.END).split('\n') if line.strip()]
+                if len(content) < 2:
+                    messagebox.showwarning("Warning", "A flow needs at least two steps")
+                    return
+                response_data = {"type": "flow", "content": content}
+            
             elif response_type == "image":
                 image_file = self.image_var.get()
                 if not image_file:
@@ -900,26 +2262,42 @@ class EditResponseDialog(AddResponseDialog):
                     return
                 response_data = {"type": "audio", "content": audio_file}
             
-            # Update response
-            responses[self.keyword] = response_data
-            
-            with open(RESPONSES_FILE, 'w', encoding='utf-8') as f:
-                json.dump(responses, f, indent=4)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to update response: {str(e)}")
+            return
+        
+        def done(result, error):
+            if error:
+                messagebox.showerror("Error", f"Failed to update response: {str(error)}")
+                return
             
             # Refresh parent app
             self.app.refresh_responses()
             self.app.log_message(f"Updated response: {self.keyword}", "system")
             
-            self.dialog.destroy()
+            if self.dialog.winfo_exists():
+                self.dialog.destroy()
             messagebox.showinfo("Success", "Response updated successfully")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to update response: {str(e)}")
+        
+        # Update response
+        self.app.tasks.submit(f"Saving '{self.keyword}'",
+                              lambda task: self.app.store.put(self.keyword, response_data), done)
 
 
 if __name__ == "__main__":
+    # Needed for worker processes in the frozen executable
+    multiprocessing.freeze_support()
+    
+    # Headless mode: TelegramBotManager.exe --service
+    if "--service" in sys.argv:
+        sys.argv.remove("--service")
+        sys.exit(run_service())
+    
     try:
         app = TelegramBotDesktopApp()
+        if os.environ.get("TELEGRAM_BOT_STARTUP_PROBE"):
+            # Startup benchmark from build_executable.py: exit once the window is ready
+            app.root.after_idle(app.root.destroy)
         app.run()
     except KeyboardInterrupt:
         print("Application interrupted by user")
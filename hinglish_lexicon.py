@@ -0,0 +1,329 @@
+# hinglish_lexicon.py - Compiled Hinglish spelling-variant lexicon and Devanagari transliteration
+
+import os
+import json
+import zlib
+import hashlib
+import logging
+
+import numpy as np
+
+from matcher_index import StringTable, write_section_file, map_section_file
+
+LEXICON_MAGIC = b"TGHL"
+LEXICON_VERSION = 1
+LEXICON_FILE = "hinglish.lex"
+OVERLAY_FILE = "hinglish_overlay.json"
+
+logger = logging.getLogger(__name__)
+
+# canonical spelling -> common variants seen in chats
+VARIANTS = {
+    "kya": ["kia", "kyaa", "kyaaa", "ky"],
+    "hai": ["h", "hae", "haii", "hei"],
+    "hain": ["hn", "hein", "haim"],
+    "nahi": ["nahin", "nai", "nhi", "nahee", "naheen", "nahii", "nahiin"],
+    "kaise": ["kese", "kaisey", "kaisay", "kaese", "kayse", "kaisee"],
+    "kitna": ["kitnaa", "ktna", "kitana", "kitanaa"],
+    "kitne": ["ktne", "kitney", "kitane"],
+    "kab": ["kb", "kabb"],
+    "kahan": ["kaha", "kahaan", "kahaa"],
+    "kyun": ["kyu", "kyon", "kyoon", "kiu", "kyoun"],
+    "kaun": ["kon", "kaon", "kown", "koun"],
+    "haan": ["han", "haa", "ha", "haanji", "hanji"],
+    "accha": ["acha", "achha", "achchha", "acchha", "achcha", "achaa"],
+    "theek": ["thik", "thk", "thek", "theekh", "thikk"],
+    "bhai": ["bhaaee", "bhaai", "bhae", "bhaii", "bhaee"],
+    "chahiye": ["chaiye", "chahie", "chahiyee", "chaheye", "chayie", "chaahie", "chaahiye"],
+    "mujhe": ["muje", "mjhe", "mujhey", "mjh"],
+    "aap": ["ap", "aapp", "aaap"],
+    "batao": ["btao", "bataao", "btaao"],
+    "paisa": ["paise", "pesa", "paisay", "pese", "paiso"],
+    "abhi": ["abi", "abhee", "abhii", "abhie"],
+    "bahut": ["bahot", "bohot", "bhut", "bht", "bahoot", "bohat", "bahutt"],
+    "kuch": ["kuchh", "kch", "kuchch", "kuj"],
+    "sab": ["sb", "sabb"],
+    "milega": ["milgea", "milegaa", "mileg", "milga"],
+    "karna": ["krna", "karnaa"],
+    "karo": ["kro", "karoo"],
+    "raha": ["rha", "rahaa"],
+    "rahe": ["rhe", "rahey"],
+    "tha": ["thaa"],
+    "main": ["mai", "mei", "mn"],
+    "mera": ["mra", "meraa"],
+    "tum": ["tm", "tumm"],
+    "hum": ["hm", "humm"],
+    "namaste": ["namastey", "namaskar", "namastay", "nmste"],
+    "dhanyavaad": ["dhanyawad", "dhanyavad", "dhanyvad", "dhanywad"],
+    "shukriya": ["sukriya", "shukria", "sukria", "shukriyaa"],
+    "jaldi": ["jldi", "jaldee", "jaldii"],
+    "aaj": ["aj"],
+    "kal": ["kl", "kall"],
+    "daam": ["daaam"],
+}
+
+# Devanagari -> Latin
+CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "n", "च": "ch", "छ": "chh", "ज": "j", "झ": "jh",
+    "ञ": "n", "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n", "त": "t", "थ": "th", "द": "d",
+    "ध": "dh", "न": "n", "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m", "य": "y", "र": "r",
+    "ल": "l", "व": "v", "श": "sh", "ष": "sh", "स": "s", "ह": "h",
+    # Precomposed nukta letters (क़ ख़ ग़ ज़ ड़ ढ़ फ़ य़)
+    "\u0958": "q", "\u0959": "kh", "\u095a": "g", "\u095b": "z", "\u095c": "r", "\u095d": "rh",
+    "\u095e": "f", "\u095f": "y",
+}
+# The same letters written as consonant + combining nukta
+NUKTA_FORMS = {"k": "q", "j": "z", "d": "r", "dh": "rh", "ph": "f"}
+VOWELS = {"अ": "a", "आ": "aa", "इ": "i", "ई": "ee", "उ": "u", "ऊ": "oo", "ऋ": "ri", "ए": "e", "ऐ": "ai",
+          "ओ": "o", "औ": "au", "ऑ": "o"}
+MATRAS = {"ा": "aa", "ि": "i", "ी": "ee", "ु": "u", "ू": "oo", "ृ": "ri", "े": "e", "ै": "ai", "ो": "o",
+          "ौ": "au", "ॉ": "o"}
+SIGNS = {"ं": "n", "ँ": "n", "ः": "h"}
+VIRAMA = "्"
+NUKTA = "़"
+DIGITS = {chr(0x0966 + i): str(i) for i in range(10)}
+
+
+def is_devanagari(text):
+    return any("ऀ" <= ch <= "ॿ" for ch in text)
+
+
+def _seed_hash():
+    data = json.dumps([VARIANTS, CONSONANTS, VOWELS, MATRAS, SIGNS, NUKTA_FORMS], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _devanagari_table():
+    return {"consonants": CONSONANTS, "vowels": VOWELS, "matras": MATRAS, "signs": SIGNS, "digits": DIGITS,
+            "nukta": NUKTA_FORMS}
+
+
+def _latin_table():
+    """Latin -> Devanagari; for an ambiguous spelling the commoner letter wins"""
+    consonants, vowels, matras = {}, {}, {}
+    for table, source in ((consonants, CONSONANTS), (vowels, VOWELS), (matras, MATRAS)):
+        for dev, latin in source.items():
+            # Later (dental, plain) letters override earlier retroflex/nasal ones
+            if dev < "\u0958":
+                table[latin] = dev
+    consonants["sh"] = "श"
+    return {"consonants": consonants, "vowels": vowels, "matras": matras}
+
+
+def build_lexicon(path, variants=VARIANTS):
+    """Compile `variants` (canonical -> [variant]) into an open-addressing hash table file"""
+    pairs = {}
+    for canonical, spellings in variants.items():
+        for variant in spellings:
+            if variant != canonical:
+                pairs[variant] = canonical
+    keys = list(pairs)
+    hashes = np.array([zlib.crc32(k.encode('utf-8')) for k in keys], dtype=np.uint32)
+
+    size = 1
+    while size < len(keys) * 2:
+        size *= 2
+    slots = np.zeros(size, dtype=np.uint32)
+    mask = size - 1
+    for entry, h in enumerate(hashes.tolist()):
+        slot = h & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = entry + 1
+
+    arrays = {"slots": slots, "hashes": hashes}
+    arrays["key_offsets"], arrays["key_blob"] = StringTable.pack(keys)
+    arrays["value_offsets"], arrays["value_blob"] = StringTable.pack([pairs[k] for k in keys])
+    write_section_file(path, LEXICON_MAGIC, LEXICON_VERSION, {
+        "seed_hash": _seed_hash(),
+        "count": len(keys),
+        "to_latin": _devanagari_table(),
+        "to_devanagari": _latin_table(),
+    }, arrays)
+
+
+class HinglishLexicon:
+    """Maps Hinglish tokens to one canonical Latin spelling.
+
+    Devanagari tokens are transliterated first; the result (or a Latin token)
+    is then looked up in a compiled hash table served from a memory map, so
+    start-up cost and memory don't grow with the lexicon. Variants added from
+    the GUI go to a small JSON overlay consulted first, so extending the
+    lexicon never rebuilds the compiled file.
+    """
+
+    def __init__(self, path=LEXICON_FILE, overlay_path=OVERLAY_FILE):
+        self.path = path
+        self.overlay_path = overlay_path
+        self.generation = 0
+        self._open()
+        self.overlay = {}
+        if overlay_path and os.path.exists(overlay_path):
+            with open(overlay_path, 'r', encoding='utf-8') as f:
+                self.overlay = json.load(f)
+
+    def _open(self):
+        try:
+            mapped = map_section_file(self.path, LEXICON_MAGIC, LEXICON_VERSION)
+            if mapped[2].get("seed_hash") != _seed_hash():
+                mapped[1].close()
+                mapped[0].close()
+                raise ValueError("lexicon built from older data")
+        except (OSError, ValueError) as e:
+            logger.info(f"Building Hinglish lexicon ({e})")
+            build_lexicon(self.path)
+            mapped = map_section_file(self.path, LEXICON_MAGIC, LEXICON_VERSION)
+
+        self._file, self._mmap, self.header, views = mapped
+        self._slots = views["slots"]
+        self._mask = len(self._slots) - 1
+        self._hashes = views["hashes"]
+        self._keys = StringTable(views["key_offsets"], views["key_blob"])
+        self._values = StringTable(views["value_offsets"], views["value_blob"])
+
+        to_latin = self.header["to_latin"]
+        self._consonants = to_latin["consonants"]
+        self._vowels = to_latin["vowels"]
+        self._matras = to_latin["matras"]
+        self._signs = to_latin["signs"]
+        self._digits = to_latin["digits"]
+        self._nukta = to_latin["nukta"]
+        self._to_devanagari = self.header["to_devanagari"]
+
+    def __len__(self):
+        return self.header["count"] + len(self.overlay)
+
+    def lookup(self, token):
+        """Canonical spelling for a Latin token, or None if it is not a known variant"""
+        canonical = self.overlay.get(token)
+        if canonical is not None:
+            return canonical
+        if not len(self._slots):
+            return None
+        h = zlib.crc32(token.encode('utf-8'))
+        slot = h & self._mask
+        while True:
+            entry = int(self._slots[slot])
+            if not entry:
+                return None
+            entry -= 1
+            if int(self._hashes[entry]) == h and self._keys[entry] == token:
+                return self._values[entry]
+            slot = (slot + 1) & self._mask
+
+    def canonical(self, token):
+        """Token in its canonical Latin spelling (unchanged if unknown)"""
+        if is_devanagari(token):
+            token = self.to_latin(token)
+        return self.lookup(token) or token
+
+    # -- transliteration -----------------------------------------------------
+
+    def to_latin(self, word):
+        """Romanize a Devanagari word, with Hindi schwa deletion"""
+        # Syllable units: [consonant, vowel, trailing signs]; vowel None = inherent 'a', '' = virama
+        units = []
+        for ch in word:
+            if ch in self._consonants:
+                units.append([self._consonants[ch], None, ""])
+            elif ch in self._matras and units:
+                units[-1][1] = self._matras[ch]
+            elif ch == VIRAMA and units:
+                units[-1][1] = ""
+            elif ch == NUKTA:
+                if units:
+                    units[-1][0] = self._nukta.get(units[-1][0], units[-1][0])
+            elif ch in self._signs and units:
+                units[-1][2] += self._signs[ch]
+            elif ch in self._vowels:
+                units.append(["", self._vowels[ch], ""])
+            else:
+                units.append(["", "", self._digits.get(ch, ch)])
+
+        # Inherent 'a' is dropped word-finally and in a V C(a) C V context
+        last = len(units) - 1
+        kept = []
+        for i, (consonant, vowel, tail) in enumerate(units):
+            if vowel is None:
+                if i == last and i > 0 and not tail:
+                    vowel = ""
+                elif 0 < i < last and kept[i - 1] and units[i + 1][0] and \
+                        (units[i + 1][1] or (units[i + 1][1] is None and i + 1 != last)):
+                    vowel = ""
+                else:
+                    vowel = "a"
+            elif vowel == "aa" and i == last and consonant:
+                # Hinglish writes a final long a short: kitna, paisa
+                vowel = "a"
+            kept.append(bool(vowel))
+            units[i] = consonant + vowel + tail
+        return "".join(units)
+
+    def to_devanagari(self, word):
+        """Greedy Latin -> Devanagari spelling (for previews; not used when matching)"""
+        table = self._to_devanagari
+        consonants, vowels, matras = table["consonants"], table["vowels"], table["matras"]
+        out = []
+        i = 0
+        after_consonant = False
+        while i < len(word):
+            for size in (3, 2, 1):
+                if i + size > len(word):
+                    continue
+                part = word[i:i + size]
+                if part in consonants:
+                    if after_consonant:
+                        out.append(VIRAMA)
+                    out.append(consonants[part])
+                    after_consonant = True
+                    break
+                if part in vowels:
+                    if after_consonant:
+                        # A bare 'a' after a consonant is the inherent vowel, or a long one word-finally
+                        if part != "a":
+                            out.append(matras[part])
+                        elif i + size == len(word):
+                            out.append(matras["aa"])
+                    else:
+                        out.append(vowels[part])
+                    after_consonant = False
+                    break
+            else:
+                out.append(word[i])
+                after_consonant = False
+                size = 1
+            i += size
+        return "".join(out)
+
+    # -- overlay -------------------------------------------------------------
+
+    def add_variant(self, variant, canonical):
+        """Map `variant` to `canonical` without rebuilding the compiled table"""
+        variant = variant.strip().casefold()
+        canonical = canonical.strip().casefold()
+        if not variant or not canonical or " " in variant:
+            raise ValueError("variant must be a single word")
+        if is_devanagari(variant):
+            variant = self.to_latin(variant)
+        self.overlay[variant] = canonical
+        self._save_overlay()
+
+    def remove_variant(self, variant):
+        del self.overlay[variant]
+        self._save_overlay()
+
+    def _save_overlay(self):
+        tmp_path = self.overlay_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.overlay, f, ensure_ascii=False, indent=4, sort_keys=True)
+        os.replace(tmp_path, self.overlay_path)
+        # Lets normalizers drop tokens they cached under the old mapping
+        self.generation += 1
+
+    def close(self):
+        self._slots = self._hashes = self._keys = self._values = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._file.close()
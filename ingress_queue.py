@@ -0,0 +1,196 @@
+# ingress_queue.py - Bounded queue of incoming messages with load shedding
+
+import time
+import asyncio
+import logging
+from collections import deque, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class _Incoming:
+    __slots__ = ("chat_id", "item", "queued_at")
+
+    def __init__(self, chat_id, item, queued_at):
+        self.chat_id = chat_id
+        self.item = item
+        self.queued_at = queued_at
+
+
+class IngressQueue:
+    """Sits between Telegram's update handler and the workers that match and reply.
+
+    Private chats are never shed and are always served first, so a storm in a
+    group cannot delay a private reply by more than the message a worker is
+    already handling. Group messages are queued per chat and served round-robin;
+    a group holding `max_group_pending` messages drops its oldest to make room,
+    all groups together are capped at `max_pending`, and group messages older
+    than `max_group_age` seconds are dropped instead of answered late. The same
+    text from the same chat within `dedupe_window` seconds is handled once.
+    """
+
+    def __init__(self, max_pending=5000, max_group_pending=100, max_group_age=60.0,
+                 dedupe_window=10.0, max_dedupe_keys=50000, clock=time.monotonic):
+        self.max_pending = max_pending
+        self.max_group_pending = max_group_pending
+        self.max_group_age = max_group_age
+        self.dedupe_window = dedupe_window
+        self.max_dedupe_keys = max_dedupe_keys
+        self.clock = clock
+
+        self._private = deque()
+        self._groups = {}          # chat_id -> deque of _Incoming
+        self._rotation = deque()   # group chat_ids with pending messages, in serving order
+        self._group_pending = 0
+        self._seen = OrderedDict()  # (chat_id, text) -> time first seen
+        self._available = None
+        self._workers = []
+        self._handler = None
+        self._worker_count = 0
+        self.private_wait = 0.0
+        self.stats = {"accepted": 0, "handled": 0, "shed_oldest": 0,
+                      "shed_duplicate": 0, "shed_stale": 0, "failed": 0}
+
+    def queued(self):
+        return len(self._private) + self._group_pending
+
+    def _duplicate(self, chat_id, text, now):
+        seen = self._seen
+        cutoff = now - self.dedupe_window
+        while seen:
+            key, first = next(iter(seen.items()))
+            if first > cutoff and len(seen) < self.max_dedupe_keys:
+                break
+            del seen[key]
+        key = (chat_id, text)
+        if key in seen:
+            return True
+        seen[key] = now
+        return False
+
+    def put(self, chat_id, text, item, is_private=True):
+        """Queue `item` for the workers; returns False if it was shed as a duplicate.
+
+        Call from the bot's event loop. `text` is only used to spot duplicates.
+        """
+        now = self.clock()
+        if text and self.dedupe_window > 0 and self._duplicate(chat_id, text, now):
+            self.stats["shed_duplicate"] += 1
+            return False
+
+        self.stats["accepted"] += 1
+        incoming = _Incoming(chat_id, item, now)
+        if is_private:
+            self._private.append(incoming)
+        else:
+            pending = self._groups.get(chat_id)
+            if pending is None:
+                pending = self._groups[chat_id] = deque()
+                self._rotation.append(chat_id)
+            if len(pending) >= self.max_group_pending:
+                pending.popleft()
+                self.stats["shed_oldest"] += 1
+            else:
+                self._group_pending += 1
+            pending.append(incoming)
+            if self._group_pending > self.max_pending:
+                self._shed_busiest()
+        self._wake()
+        return True
+
+    def _shed_busiest(self):
+        # Over the global cap: the chat with the longest backlog gives up its oldest
+        chat_id = max(self._groups, key=lambda c: len(self._groups[c]))
+        self._drop_group_head(chat_id)
+        self.stats["shed_oldest"] += 1
+
+    def _drop_group_head(self, chat_id):
+        pending = self._groups[chat_id]
+        pending.popleft()
+        self._group_pending -= 1
+        if not pending:
+            del self._groups[chat_id]
+            self._rotation.remove(chat_id)
+
+    def _next(self):
+        if self._private:
+            incoming = self._private.popleft()
+            self.private_wait = self.clock() - incoming.queued_at
+            return incoming
+        cutoff = self.clock() - self.max_group_age
+        while self._rotation:
+            chat_id = self._rotation[0]
+            pending = self._groups[chat_id]
+            incoming = pending[0]
+            self._drop_group_head(chat_id)
+            if chat_id in self._groups:
+                self._rotation.rotate(-1)
+            if incoming.queued_at < cutoff:
+                self.stats["shed_stale"] += 1
+                continue
+            return incoming
+        return None
+
+    def _wake(self):
+        if self._available is not None:
+            self._available.set()
+
+    async def get(self):
+        """Next message to handle: private chats first, then groups in turn"""
+        if self._available is None:
+            self._available = asyncio.Event()
+        while True:
+            incoming = self._next()
+            if incoming is not None:
+                return incoming.item
+            self._available.clear()
+            await self._available.wait()
+
+    async def _work(self, handler):
+        while True:
+            item = await self.get()
+            try:
+                await handler(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Error handling incoming message: {e}")
+            else:
+                self.stats["handled"] += 1
+
+    def start(self, handler, workers=4):
+        """Run `workers` tasks feeding queued items to the `handler` coroutine"""
+        self._handler, self._worker_count = handler, workers
+        self._workers = [task for task in self._workers if not task.done()]
+        loop = asyncio.get_running_loop()
+        while len(self._workers) < workers:
+            self._workers.append(loop.create_task(self._work(handler)))
+
+    def resume(self):
+        """Restart the workers stopped by stop() with the last handler; False if never started"""
+        if self._handler is None:
+            return False
+        self.start(self._handler, self._worker_count)
+        return True
+
+    async def stop(self):
+        """Cancel the workers and drop whatever is still queued"""
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self.clear()
+
+    def clear(self):
+        dropped = self.queued()
+        self._private.clear()
+        self._groups.clear()
+        self._rotation.clear()
+        self._group_pending = 0
+        if dropped:
+            logger.info(f"Dropped {dropped} queued incoming messages")
+
+    def shed_total(self):
+        stats = self.stats
+        return stats["shed_oldest"] + stats["shed_duplicate"] + stats["shed_stale"]
@@ -0,0 +1,197 @@
+# keyword_stats.py - Per-keyword hit counters kept in flat arrays and flushed to SQLite
+
+import time
+import sqlite3
+import logging
+import threading
+from array import array
+
+KEYWORD_STATS_FILE = "keyword_stats.db"
+
+logger = logging.getLogger(__name__)
+
+
+class KeywordUsage:
+    __slots__ = ("hits", "last_hit", "latency_sum", "timed", "tracked_since")
+
+    def __init__(self, hits, last_hit, latency_sum, timed, tracked_since):
+        self.hits = hits
+        self.last_hit = last_hit
+        self.latency_sum = latency_sum
+        self.timed = timed
+        self.tracked_since = tracked_since
+
+    @property
+    def avg_latency(self):
+        return self.latency_sum / self.timed if self.timed else None
+
+
+class KeywordStats:
+    """How often each keyword fires, when it last did and how fast it was answered.
+
+    Recording a hit is a dict lookup and a few writes into typed arrays
+    indexed by a keyword id handed out on first sight, so the bot can count
+    every reply. The arrays hold the counts since the last flush; every
+    `flush_interval` seconds those deltas are added to the totals in SQLite,
+    which lets several processes (the GUI's bot, a service, shards) count
+    into one file. `tracked_since` is when a keyword was first seen here, so
+    a keyword added yesterday is not reported as unused for a month.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS keyword_stats (
+            keyword TEXT PRIMARY KEY,
+            hits INTEGER NOT NULL DEFAULT 0,
+            last_hit REAL,
+            latency_sum REAL NOT NULL DEFAULT 0,
+            timed INTEGER NOT NULL DEFAULT 0,
+            tracked_since REAL NOT NULL
+        ) WITHOUT ROWID
+    """
+
+    def __init__(self, path=KEYWORD_STATS_FILE, flush_interval=60.0, clock=time.time):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.clock = clock
+
+        self._ids = {}
+        self._keywords = []
+        self._hits = array('I')
+        self._timed = array('I')
+        self._last_hit = array('d')
+        self._latency = array('d')
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn as conn:
+            conn.execute(self.SCHEMA)
+
+    # -- recording (bot loop) ------------------------------------------------
+
+    def _add(self, keyword):
+        kw_id = self._ids[keyword] = len(self._keywords)
+        self._keywords.append(keyword)
+        self._hits.append(0)
+        self._timed.append(0)
+        self._last_hit.append(0.0)
+        self._latency.append(0.0)
+        return kw_id
+
+    def record(self, keyword, latency=None):
+        """Count a reply to `keyword`, optionally with its latency in seconds"""
+        now = self.clock()
+        with self._lock:
+            kw_id = self._ids.get(keyword)
+            if kw_id is None:
+                kw_id = self._add(keyword)
+            self._hits[kw_id] += 1
+            self._last_hit[kw_id] = now
+            if latency is not None:
+                self._timed[kw_id] += 1
+                self._latency[kw_id] += latency
+            self._dirty.add(kw_id)
+
+    # -- persistence ---------------------------------------------------------
+
+    def flush(self):
+        """Add the counts since the last flush to the totals on disk"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            rows = []
+            for kw_id in dirty:
+                rows.append((self._keywords[kw_id], self._hits[kw_id], self._last_hit[kw_id],
+                             self._latency[kw_id], self._timed[kw_id], self._last_hit[kw_id]))
+                self._hits[kw_id] = self._timed[kw_id] = 0
+                self._latency[kw_id] = 0.0
+        if not rows:
+            return 0
+        try:
+            with self._db_lock, self._conn as conn:
+                conn.executemany(
+                    "INSERT INTO keyword_stats (keyword, hits, last_hit, latency_sum, timed, tracked_since) "
+                    "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(keyword) DO UPDATE SET "
+                    "hits = hits + excluded.hits, last_hit = MAX(COALESCE(last_hit, 0), excluded.last_hit), "
+                    "latency_sum = latency_sum + excluded.latency_sum, timed = timed + excluded.timed", rows)
+        except sqlite3.Error as e:
+            logger.warning(f"Keyword stats not saved, retrying on the next flush: {e}")
+            with self._lock:
+                for keyword, hits, _, latency, timed, _ in rows:
+                    kw_id = self._ids[keyword]
+                    self._hits[kw_id] += hits
+                    self._timed[kw_id] += timed
+                    self._latency[kw_id] += latency
+                    self._dirty.add(kw_id)
+            return 0
+        return len(rows)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self):
+        """Flush in the background every `flush_interval` seconds"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._flush_loop, name="keyword-stats", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+    # -- queries (GUI) -------------------------------------------------------
+
+    def track(self, keywords):
+        """Start the unused-clock of keywords seen for the first time"""
+        now = self.clock()
+        with self._db_lock, self._conn as conn:
+            conn.executemany("INSERT OR IGNORE INTO keyword_stats (keyword, tracked_since) VALUES (?, ?)",
+                             ((keyword, now) for keyword in keywords))
+
+    def forget(self, keywords):
+        """Drop the counters of deleted keywords"""
+        keywords = list(keywords)
+        with self._lock:
+            for keyword in keywords:
+                kw_id = self._ids.get(keyword)
+                if kw_id is not None:
+                    self._hits[kw_id] = self._timed[kw_id] = 0
+                    self._latency[kw_id] = self._last_hit[kw_id] = 0.0
+                    self._dirty.discard(kw_id)
+        with self._db_lock, self._conn as conn:
+            conn.executemany("DELETE FROM keyword_stats WHERE keyword = ?", ((k,) for k in keywords))
+
+    def usage(self):
+        """keyword -> KeywordUsage, the totals on disk plus the counts not flushed yet"""
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT keyword, hits, last_hit, latency_sum, timed, tracked_since FROM keyword_stats").fetchall()
+        usage = {row[0]: KeywordUsage(*row[1:]) for row in rows}
+        with self._lock:
+            for kw_id in self._dirty:
+                keyword = self._keywords[kw_id]
+                entry = usage.get(keyword)
+                if entry is None:
+                    entry = usage[keyword] = KeywordUsage(0, None, 0.0, 0, self._last_hit[kw_id])
+                entry.hits += self._hits[kw_id]
+                entry.last_hit = max(entry.last_hit or 0.0, self._last_hit[kw_id])
+                entry.latency_sum += self._latency[kw_id]
+                entry.timed += self._timed[kw_id]
+        return usage
+
+    @staticmethod
+    def unused(usage, keyword, cutoff):
+        """True if `keyword` was tracked before `cutoff` and has not been hit since"""
+        entry = usage.get(keyword)
+        return entry is not None and entry.tracked_since < cutoff and (entry.last_hit or 0) < cutoff
@@ -0,0 +1,80 @@
+# log_export.py - Streaming message log export from the conversation store
+
+import os
+import gzip
+import json
+import logging
+from datetime import datetime
+
+from response_transfer import TransferCancelled
+
+LOG_DIRECTIONS = ("incoming", "outgoing", "system")
+
+logger = logging.getLogger(__name__)
+
+
+def log_export_format(path):
+    """(format, compressed) from the file name: .jsonl or text, optionally .gz"""
+    name = path.lower()
+    compressed = name.endswith(".gz")
+    if compressed:
+        name = name[:-3]
+    return ("jsonl" if name.endswith((".jsonl", ".ndjson")) else "text"), compressed
+
+
+def format_log_line(record):
+    """One record as a plain-text log line"""
+    stamp = datetime.fromtimestamp(record["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+    direction = record.get("direction", "")
+    if direction == "system":
+        return f"[{stamp}] [system] {record.get('text', '')}\n"
+    keyword = f" ({record['keyword']})" if record.get("keyword") else ""
+    return f"[{stamp}] [{direction}] chat {record.get('chat_id')}{keyword}: {record.get('text', '')}\n"
+
+
+def export_log(store, path, start_ts=None, end_ts=None, directions=LOG_DIRECTIONS,
+               chunk_size=2000, progress=None, cancel=None):
+    """Stream records with start_ts <= ts < end_ts to a text or JSONL file, gzipped for .gz names.
+
+    Records are read from the store's segments a chunk at a time, so memory
+    stays flat however long the history is. `progress(done, total)` counts
+    records scanned. Writes to a temporary file that replaces `path` when
+    complete; returns the number of records written or raises TransferCancelled.
+    """
+    fmt, compressed = log_export_format(path)
+    directions = set(directions)
+    total = len(store.record_range(start_ts, end_ts))
+    temp_path = path + ".tmp"
+    written = scanned = 0
+    try:
+        raw = open(temp_path, 'wb')
+        out = gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) if compressed else raw
+        with raw, out:
+            lines = []
+            for record in store.between(start_ts, end_ts, chunk_size):
+                scanned += 1
+                if record.get("direction") in directions:
+                    if fmt == "jsonl":
+                        lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+                    else:
+                        lines.append(format_log_line(record))
+                if scanned % chunk_size == 0:
+                    out.write("".join(lines).encode('utf-8'))
+                    written += len(lines)
+                    lines = []
+                    if cancel is not None and cancel.is_set():
+                        raise TransferCancelled()
+                    if progress:
+                        progress(scanned, total)
+            out.write("".join(lines).encode('utf-8'))
+            written += len(lines)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    if progress:
+        progress(total, total)
+    logger.info(f"Exported {written} log records to {path}")
+    return written
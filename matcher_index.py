@@ -0,0 +1,416 @@
+# matcher_index.py - Precompiled, memory-mapped matcher snapshot for fast bot start
+
+import os
+import re
+import json
+import mmap
+import struct
+import bisect
+import hashlib
+import threading
+
+import numpy as np
+
+SNAPSHOT_MAGIC = b"TGIX"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = ".index"
+
+# Same tokenization as sklearn's TfidfVectorizer default, so query vectors
+# line up with the vocabulary fitted at build time
+TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+WHITESPACE_RE = re.compile(r"\s+")
+
+_HEADER = struct.Struct("<4sII")
+_ALIGN = 8
+
+
+def normalize_keyword(text):
+    """Normalize a keyword or incoming message for matching"""
+    return WHITESPACE_RE.sub(" ", text.casefold()).strip()
+
+
+def keyword_key(keyword, normalize=normalize_keyword):
+    """Form a keyword is looked up by exactly; wildcard patterns keep their literal form"""
+    if "*" in keyword:
+        return normalize_keyword(keyword)
+    return normalize(keyword)
+
+
+def _normalizer_signature(normalizer):
+    return normalizer.signature() if normalizer else None
+
+
+def snapshot_path_for(responses_file):
+    """Return the snapshot path that lives next to the responses file"""
+    return os.path.splitext(responses_file)[0] + SNAPSHOT_SUFFIX
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class StringTable:
+    """Read-only sequence of strings stored as one UTF-8 blob plus offsets"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return bytes(self.blob[start:end]).decode('utf-8')
+
+    @staticmethod
+    def pack(strings):
+        """Encode strings into (offsets, blob) arrays"""
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        if encoded:
+            np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return offsets, blob
+
+
+def _wildcard_regex(pattern):
+    return "".join(".*" if part == "*" else re.escape(part) for part in re.split(r"(\*)", pattern))
+
+
+def build_snapshot(responses, snapshot_path, source_hash, source_stat=None, normalizer=None):
+    """Compile keyword structures for `responses` (keyword -> data) into a snapshot file
+
+    With a text_normalizer.TextNormalizer, keywords are stemmed and mapped
+    through the lexicon exactly like the messages they are matched against.
+    """
+    keywords = list(responses.keys()) if isinstance(responses, dict) else list(responses)
+    normalize = normalizer.match_key if normalizer else normalize_keyword
+    literal = [normalize_keyword(k) for k in keywords]
+    normalized = [keyword_key(k, normalize) for k in keywords]
+
+    arrays = {}
+    arrays["kw_offsets"], arrays["kw_blob"] = StringTable.pack(keywords)
+
+    # Exact lookup: normalized keywords sorted for binary search
+    order = sorted(range(len(normalized)), key=normalized.__getitem__)
+    arrays["norm_ids"] = np.array(order, dtype=np.uint32)
+    arrays["norm_offsets"], arrays["norm_blob"] = StringTable.pack([normalized[i] for i in order])
+
+    # Wildcard keywords are compiled into one alternation at load time
+    wildcard_ids = [i for i, k in enumerate(literal) if "*" in k]
+    arrays["wc_ids"] = np.array(wildcard_ids, dtype=np.uint32)
+    arrays["wc_offsets"], arrays["wc_blob"] = StringTable.pack([literal[i] for i in wildcard_ids])
+
+    # TF-IDF, stored transposed (term -> postings) so a query only touches
+    # the keywords that share a term with it
+    terms, idf, ptr, ids, weights = [], [], [0], [], []
+    plain = [normalize(k.replace("*", " ")) for k in keywords]
+    if any(TOKEN_RE.search(k) for k in plain):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectorizer = TfidfVectorizer(lowercase=False, token_pattern=TOKEN_RE.pattern)
+        matrix = vectorizer.fit_transform(plain).tocsc()
+        vocabulary = vectorizer.vocabulary_
+        terms = sorted(vocabulary)
+        columns = [vocabulary[t] for t in terms]
+        idf = vectorizer.idf_[columns]
+        for col in columns:
+            start, end = matrix.indptr[col], matrix.indptr[col + 1]
+            ids.extend(matrix.indices[start:end])
+            weights.extend(matrix.data[start:end])
+            ptr.append(len(ids))
+    arrays["vocab_offsets"], arrays["vocab_blob"] = StringTable.pack(terms)
+    arrays["idf"] = np.asarray(idf, dtype=np.float32)
+    arrays["post_ptr"] = np.asarray(ptr, dtype=np.uint64)
+    arrays["post_ids"] = np.asarray(ids, dtype=np.uint32)
+    arrays["post_weights"] = np.asarray(weights, dtype=np.float32)
+
+    write_section_file(snapshot_path, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, {
+        "source_hash": source_hash,
+        "source_size": source_stat.st_size if source_stat else None,
+        "source_mtime": source_stat.st_mtime_ns if source_stat else None,
+        "count": len(keywords),
+        "normalizer": _normalizer_signature(normalizer),
+    }, arrays)
+
+
+def write_section_file(path, magic, version, header, arrays):
+    """Write named numpy arrays after a JSON header, each aligned so it can be viewed in place"""
+    sections = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+        sections[name] = {"offset": offset, "dtype": array.dtype.str, "count": int(array.size)}
+        offset += array.nbytes
+
+    header_bytes = json.dumps({**header, "sections": sections}).encode('utf-8')
+    data_start = (_HEADER.size + len(header_bytes) + _ALIGN - 1) // _ALIGN * _ALIGN
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(magic, version, len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + sections[name]["offset"])
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+
+def map_section_file(path, magic, version):
+    """Memory-map a file from write_section_file; returns (file, mmap, header, {name: array view})"""
+    f = open(path, 'rb')
+    try:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except Exception:
+        f.close()
+        raise
+    file_magic, file_version, header_len = _HEADER.unpack_from(mapped, 0)
+    if file_magic != magic or file_version != version:
+        mapped.close()
+        f.close()
+        raise ValueError(f"Unsupported file format: {path}")
+    header = json.loads(mapped[_HEADER.size:_HEADER.size + header_len])
+    data_start = (_HEADER.size + header_len + _ALIGN - 1) // _ALIGN * _ALIGN
+
+    views = {}
+    for name, section in header["sections"].items():
+        views[name] = np.frombuffer(mapped, dtype=np.dtype(section["dtype"]),
+                                    count=section["count"], offset=data_start + section["offset"])
+    return f, mapped, header, views
+
+
+def read_snapshot_header(snapshot_path):
+    """Return the snapshot header dict, or None if missing or from another version"""
+    try:
+        with open(snapshot_path, 'rb') as f:
+            magic, version, header_len = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                return None
+            return json.loads(f.read(header_len))
+    except (OSError, struct.error, ValueError):
+        return None
+
+
+class PendingEdits:
+    """Keywords added or deleted since the current snapshot was built.
+
+    Single edits from the GUI land here at once, so an added keyword matches
+    exactly and a deleted one stops matching before the debounced rebuild
+    compiles them into a new snapshot. Each entry carries a sequence number;
+    settle(mark) drops the entries the rebuilt snapshot already includes.
+    """
+
+    def __init__(self, normalize=normalize_keyword):
+        self.normalize = normalize
+        self._added = {}      # normalized keyword -> (keyword, seq)
+        self._removed = {}    # keyword -> seq
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._added) + len(self._removed)
+
+    def add(self, keyword):
+        with self._lock:
+            self._seq += 1
+            self._removed.pop(keyword, None)
+            self._added[keyword_key(keyword, self.normalize)] = (keyword, self._seq)
+
+    def remove(self, keyword):
+        with self._lock:
+            self._seq += 1
+            norm = keyword_key(keyword, self.normalize)
+            if self._added.get(norm, (None,))[0] == keyword:
+                del self._added[norm]
+            self._removed[keyword] = self._seq
+
+    def mark(self):
+        """Sequence number to pass to settle() once a snapshot read from the store now is in use"""
+        return self._seq
+
+    def settle(self, mark):
+        with self._lock:
+            self._added = {norm: entry for norm, entry in self._added.items() if entry[1] > mark}
+            self._removed = {keyword: seq for keyword, seq in self._removed.items() if seq > mark}
+
+    def exact(self, text):
+        entry = self._added.get(self.normalize(text))
+        return entry[0] if entry else None
+
+    def removed(self, keyword):
+        return keyword in self._removed
+
+
+class CompiledMatcher:
+    """Keyword matcher served directly from a memory-mapped snapshot.
+
+    Messages are passed as received. Exact and TF-IDF lookups run them
+    through `normalizer`, which must be the one the snapshot was built with;
+    wildcard patterns match the casefolded message itself.
+    """
+
+    def __init__(self, snapshot_path, normalizer=None):
+        self.path = snapshot_path
+        self.normalizer = normalizer
+        self._normalize = normalizer.match_key if normalizer else normalize_keyword
+        self._file, self._mmap, self.header, views = map_section_file(snapshot_path, SNAPSHOT_MAGIC,
+                                                                      SNAPSHOT_VERSION)
+        self.keywords = StringTable(views["kw_offsets"], views["kw_blob"])
+        self._norm_ids = views["norm_ids"]
+        self._normalized = StringTable(views["norm_offsets"], views["norm_blob"])
+        self._wc_ids = views["wc_ids"]
+        self._wc_patterns = StringTable(views["wc_offsets"], views["wc_blob"])
+        self._vocab = StringTable(views["vocab_offsets"], views["vocab_blob"])
+        self._idf = views["idf"]
+        self._post_ptr = views["post_ptr"]
+        self._post_ids = views["post_ids"]
+        self._post_weights = views["post_weights"]
+        self._wildcard_re = None
+        # Live typo_index.TypoIndex, consulted before the TF-IDF stage
+        self.typo_index = None
+        # Live PendingEdits, edits made since this snapshot was built
+        self.pending = None
+
+    def __len__(self):
+        return len(self.keywords)
+
+    @property
+    def source_hash(self):
+        return self.header["source_hash"]
+
+    def exact(self, text):
+        """Return the keyword equal to `text` after normalization, or None"""
+        norm = self._normalize(text)
+        pos = bisect.bisect_left(self._normalized, norm)
+        if pos < len(self._normalized) and self._normalized[pos] == norm:
+            return self.keywords[int(self._norm_ids[pos])]
+        return None
+
+    def wildcard(self, text):
+        """Return the first wildcard keyword matching `text`, or None"""
+        if not len(self._wc_ids):
+            return None
+        if self._wildcard_re is None:
+            # Compiled on first use so start-up stays independent of keyword count
+            alternatives = (f"(?P<w{i}>{_wildcard_regex(self._wc_patterns[i])})"
+                            for i in range(len(self._wc_patterns)))
+            self._wildcard_re = re.compile("|".join(alternatives), re.DOTALL)
+        match = self._wildcard_re.fullmatch(normalize_keyword(text))
+        if match:
+            return self.keywords[int(self._wc_ids[int(match.lastgroup[1:])])]
+        return None
+
+    def similar(self, text, threshold=0.5, limit=1):
+        """Return up to `limit` (keyword, score) pairs by TF-IDF cosine similarity"""
+        counts = {}
+        for token in TOKEN_RE.findall(self._normalize(text)):
+            term_id = bisect.bisect_left(self._vocab, token)
+            if term_id < len(self._vocab) and self._vocab[term_id] == token:
+                counts[term_id] = counts.get(term_id, 0) + 1
+        if not counts:
+            return []
+
+        term_ids = np.fromiter(counts, dtype=np.int64, count=len(counts))
+        query = np.fromiter(counts.values(), dtype=np.float32, count=len(counts)) * self._idf[term_ids]
+        query /= np.linalg.norm(query)
+
+        scores = {}
+        for term_id, q_weight in zip(term_ids, query):
+            start, end = int(self._post_ptr[term_id]), int(self._post_ptr[term_id + 1])
+            for kw_id, weight in zip(self._post_ids[start:end].tolist(), self._post_weights[start:end].tolist()):
+                scores[kw_id] = scores.get(kw_id, 0.0) + weight * float(q_weight)
+
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+        return [(self.keywords[kw_id], score) for kw_id, score in ranked if score >= threshold]
+
+    def match(self, text, threshold=0.5):
+        """Return (keyword, method) for the best match, or (None, None)"""
+        # None while no edits are pending, so the usual path pays nothing
+        pending = self.pending or None
+        if pending is not None:
+            keyword = pending.exact(text)
+            if keyword is not None:
+                return keyword, "exact"
+
+        keyword = self.exact(text)
+        if keyword is not None and not (pending and pending.removed(keyword)):
+            return keyword, "exact"
+        keyword = self.wildcard(text)
+        if keyword is not None and not (pending and pending.removed(keyword)):
+            return keyword, "wildcard"
+        if self.typo_index is not None:
+            keyword = self.typo_index.best(text)
+            if keyword is not None:
+                return keyword, "typo"
+        # Ask for enough candidates that deleted keywords can be skipped
+        for keyword, _ in self.similar(text, threshold=threshold, limit=1 + len(pending or ())):
+            if not (pending and pending.removed(keyword)):
+                return keyword, "fuzzy"
+        return None, None
+
+    def close(self):
+        """Release the memory map"""
+        # Drop the array views first so the map can actually be unmapped
+        self.keywords = self._normalized = self._wc_patterns = self._vocab = None
+        self._norm_ids = self._wc_ids = self._idf = None
+        self._post_ptr = self._post_ids = self._post_weights = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A caller still holds a view; the map is released with it
+            pass
+        self._file.close()
+
+
+def load_or_build(responses_file, snapshot_path=None, normalizer=None):
+    """Load the matcher snapshot for `responses_file`, rebuilding it only if the responses changed"""
+    snapshot_path = snapshot_path or snapshot_path_for(responses_file)
+    stat = os.stat(responses_file)
+    header = read_snapshot_header(snapshot_path)
+    if header is not None and header.get("normalizer") != _normalizer_signature(normalizer):
+        # Keywords were compiled under other stemming or lexicon entries
+        header = None
+
+    if header is not None:
+        # Same size and mtime as when built: skip hashing entirely
+        if header.get("source_size") == stat.st_size and header.get("source_mtime") == stat.st_mtime_ns:
+            return CompiledMatcher(snapshot_path, normalizer)
+
+    source_hash = hash_file(responses_file)
+    if header is None or header.get("source_hash") != source_hash:
+        with open(responses_file, 'r', encoding='utf-8') as f:
+            responses = json.load(f)
+        build_snapshot(responses, snapshot_path, source_hash, stat, normalizer)
+    return CompiledMatcher(snapshot_path, normalizer)
+
+
+def load_for_store(store, normalizer=None):
+    """Load the matcher snapshot for a response store from response_store"""
+    if store.backend == "json":
+        return load_or_build(store.path, normalizer=normalizer)
+
+    snapshot_path = snapshot_path_for(store.path)
+    revision = store.revision()
+    header = read_snapshot_header(snapshot_path)
+    if header is None or header.get("source_hash") != revision or \
+            header.get("normalizer") != _normalizer_signature(normalizer):
+        build_snapshot(store.keywords(), snapshot_path, revision, normalizer=normalizer)
+    return CompiledMatcher(snapshot_path, normalizer)
+
+
+def build_for_store(store, snapshot_path, normalizer=None):
+    """Compile a snapshot of the store's current responses at `snapshot_path`"""
+    # Identify the source before reading it, so a concurrent edit forces a later rebuild
+    if store.backend == "json":
+        stat = os.stat(store.path)
+        source_hash = hash_file(store.path)
+    else:
+        stat = None
+        source_hash = store.revision()
+    build_snapshot(list(store.keywords()), snapshot_path, source_hash, stat, normalizer)
@@ -0,0 +1,226 @@
+# media_stream.py - Chunked, memory-mapped media uploads with a small hot-file cache
+
+import io
+import os
+import mmap
+import time
+import asyncio
+import logging
+import threading
+
+CHUNK_SIZE = 512 * 1024          # Telegram's largest upload part
+SMALL_FILE_LIMIT = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class _SharedMap:
+    __slots__ = ("map", "size", "users")
+
+    def __init__(self, mapped, size):
+        self.map = mapped
+        self.size = size
+        self.users = 0
+
+
+class MappedReader(io.RawIOBase):
+    """Read-only file object over a shared mapping; each read copies one chunk only"""
+
+    def __init__(self, shared, name, release):
+        self._shared = shared
+        self._view = memoryview(shared.map)
+        self._release = release
+        self._pos = 0
+        self.name = name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._shared.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def read(self, size=-1):
+        end = self._shared.size if size is None or size < 0 else min(self._pos + size, self._shared.size)
+        data = bytes(self._view[self._pos:end])
+        self._pos = max(self._pos, end)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+            self._release()
+        super().close()
+
+
+class MediaStreamer:
+    """Sends media files without reading them whole, however many chats ask at once.
+
+    Files larger than `small_file_limit` are memory-mapped once and read in
+    `chunk_size` parts, so an upload holds one part at a time and the pages
+    are the OS's to drop. Smaller files stay in an LRU of at most
+    `cache_bytes`. At most `max_concurrent` uploads run together, and chats
+    asking for the same file while it uploads share that one upload; the
+    uploaded handle is reused for `handle_ttl` seconds, so fifty chats
+    requesting the same song cost one upload. Uploads and sends go through
+    a Telethon-style client (`upload_file`, `send_file`).
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, max_concurrent=4, cache_bytes=16 * 1024 * 1024,
+                 small_file_limit=SMALL_FILE_LIMIT, handle_ttl=3600.0, clock=time.monotonic):
+        self.chunk_size = chunk_size
+        self.max_concurrent = max_concurrent
+        self.cache_bytes = cache_bytes
+        self.small_file_limit = small_file_limit
+        self.handle_ttl = handle_ttl
+        self.clock = clock
+
+        self._cache = {}          # file key -> bytes, least recently used first
+        self._cached_bytes = 0
+        self._maps = {}           # file key -> _SharedMap
+        self._uploads = {}        # file key -> future of the uploaded handle
+        self._handles = {}        # file key -> (handle, uploaded at)
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self.stats = {"uploads": 0, "reused": 0, "cache_hits": 0, "mapped": 0, "bytes_uploaded": 0}
+
+    @staticmethod
+    def _key(path):
+        # A replaced or edited file gets a new key, so stale bytes are never sent
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+    # -- file access ---------------------------------------------------------
+
+    def open(self, path):
+        """File object for `path`: cached bytes for small files, a shared mapping otherwise"""
+        key = self._key(path)
+        name = os.path.basename(path)
+        size = key[1]
+        if size <= self.small_file_limit:
+            return self._open_small(key, path, name)
+
+        with self._lock:
+            shared = self._maps.get(key)
+            if shared is None:
+                with open(path, 'rb') as f:
+                    shared = self._maps[key] = _SharedMap(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), size)
+                self.stats["mapped"] += 1
+            shared.users += 1
+        return MappedReader(shared, name, lambda: self._release(key))
+
+    def _open_small(self, key, path, name):
+        with self._lock:
+            data = self._cache.pop(key, None)
+            if data is not None:
+                self._cache[key] = data
+                self.stats["cache_hits"] += 1
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+            with self._lock:
+                if key not in self._cache and len(data) <= self.cache_bytes:
+                    self._cache[key] = data
+                    self._cached_bytes += len(data)
+                    while self._cached_bytes > self.cache_bytes:
+                        evicted = self._cache.pop(next(iter(self._cache)))
+                        self._cached_bytes -= len(evicted)
+        # BytesIO shares the bytes object until written to
+        stream = io.BytesIO(data)
+        stream.name = name
+        return stream
+
+    def _release(self, key):
+        with self._lock:
+            shared = self._maps.get(key)
+            if shared is None:
+                return
+            shared.users -= 1
+            if shared.users <= 0:
+                # Unmapped as soon as nobody reads it, so the file can be deleted or replaced
+                del self._maps[key]
+                shared.map.close()
+
+    def forget(self, path):
+        """Drop cached bytes and upload handles of a file that is about to change"""
+        path = os.path.abspath(path)
+        with self._lock:
+            for key in [key for key in self._cache if key[0] == path]:
+                self._cached_bytes -= len(self._cache.pop(key))
+            for key in [key for key in self._handles if key[0] == path]:
+                del self._handles[key]
+
+    # -- uploads -------------------------------------------------------------
+
+    async def upload(self, client, path):
+        """Uploaded handle for `path`, shared with every other chat asking for it"""
+        key = self._key(path)
+        cached = self._handles.get(key)
+        if cached is not None and self.clock() - cached[1] < self.handle_ttl:
+            self.stats["reused"] += 1
+            return cached[0]
+
+        pending = self._uploads.get(key)
+        if pending is not None:
+            self.stats["reused"] += 1
+            return await asyncio.shield(pending)
+
+        future = self._uploads[key] = asyncio.get_running_loop().create_future()
+        try:
+            handle = await self._upload(client, path, key)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieved here so a failure nobody else waited for is not reported as unhandled
+            future.exception()
+            raise
+        else:
+            future.set_result(handle)
+            self._remember(key, handle)
+            return handle
+        finally:
+            del self._uploads[key]
+
+    def _remember(self, key, handle):
+        now = self.clock()
+        for old_key in [k for k, (_, uploaded) in self._handles.items() if now - uploaded >= self.handle_ttl]:
+            del self._handles[old_key]
+        self._handles[key] = (handle, now)
+
+    async def _upload(self, client, path, key):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        async with self._semaphore:
+            stream = self.open(path)
+            try:
+                handle = await client.upload_file(stream, file_size=key[1], file_name=stream.name,
+                                                  part_size_kb=self.chunk_size // 1024)
+            finally:
+                stream.close()
+        self.stats["uploads"] += 1
+        self.stats["bytes_uploaded"] += key[1]
+        return handle
+
+    async def send_file(self, client, chat_id, path, **kwargs):
+        """Send `path` to a chat (caption, voice_note, ... as for client.send_file)"""
+        handle = await self.upload(client, path)
+        return await client.send_file(chat_id, handle, **kwargs)
+
+    def info(self):
+        with self._lock:
+            return {"cached_files": len(self._cache), "cached_bytes": self._cached_bytes,
+                    "mapped_files": len(self._maps), "uploading": len(self._uploads), **self.stats}
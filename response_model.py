@@ -0,0 +1,160 @@
+# response_model.py - Compact in-memory representation of the response set
+
+import sys
+import json
+from array import array
+
+# Interned type tags; unknown types get a tag appended at runtime
+TYPE_TAGS = ["text", "image", "audio", "flow"]
+_DELETED = 255
+_NO_CAPTION = -1
+# Row flags: content was a list; values (content and caption) are stored as JSON
+_LIST = 1
+_JSON = 2
+
+
+class StringBuffer:
+    """Append-only UTF-8 string storage in one contiguous buffer"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def append(self, text):
+        self.data += text.encode('utf-8')
+        self.offsets.append(len(self.data))
+        return len(self.offsets) - 2
+
+    def __getitem__(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+    def nbytes(self):
+        return len(self.data) + self.offsets.itemsize * len(self.offsets)
+
+
+class CompactResponseSet:
+    """Column-oriented response set with O(1) keyword lookup.
+
+    Each response is one row: a type tag, a slice of the shared string
+    buffer for its content, and an optional caption string id. Rows are only
+    materialized as dicts when a caller asks for one.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._types = array('B')
+        self._content_start = array('L')
+        self._content_count = array('L')
+        self._content_flags = array('B')
+        self._caption = array('l')
+        self._strings = StringBuffer()
+        self._type_tags = list(TYPE_TAGS)
+        self._dead_rows = 0
+
+    @classmethod
+    def from_items(cls, items):
+        responses = cls()
+        for keyword, data in items:
+            responses.put(keyword, data)
+        return responses
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, keyword):
+        return keyword in self._ids
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def _type_tag(self, response_type):
+        try:
+            return self._type_tags.index(response_type)
+        except ValueError:
+            # Odd types (None, numbers) are kept as they are so the row round-trips
+            self._type_tags.append(sys.intern(response_type) if isinstance(response_type, str) else response_type)
+            return len(self._type_tags) - 1
+
+    def put(self, keyword, data):
+        """Insert or replace the response for `keyword`"""
+        content = data.get('content', [])
+        is_list = isinstance(content, list)
+        values = content if is_list else [content]
+        caption = data.get('caption')
+        # Rows with anything but strings are stored as JSON and decoded back unchanged
+        as_json = not all(isinstance(value, str) for value in values) or \
+            (caption is not None and not isinstance(caption, str))
+        encode = json.dumps if as_json else str
+
+        start = len(self._strings)
+        for value in values:
+            self._strings.append(encode(value))
+
+        if keyword in self._ids:
+            self._mark_dead(self._ids[keyword])
+        self._ids[keyword] = len(self._types)
+        self._types.append(self._type_tag(data.get('type', 'text')))
+        self._content_start.append(start)
+        self._content_count.append(len(values))
+        self._content_flags.append((_LIST if is_list else 0) | (_JSON if as_json else 0))
+        self._caption.append(self._strings.append(encode(caption)) if caption is not None else _NO_CAPTION)
+
+    def delete(self, keyword):
+        self._mark_dead(self._ids.pop(keyword))
+
+    def _mark_dead(self, row):
+        self._types[row] = _DELETED
+        self._dead_rows += 1
+
+    def get(self, keyword, default=None):
+        """Return the response for `keyword` as a dict"""
+        row = self._ids.get(keyword)
+        if row is None:
+            return default
+        return self._row(row)
+
+    def __getitem__(self, keyword):
+        return self._row(self._ids[keyword])
+
+    def type_of(self, keyword):
+        return self._type_tags[self._types[self._ids[keyword]]]
+
+    def _row(self, row):
+        start = self._content_start[row]
+        flags = self._content_flags[row]
+        decode = json.loads if flags & _JSON else str
+        values = [decode(self._strings[i]) for i in range(start, start + self._content_count[row])]
+        data = {
+            "type": self._type_tags[self._types[row]],
+            "content": values if flags & _LIST else values[0],
+        }
+        if self._caption[row] != _NO_CAPTION:
+            data["caption"] = decode(self._strings[self._caption[row]])
+        return data
+
+    def dead_rows(self):
+        return self._dead_rows
+
+    def keywords(self):
+        return list(self._ids)
+
+    def items(self):
+        for keyword, row in self._ids.items():
+            yield keyword, self._row(row)
+
+    def compact(self):
+        """Rewrite the columns without rows left behind by edits and deletes"""
+        if self._dead_rows:
+            fresh = CompactResponseSet.from_items(list(self.items()))
+            self.__dict__.update(fresh.__dict__)
+
+    def nbytes(self):
+        """Approximate memory used by the columns, buffers and keyword index"""
+        columns = (self._types, self._content_start, self._content_count, self._content_flags, self._caption)
+        total = sum(col.itemsize * len(col) for col in columns)
+        total += self._strings.nbytes()
+        total += sys.getsizeof(self._ids) + sum(sys.getsizeof(k) for k in self._ids)
+        return total
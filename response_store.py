@@ -0,0 +1,414 @@
+# response_store.py - Storage backends for bot responses (JSON file or SQLite)
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import itertools
+import threading
+from json.encoder import encode_basestring_ascii as _encode_string
+
+from response_model import CompactResponseSet
+
+RESPONSES_BACKEND_ENV = "RESPONSES_BACKEND"
+DEFAULT_PAGE_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+def iter_json_object(f, chunk_size=64 * 1024):
+    """Yield (key, value) pairs of a top-level JSON object without loading it whole"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    def decode():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # A value ending exactly at the buffer edge may be truncated (e.g. a number)
+                if end < len(buffer) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            fill()
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] != "{":
+        raise ValueError("Responses file must contain a JSON object")
+    pos += 1
+
+    while True:
+        skip_whitespace()
+        if buffer[pos:pos + 1] == "}":
+            return
+        if buffer[pos:pos + 1] == ",":
+            pos += 1
+            skip_whitespace()
+        key = decode()
+        skip_whitespace()
+        if buffer[pos:pos + 1] != ":":
+            raise ValueError(f"Expected ':' after key {key!r}")
+        pos += 1
+        skip_whitespace()
+        yield key, decode()
+
+
+RESPONSE_TYPES = ("text", "image", "audio", "flow")
+MAX_FLOW_STEPS = 255
+
+
+def validate_response(data):
+    """Check a response dict; raises ValueError describing the first problem"""
+    if not isinstance(data, dict):
+        raise ValueError("response must be an object")
+    response_type = data.get('type')
+    if response_type not in RESPONSE_TYPES:
+        raise ValueError(f"unknown type: {response_type!r}")
+    content = data.get('content')
+    if response_type == "text":
+        if not isinstance(content, list) or not content or not all(isinstance(c, str) for c in content):
+            raise ValueError("text content must be a non-empty list of strings")
+    elif response_type == "flow":
+        if not isinstance(content, list) or len(content) < 2 or not all(isinstance(c, str) for c in content):
+            raise ValueError("flow content must be a list of at least two prompts")
+        if len(content) > MAX_FLOW_STEPS:
+            raise ValueError(f"a flow can have at most {MAX_FLOW_STEPS} steps")
+    elif not isinstance(content, str) or not content:
+        raise ValueError(f"{response_type} content must be a file name")
+    if data.get('caption') is not None and not isinstance(data['caption'], str):
+        raise ValueError("caption must be a string")
+
+
+def _indented_json(value, indent):
+    """json.dumps(value, indent=4) output nested at `indent`.
+
+    json only uses its C encoder without indent, so the layout is produced
+    here and just the leaves go through the (C) string encoder.
+    """
+    if isinstance(value, str):
+        return _encode_string(value)
+    if isinstance(value, dict):
+        if not value:
+            return "{}"
+        inner = indent + "    "
+        return "{\n" + ",\n".join(f"{inner}{_encode_string(str(k))}: {_indented_json(v, inner)}"
+                                   for k, v in value.items()) + f"\n{indent}}}"
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return "[]"
+        inner = indent + "    "
+        return "[\n" + ",\n".join(inner + _indented_json(v, inner) for v in value) + f"\n{indent}]"
+    return json.dumps(value)
+
+
+def write_json_object(f, items):
+    """Write (key, value) pairs as a JSON object, formatted like json.dump(indent=4)"""
+    f.write("{")
+    first = True
+    for key, value in items:
+        f.write("\n    " if first else ",\n    ")
+        f.write(_encode_string(key))
+        f.write(": ")
+        f.write(_indented_json(value, "    "))
+        first = False
+    f.write("\n}" if not first else "}")
+
+
+class JsonResponseStore:
+    """Responses kept in a single JSON file (the original format)"""
+
+    backend = "json"
+    # Every bulk_apply rewrites the whole file, so imports commit in large batches
+    bulk_batch_size = 250000
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._cache = None
+        self._cache_stamp = None
+
+    def _load(self):
+        stat = os.stat(self.path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        if self._cache is None or stamp != self._cache_stamp:
+            # Parsed straight into the compact model, never as one big dict
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._cache = CompactResponseSet.from_items(iter_json_object(f))
+            self._cache_stamp = stamp
+        return self._cache
+
+    def _save(self, responses):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            write_json_object(f, responses.items())
+        os.replace(tmp_path, self.path)
+        stat = os.stat(self.path)
+        self._cache_stamp = (stat.st_size, stat.st_mtime_ns)
+
+    def _modify(self, change):
+        with self._lock:
+            responses = self._load()
+            try:
+                change(responses)
+                self._save(responses)
+            except Exception:
+                # Cached set may no longer match the file; reload next time
+                self._cache = None
+                raise
+            if responses.dead_rows() > len(responses):
+                responses.compact()
+
+    def get(self, keyword):
+        with self._lock:
+            return self._load().get(keyword)
+
+    def put(self, keyword, data):
+        self._modify(lambda responses: responses.put(keyword, data))
+
+    def delete(self, keyword):
+        self._modify(lambda responses: responses.delete(keyword))
+
+    def bulk_apply(self, upserts=(), deletes=()):
+        """Apply many upserts and deletes with a single rewrite of the file"""
+        def change(responses):
+            for keyword, data in upserts:
+                responses.put(keyword, data)
+            for keyword in deletes:
+                if keyword in responses:
+                    responses.delete(keyword)
+        self._modify(change)
+
+    def count(self, search=None, response_type=None):
+        with self._lock:
+            if search is None and response_type is None:
+                return len(self._load())
+            # Under the lock: _modify changes the cached set in place
+            return sum(1 for _ in self._filtered(search, response_type))
+
+    def keywords(self):
+        with self._lock:
+            return list(self._load())
+
+    def items(self):
+        with self._lock:
+            responses = self._load()
+            keywords = responses.keywords()
+        # One stat per call; rows are read from the set loaded above
+        for keyword in keywords:
+            with self._lock:
+                data = responses.get(keyword)
+            if data is not None:
+                yield keyword, data
+
+    def page(self, offset=0, limit=DEFAULT_PAGE_SIZE, search=None, response_type=None):
+        """Return one page of (keyword, data) pairs"""
+        with self._lock:
+            return list(itertools.islice(self._filtered(search, response_type), offset, offset + limit))
+
+    def _filtered(self, search, response_type):
+        needle = search.casefold() if search else None
+        for keyword, data in self._load().items():
+            if response_type and data.get('type') != response_type:
+                continue
+            if needle and needle not in keyword.casefold():
+                continue
+            yield keyword, data
+
+    def close(self):
+        pass
+
+
+class SqliteResponseStore:
+    """Responses kept in SQLite (WAL mode) with indexed, paged lookups"""
+
+    backend = "sqlite"
+    bulk_batch_size = 5000
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            keyword TEXT PRIMARY KEY,
+            type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            caption TEXT,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_keyword_nocase ON responses(keyword COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_responses_type ON responses(type);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TRIGGER IF NOT EXISTS responses_rev_insert AFTER INSERT ON responses
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'revision'; END;
+        CREATE TRIGGER IF NOT EXISTS responses_rev_update AFTER UPDATE ON responses
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'revision'; END;
+        CREATE TRIGGER IF NOT EXISTS responses_rev_delete AFTER DELETE ON responses
+            BEGIN UPDATE meta SET value = value + 1 WHERE key = 'revision'; END;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        conn = self._conn()
+        with conn:
+            conn.executescript(self.SCHEMA)
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('db_id', ?)", (uuid.uuid4().hex,))
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0)")
+
+    def _conn(self):
+        # One connection per thread; WAL lets the GUI and bot threads read concurrently
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or conn not in self._connections:
+            # close() may be called from another thread, hence check_same_thread=False
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._connections_lock:
+                self._connections.add(conn)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_data(response_type, content, caption):
+        data = {"type": response_type, "content": json.loads(content)}
+        if caption is not None:
+            data["caption"] = caption
+        return data
+
+    @staticmethod
+    def _data_to_row(keyword, data):
+        return (keyword, data.get('type', 'text'), json.dumps(data.get('content', [])),
+                data.get('caption'), time.time())
+
+    def get(self, keyword):
+        row = self._conn().execute(
+            "SELECT type, content, caption FROM responses WHERE keyword = ?", (keyword,)).fetchone()
+        return self._row_to_data(*row) if row else None
+
+    def put(self, keyword, data):
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                         self._data_to_row(keyword, data))
+
+    def delete(self, keyword):
+        with self._conn() as conn:
+            cursor = conn.execute("DELETE FROM responses WHERE keyword = ?", (keyword,))
+        if cursor.rowcount == 0:
+            raise KeyError(keyword)
+
+    def bulk_apply(self, upserts=(), deletes=()):
+        """Apply many upserts and deletes in one transaction"""
+        with self._conn() as conn:
+            conn.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                             (self._data_to_row(keyword, data) for keyword, data in upserts))
+            conn.executemany("DELETE FROM responses WHERE keyword = ?", ((keyword,) for keyword in deletes))
+
+    def _where(self, search, response_type):
+        clauses, params = [], []
+        if search:
+            clauses.append("keyword LIKE ? ESCAPE '\\' COLLATE NOCASE")
+            escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        if response_type:
+            clauses.append("type = ?")
+            params.append(response_type)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def count(self, search=None, response_type=None):
+        where, params = self._where(search, response_type)
+        return self._conn().execute(f"SELECT COUNT(*) FROM responses{where}", params).fetchone()[0]
+
+    def keywords(self):
+        for (keyword,) in self._conn().execute("SELECT keyword FROM responses ORDER BY rowid"):
+            yield keyword
+
+    def items(self):
+        for keyword, response_type, content, caption in self._conn().execute(
+                "SELECT keyword, type, content, caption FROM responses ORDER BY rowid"):
+            yield keyword, self._row_to_data(response_type, content, caption)
+
+    def page(self, offset=0, limit=DEFAULT_PAGE_SIZE, search=None, response_type=None):
+        """Return one page of (keyword, data) pairs"""
+        where, params = self._where(search, response_type)
+        rows = self._conn().execute(
+            f"SELECT keyword, type, content, caption FROM responses{where} "
+            "ORDER BY keyword COLLATE NOCASE LIMIT ? OFFSET ?", params + [limit, offset])
+        return [(keyword, self._row_to_data(t, c, cap)) for keyword, t, c, cap in rows]
+
+    def revision(self):
+        """Identifier that changes whenever the response set changes"""
+        rows = dict(self._conn().execute("SELECT key, value FROM meta WHERE key IN ('db_id', 'revision')"))
+        return f"sqlite:{rows['db_id']}:{rows['revision']}"
+
+    def close(self):
+        """Close the connections of every thread that used the store"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, set()
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to close responses database connection: {e}")
+        self._local.conn = None
+
+
+def migrate_json_to_sqlite(json_path, db_path, batch_size=1000):
+    """Stream responses from the JSON file into a new SQLite database; returns the row count"""
+    # Build under a temporary name so an interrupted migration is simply redone
+    tmp_path = db_path + ".migrating"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    store = SqliteResponseStore(tmp_path)
+    conn = store._conn()
+    conn.execute("PRAGMA journal_mode=DELETE")
+
+    total = 0
+    with open(json_path, 'r', encoding='utf-8') as f:
+        pairs = iter_json_object(f)
+        while True:
+            batch = [SqliteResponseStore._data_to_row(k, d) for k, d in itertools.islice(pairs, batch_size)]
+            if not batch:
+                break
+            with conn:
+                conn.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", batch)
+            total += len(batch)
+
+    store.close()
+    os.replace(tmp_path, db_path)
+    return total
+
+
+def open_response_store(responses_file, backend=None):
+    """Open the configured response store, migrating responses.json to SQLite on first use"""
+    backend = backend or os.getenv(RESPONSES_BACKEND_ENV, "json")
+    if backend != "sqlite":
+        return JsonResponseStore(responses_file)
+
+    db_path = os.path.splitext(responses_file)[0] + ".db"
+    if not os.path.exists(db_path) and os.path.exists(responses_file):
+        total = migrate_json_to_sqlite(responses_file, db_path)
+        logger.info(f"Migrated {total} responses from {responses_file} to {db_path}")
+    return SqliteResponseStore(db_path)
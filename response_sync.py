@@ -0,0 +1,509 @@
+# response_sync.py - Delta replication of responses and media between installations
+
+import os
+import re
+import sys
+import json
+import uuid
+import base64
+import socket
+import hashlib
+import logging
+import secrets
+import argparse
+import threading
+import socketserver
+
+from response_store import validate_response
+
+SYNC_STATE_FILE = "sync_state.json"
+SYNC_TOKEN_FILE = "sync_peer.token"
+SYNC_PEER_PORT = int(os.getenv("SYNC_PEER_PORT", "8767"))
+# Replica ids and blob digests become path parts in a shared folder
+_REPLICA_RE = re.compile(r"^[0-9a-f]{32}$")
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def response_hash(data, blob=None):
+    """Fingerprint of a response (and its media bytes) used to spot local edits"""
+    encoded = json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha1(encoded + (blob or "").encode('ascii')).hexdigest()[:20]
+
+
+def newer(version, other):
+    """Whether `version` beats `other`; (counter, replica) pairs, so every replica picks the same winner"""
+    return other is None or tuple(version) > tuple(other)
+
+
+# -- transports ----------------------------------------------------------------
+
+class MemoryTransport:
+    """Change log and blob store held in memory; the stand-in peer for tests"""
+
+    def __init__(self):
+        self.logs = {}     # replica -> [batch of entries]
+        self.blobs = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+    def append(self, replica, entries):
+        """Add a batch of changes from `replica`; returns its sequence number"""
+        with self._lock:
+            batches = self.logs.setdefault(replica, [])
+            batches.append(json.loads(json.dumps(entries)))
+            self.bytes_sent += len(json.dumps(entries))
+            return len(batches)
+
+    def read(self, replica, cursors):
+        """[(peer, seq, entries)] of batches from other replicas newer than `cursors`"""
+        with self._lock:
+            found = []
+            for peer, batches in self.logs.items():
+                if peer == replica:
+                    continue
+                for seq in range(cursors.get(peer, 0) + 1, len(batches) + 1):
+                    found.append((peer, seq, batches[seq - 1]))
+                    self.bytes_received += len(json.dumps(batches[seq - 1]))
+            return found
+
+    def has_blob(self, digest):
+        return digest in self.blobs
+
+    def put_blob(self, digest, data):
+        self.blobs[digest] = bytes(data)
+        self.bytes_sent += len(data)
+
+    def get_blob(self, digest):
+        data = self.blobs.get(digest)
+        if data is not None:
+            self.bytes_received += len(data)
+        return data
+
+    def close(self):
+        pass
+
+
+class FolderTransport:
+    """Change log and blobs in a shared folder (network share, synced drive).
+
+    Every replica appends numbered batch files under log/<replica>/ and never
+    touches another replica's files, so concurrent writers need no locking.
+    Media blobs are stored once under blobs/ by content hash.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        os.makedirs(os.path.join(root, "log"), exist_ok=True)
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.bytes_sent += len(data)
+
+    def _batches(self, replica):
+        directory = os.path.join(self.root, "log", replica)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return {}
+        return {int(name[:-6]): os.path.join(directory, name) for name in names if name.endswith(".jsonl")}
+
+    def append(self, replica, entries):
+        if not _REPLICA_RE.match(replica):
+            raise ValueError(f"invalid replica id: {replica!r}")
+        os.makedirs(os.path.join(self.root, "log", replica), exist_ok=True)
+        seq = max(self._batches(replica), default=0) + 1
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode('utf-8')
+        self._write(os.path.join(self.root, "log", replica, f"{seq:010d}.jsonl"), data)
+        return seq
+
+    def read(self, replica, cursors):
+        found = []
+        for peer in sorted(os.listdir(os.path.join(self.root, "log"))):
+            if peer == replica or not _REPLICA_RE.match(peer):
+                continue
+            for seq, path in sorted(self._batches(peer).items()):
+                if seq <= cursors.get(peer, 0):
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+                self.bytes_received += len(data)
+                found.append((peer, seq, [json.loads(line) for line in data.decode('utf-8').splitlines() if line]))
+        return found
+
+    def _blob_path(self, digest):
+        if not _DIGEST_RE.match(digest):
+            raise ValueError(f"invalid blob digest: {digest!r}")
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    def has_blob(self, digest):
+        return os.path.exists(self._blob_path(digest))
+
+    def put_blob(self, digest, data):
+        os.makedirs(os.path.dirname(self._blob_path(digest)), exist_ok=True)
+        self._write(self._blob_path(digest), data)
+
+    def get_blob(self, digest):
+        try:
+            with open(self._blob_path(digest), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self.bytes_received += len(data)
+        return data
+
+    def close(self):
+        pass
+
+
+class SocketTransport:
+    """Client for a PeerServer: the same calls as a transport, as JSON lines over TCP"""
+
+    def __init__(self, host, port, token, timeout=30.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.stream = self.sock.makefile('rwb')
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._call("hello", token=token)
+
+    def _call(self, op, **args):
+        request = json.dumps({"op": op, **args}).encode('utf-8') + b"\n"
+        self.stream.write(request)
+        self.stream.flush()
+        line = self.stream.readline()
+        self.bytes_sent += len(request)
+        self.bytes_received += len(line)
+        if not line:
+            raise ConnectionError("sync peer closed the connection")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise ConnectionError(f"sync peer: {reply['error']}")
+        return reply.get("result")
+
+    def append(self, replica, entries):
+        return self._call("append", replica=replica, entries=entries)
+
+    def read(self, replica, cursors):
+        return [tuple(batch) for batch in self._call("read", replica=replica, cursors=cursors)]
+
+    def has_blob(self, digest):
+        return self._call("has_blob", digest=digest)
+
+    def put_blob(self, digest, data):
+        self._call("put_blob", digest=digest, data=base64.b64encode(data).decode('ascii'))
+
+    def get_blob(self, digest):
+        data = self._call("get_blob", digest=digest)
+        return base64.b64decode(data) if data is not None else None
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            self.sock.close()
+
+
+class _PeerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        transport = self.server.transport
+        authorized = False
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                op = request.pop("op", None)
+                if not authorized:
+                    if op != "hello" or not secrets.compare_digest(str(request.get("token", "")), self.server.token):
+                        self._reply({"error": "unauthorized"})
+                        return
+                    authorized = True
+                    result = None
+                elif op == "put_blob":
+                    data = base64.b64decode(request["data"])
+                    if content_hash(data) != request["digest"]:
+                        raise ValueError("blob does not match its hash")
+                    result = transport.put_blob(request["digest"], data)
+                elif op == "get_blob":
+                    data = transport.get_blob(request["digest"])
+                    result = base64.b64encode(data).decode('ascii') if data is not None else None
+                elif op in ("append", "read", "has_blob"):
+                    result = getattr(transport, op)(**request)
+                else:
+                    raise ValueError(f"unknown op: {op}")
+            except (ValueError, KeyError, TypeError, OSError) as e:
+                self._reply({"error": str(e)})
+                continue
+            self._reply({"result": result})
+
+    def _reply(self, message):
+        self.wfile.write(json.dumps(message).encode('utf-8') + b"\n")
+        self.wfile.flush()
+
+
+class PeerServer(socketserver.ThreadingTCPServer):
+    """Serves a transport (usually this machine's FolderTransport) to other installations"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, transport, host="127.0.0.1", port=SYNC_PEER_PORT, token_file=SYNC_TOKEN_FILE):
+        super().__init__((host, port), _PeerHandler)
+        self.transport = transport
+        self.token = secrets.token_hex(16)
+        self.token_file = token_file
+        with open(token_file, 'w') as f:
+            f.write(f"{self.server_address[1]}\n{self.token}\n")
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.token_file):
+            os.remove(self.token_file)
+
+
+# -- replication ---------------------------------------------------------------
+
+class SyncState:
+    """What this installation last agreed with the others, kept in SYNC_STATE_FILE"""
+
+    def __init__(self, path=SYNC_STATE_FILE):
+        self.path = path
+        state = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        self.replica = state.get("replica") or uuid.uuid4().hex
+        self.clock = state.get("clock", 0)
+        self.cursors = state.get("cursors", {})
+        self.versions = state.get("versions", {})   # keyword -> [counter, replica, response hash]
+        self.media = state.get("media", {})         # path -> [size, mtime_ns, blob hash]
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"replica": self.replica, "clock": self.clock, "cursors": self.cursors,
+                       "versions": self.versions, "media": self.media}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class ResponseSync:
+    """Exchanges per-keyword changes with other installations through a transport.
+
+    Local edits are found by comparing each response's fingerprint with the
+    one recorded at the last sync and get a Lamport version (counter,
+    replica id); deletes become tombstones. Incoming changes are applied
+    only when their version is higher, so every installation settles on the
+    same winner for concurrent edits. Media files travel once, as blobs named
+    by content hash, and only when the receiving side lacks them.
+    """
+
+    def __init__(self, store, transport, media_dirs=None, state=None):
+        self.store = store
+        self.transport = transport
+        self.media_dirs = media_dirs or {}
+        self.state = state or SyncState()
+
+    def _blob_of(self, data):
+        """Content hash of the media file a response points to, cached by size and mtime"""
+        directory = self.media_dirs.get(data.get("type"))
+        if directory is None or not isinstance(data.get("content"), str):
+            return None
+        path = os.path.join(directory, data["content"])
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        cached = self.state.media.get(path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        with open(path, 'rb') as f:
+            digest = content_hash(f.read())
+        self.state.media[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def local_changes(self):
+        """Entries for responses edited, added or deleted here since the last sync"""
+        state = self.state
+        counter = state.clock + 1
+        entries = []
+        seen = set()
+        for keyword, data in self.store.items():
+            seen.add(keyword)
+            blob = self._blob_of(data)
+            fingerprint = response_hash(data, blob)
+            known = state.versions.get(keyword)
+            if known is None or known[2] != fingerprint:
+                state.versions[keyword] = [counter, state.replica, fingerprint]
+                entries.append({"k": keyword, "v": [counter, state.replica], "d": data, "b": blob})
+        for keyword, known in list(state.versions.items()):
+            if keyword not in seen and known[2] is not None:
+                state.versions[keyword] = [counter, state.replica, None]
+                entries.append({"k": keyword, "v": [counter, state.replica], "d": None, "b": None})
+        if entries:
+            state.clock = counter
+        return entries
+
+    def _fetch_media(self, entry, summary):
+        """True if the entry can be applied, False if it never can, None if its media is not available yet"""
+        data, digest = entry["d"], entry["b"]
+        directory = self.media_dirs.get(data.get("type"))
+        if directory is None or digest is None:
+            return True
+        if os.path.basename(data["content"]) != data["content"]:
+            summary["errors"].append(f"{entry['k']}: media name must be a plain file name")
+            return False
+        path = os.path.join(directory, data["content"])
+        if self._blob_of(data) == digest:
+            return True
+        blob = self.transport.get_blob(digest)
+        if blob is None or content_hash(blob) != digest:
+            summary["errors"].append(f"{entry['k']}: media {data['content']} not available yet, retrying next sync")
+            return None
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".sync.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+        return True
+
+    def pull(self, summary, local_keywords=(), agreed=None):
+        """Apply newer changes from the other replicas; returns the number applied.
+
+        Keywords whose remote content already equals the local one are added
+        to `agreed`: nothing to apply, and nothing to send back.
+        """
+        state = self.state
+        upserts, deletes = {}, set()
+        agreed = set() if agreed is None else agreed
+        # Peers with an entry waiting for its media; their cursor stays put so it is read again
+        stalled = set()
+        for peer, seq, entries in self.transport.read(state.replica, state.cursors):
+            for entry in entries:
+                keyword, version = entry["k"], entry["v"]
+                state.clock = max(state.clock, version[0])
+                known = state.versions.get(keyword)
+                fingerprint = response_hash(entry["d"], entry["b"]) if entry["d"] is not None else None
+                if known and known[2] == fingerprint and keyword not in upserts and keyword not in deletes:
+                    # Same content on both sides (e.g. the first sync of copied installations)
+                    if newer(version, known[:2]):
+                        state.versions[keyword] = [version[0], version[1], fingerprint]
+                    agreed.add(keyword)
+                    continue
+                agreed.discard(keyword)
+                if keyword in local_keywords:
+                    # Edited here and there since the last sync; the version decides
+                    summary["conflicts"] += 1
+                if not newer(version, known[:2] if known else None):
+                    continue
+                if entry["d"] is None:
+                    deletes.add(keyword)
+                    upserts.pop(keyword, None)
+                    state.versions[keyword] = [version[0], version[1], None]
+                    continue
+                try:
+                    validate_response(entry["d"])
+                except ValueError as e:
+                    summary["errors"].append(f"{keyword}: {e}")
+                    continue
+                fetched = self._fetch_media(entry, summary)
+                if fetched is None:
+                    stalled.add(peer)
+                if not fetched:
+                    continue
+                upserts[keyword] = entry["d"]
+                deletes.discard(keyword)
+                state.versions[keyword] = [version[0], version[1], None]
+            # Entries applied from a batch read again are older than what they set, so they are skipped
+            if peer not in stalled:
+                state.cursors[peer] = seq
+
+        if upserts or deletes:
+            existing = [keyword for keyword in deletes if self.store.get(keyword) is not None]
+            self.store.bulk_apply(list(upserts.items()), existing)
+            # Fingerprint what the store kept, so the next scan does not send it back
+            for keyword in upserts:
+                data = self.store.get(keyword)
+                state.versions[keyword][2] = response_hash(data, self._blob_of(data))
+        return len(upserts) + len(deletes)
+
+    def push(self, entries):
+        """Publish local changes, uploading media the other side does not have yet"""
+        if not entries:
+            return 0
+        for entry in entries:
+            digest = entry["b"]
+            if digest and not self.transport.has_blob(digest):
+                path = os.path.join(self.media_dirs[entry["d"]["type"]], entry["d"]["content"])
+                with open(path, 'rb') as f:
+                    self.transport.put_blob(digest, f.read())
+        self.transport.append(self.state.replica, entries)
+        return len(entries)
+
+    def sync(self):
+        """One round: record local edits, apply remote ones, publish the local ones that still win"""
+        summary = {"pushed": 0, "pulled": 0, "conflicts": 0, "errors": []}
+        sent, received = self.transport.bytes_sent, self.transport.bytes_received
+        local = self.local_changes()
+        agreed = set()
+        summary["pulled"] = self.pull(summary, {entry["k"] for entry in local}, agreed)
+        # A local edit that lost to a newer remote one, or that the others already have, is not worth sending
+        local = [entry for entry in local
+                 if entry["k"] not in agreed and self.state.versions[entry["k"]][:2] == entry["v"]]
+        summary["pushed"] = self.push(local)
+        self.state.save()
+        summary["bytes_sent"] = self.transport.bytes_sent - sent
+        summary["bytes_received"] = self.transport.bytes_received - received
+        logger.info(f"Sync: pushed {summary['pushed']}, pulled {summary['pulled']}, "
+                    f"{summary['conflicts']} conflicts, {summary['bytes_sent']} bytes out, "
+                    f"{summary['bytes_received']} bytes in")
+        return summary
+
+
+def open_transport(target, token=None):
+    """FolderTransport for a directory, SocketTransport for host:port.
+
+    Without `token` the peer's token is read from SYNC_TOKEN_FILE, which only
+    exists when the peer runs on this machine.
+    """
+    if os.path.isdir(target):
+        return FolderTransport(target)
+    host, _, port = target.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"not a folder or host:port: {target}")
+    if not token:
+        with open(SYNC_TOKEN_FILE, 'r') as f:
+            token = f.read().split()[1]
+    return SocketTransport(host or "127.0.0.1", int(port), token)
+
+
+def main(argv=None):
+    """Serve a shared sync folder to other installations over a socket"""
+    parser = argparse.ArgumentParser(description="Serve a response sync folder to peers")
+    parser.add_argument("folder", help="Folder holding the change log and media blobs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=SYNC_PEER_PORT)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = PeerServer(FolderTransport(args.folder), args.host, args.port)
+    logger.info(f"Sync peer serving {args.folder} on {args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
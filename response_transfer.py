@@ -0,0 +1,191 @@
+# response_transfer.py - Streaming CSV/JSONL import and export of responses
+
+import os
+import csv
+import json
+import logging
+
+from response_store import validate_response
+
+CSV_FIELDS = ("keyword", "type", "content", "caption")
+MAX_REPORTED_ERRORS = 100
+
+logger = logging.getLogger(__name__)
+
+
+class TransferCancelled(Exception):
+    """Raised inside a transfer when its cancel event is set"""
+
+
+def transfer_format(path):
+    """'csv' or 'jsonl', from the file extension"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ValueError(f"Unsupported file type: {ext or path} (use .csv or .jsonl)")
+
+
+def response_to_record(keyword, data):
+    """Flat record used by both file formats"""
+    record = {"keyword": keyword, "type": data.get("type"), "content": data.get("content")}
+    if data.get("caption"):
+        record["caption"] = data["caption"]
+    return record
+
+
+def record_to_response(record):
+    """(keyword, response data) from a flat record; raises ValueError if it is invalid"""
+    keyword = str(record.get("keyword") or "").strip()
+    if not keyword:
+        raise ValueError("missing keyword")
+    data = {"type": (record.get("type") or "").strip(), "content": record.get("content")}
+    if record.get("caption"):
+        data["caption"] = record["caption"]
+    validate_response(data)
+    return keyword, data
+
+
+def _csv_rows(f):
+    reader = csv.DictReader(f)
+    missing = {"keyword", "type", "content"} - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"CSV header is missing: {', '.join(sorted(missing))}")
+    for row in reader:
+        # Text replies and flow prompts are stored one per line inside the quoted cell
+        if (row.get("type") or "").strip() in ("text", "flow"):
+            row["content"] = [line.strip() for line in (row["content"] or "").splitlines() if line.strip()]
+        yield row
+
+
+def _jsonl_rows(f):
+    for line in f:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                # Reported against its line; the rest of the file still imports
+                yield ValueError(f"invalid JSON: {e}")
+
+
+def _media_index(media_dirs):
+    """{type: set of file names} so references are checked without a stat per row"""
+    index = {}
+    for response_type, directory in (media_dirs or {}).items():
+        try:
+            index[response_type] = {name for name in os.listdir(directory)
+                                    if os.path.isfile(os.path.join(directory, name))}
+        except OSError:
+            index[response_type] = set()
+    return index
+
+
+def import_responses(store, path, media_dirs=None, batch_size=None, progress=None, cancel=None,
+                     progress_every=5000):
+    """Stream responses from a CSV or JSONL file into `store`.
+
+    Rows are validated as they are read (including that media files exist in
+    `media_dirs`, a {type: directory} map) and committed with bulk_apply in
+    batches. `progress(done_bytes, total_bytes)` is called every
+    `progress_every` rows; setting `cancel` (a threading.Event) is noticed as
+    often and stops the import, keeping batches already committed. Returns a
+    summary dict.
+    """
+    fmt = transfer_format(path)
+    batch_size = batch_size or store.bulk_batch_size
+    media = _media_index(media_dirs)
+    total_bytes = os.path.getsize(path)
+    summary = {"imported": 0, "skipped": 0, "errors": [], "cancelled": False}
+
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        rows = _csv_rows(f) if fmt == "csv" else _jsonl_rows(f)
+        batch = {}
+        for row_no, row in enumerate(rows, 1):
+            # Checked per row count, not per batch: a JSON store's batch can hold the whole file
+            if row_no % progress_every == 0:
+                if cancel is not None and cancel.is_set():
+                    summary["cancelled"] = True
+                    return summary
+                if progress:
+                    progress(_position(f, total_bytes), total_bytes)
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                keyword, data = record_to_response(row)
+                if data["type"] in media and data["content"] not in media[data["type"]]:
+                    raise ValueError(f"{data['type']} file not found: {data['content']}")
+            except (ValueError, AttributeError, TypeError) as e:
+                summary["skipped"] += 1
+                if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+                    summary["errors"].append(f"row {row_no}: {e}")
+                continue
+
+            batch[keyword] = data
+            if len(batch) >= batch_size:
+                store.bulk_apply(list(batch.items()))
+                summary["imported"] += len(batch)
+                batch = {}
+
+        if batch:
+            if cancel is not None and cancel.is_set():
+                summary["cancelled"] = True
+                return summary
+            store.bulk_apply(list(batch.items()))
+            summary["imported"] += len(batch)
+
+    if progress:
+        progress(total_bytes, total_bytes)
+    logger.info(f"Imported {summary['imported']} responses from {path} ({summary['skipped']} skipped)")
+    return summary
+
+
+def _position(f, total_bytes):
+    # Text files refuse tell() while being iterated; the buffer position is close enough
+    try:
+        return min(f.buffer.tell(), total_bytes)
+    except (AttributeError, OSError):
+        return 0
+
+
+def export_responses(store, path, progress=None, cancel=None, progress_every=5000):
+    """Stream every response in `store` to a CSV or JSONL file.
+
+    Writes to a temporary file that replaces `path` only when complete, so a
+    cancelled or failed export never leaves a truncated file behind.
+    `progress(done, total)` counts responses. Returns the number written, or
+    raises TransferCancelled.
+    """
+    fmt = transfer_format(path)
+    total = store.count()
+    temp_path = path + ".tmp"
+    written = 0
+    try:
+        with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, CSV_FIELDS) if fmt == "csv" else None
+            if writer:
+                writer.writeheader()
+            for keyword, data in store.items():
+                record = response_to_record(keyword, data)
+                if writer:
+                    if isinstance(record["content"], list):
+                        record["content"] = "\n".join(record["content"])
+                    writer.writerow(record)
+                else:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                written += 1
+                if written % progress_every == 0:
+                    if cancel is not None and cancel.is_set():
+                        raise TransferCancelled()
+                    if progress:
+                        progress(written, total)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    if progress:
+        progress(written, written)
+    logger.info(f"Exported {written} responses to {path}")
+    return written
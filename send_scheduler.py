@@ -0,0 +1,267 @@
+# send_scheduler.py - Flood-aware outgoing message scheduler for the bot
+
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_PRIVATE = 0
+PRIORITY_GROUP = 1
+PRIORITY_BULK = 2
+
+
+class TokenBucket:
+    """Classic token bucket; `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available (0 if one is available now)"""
+        now = self.clock()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self._refill(self.clock())
+        self.tokens -= 1
+
+    def block(self, seconds):
+        """Refuse tokens for `seconds` (server asked us to wait)"""
+        now = self.clock()
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+        self.updated = now
+
+
+class _SendJob:
+    __slots__ = ("chat_id", "priority", "is_private", "send", "key", "future", "attempts")
+
+    def __init__(self, chat_id, priority, is_private, send, key, future):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.is_private = is_private
+        self.send = send
+        self.key = key
+        self.future = future
+        self.attempts = 0
+
+
+def flood_wait_seconds(error):
+    """Seconds the server asked us to wait, or None if `error` is not a flood wait.
+
+    Telethon's FloodWaitError and SlowModeWaitError both carry `seconds`.
+    """
+    seconds = getattr(error, 'seconds', None)
+    return seconds if isinstance(seconds, (int, float)) else None
+
+
+class SendScheduler:
+    """Queues outgoing sends and releases them within Telegram's rate limits.
+
+    Sends are coroutine factories (e.g. ``lambda: client.send_message(chat, text)``).
+    Private chats are served before groups and bulk sends (broadcasts) after
+    both, each chat has its own bucket on top of the account-wide one, and
+    identical pending replies to the same chat are coalesced into a single send.
+    """
+
+    def __init__(self, global_rate=25.0, global_burst=30, private_rate=1.0, private_burst=3,
+                 group_rate=20 / 60, group_burst=3, max_attempts=3, max_tracked_chats=10000,
+                 clock=time.monotonic):
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock)
+        self.base_global_rate = global_rate
+        self.private_limits = (private_rate, private_burst)
+        self.group_limits = (group_rate, group_burst)
+        self.max_attempts = max_attempts
+        self.max_tracked_chats = max_tracked_chats
+
+        self._chat_buckets = {}
+        self._ready = []
+        self._delayed = []
+        self._pending = {}
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._in_flight = 0
+        self.stats = {"sent": 0, "coalesced": 0, "flood_waits": 0, "failed": 0}
+
+    def _bucket_for(self, chat_id, is_private):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self.max_tracked_chats:
+                self._prune_buckets()
+            rate, burst = self.private_limits if is_private else self.group_limits
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, burst, self.clock)
+        return bucket
+
+    def _prune_buckets(self):
+        # Buckets that have refilled completely carry no state worth keeping
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if bucket.delay() == 0 and bucket.tokens >= bucket.capacity:
+                del self._chat_buckets[chat_id]
+
+    def submit(self, chat_id, send, is_private=True, dedupe_key=None, bulk=False):
+        """Queue a send; returns a future with the send's result.
+
+        Bulk sends wait until no reply is ready to go.
+        """
+        key = (chat_id, dedupe_key) if dedupe_key is not None else None
+        if key is not None and key in self._pending:
+            self.stats["coalesced"] += 1
+            return self._pending[key].future
+
+        future = asyncio.get_running_loop().create_future()
+        priority = PRIORITY_BULK if bulk else PRIORITY_PRIVATE if is_private else PRIORITY_GROUP
+        job = _SendJob(chat_id, priority, is_private, send, key, future)
+        if key is not None:
+            self._pending[key] = job
+        heapq.heappush(self._ready, (job.priority, next(self._seq), job))
+        self._wake()
+        return future
+
+    def queued(self):
+        return len(self._ready) + len(self._delayed)
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _release_delayed(self):
+        now = self.clock()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, job = heapq.heappop(self._delayed)
+            heapq.heappush(self._ready, (job.priority, next(self._seq), job))
+
+    def _defer(self, job, seconds):
+        heapq.heappush(self._delayed, (self.clock() + seconds, next(self._seq), job))
+
+    def _finish(self, job):
+        if job.key is not None:
+            self._pending.pop(job.key, None)
+
+    async def run(self):
+        """Worker loop; run as a task on the bot's event loop"""
+        self._wakeup = asyncio.Event()
+        while True:
+            self._release_delayed()
+            if not self._ready:
+                timeout = self._delayed[0][0] - self.clock() if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            global_delay = self.global_bucket.delay()
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+
+            _, _, job = heapq.heappop(self._ready)
+            chat_delay = self._bucket_for(job.chat_id, job.is_private).delay()
+            if chat_delay > 0:
+                # Park this chat and serve whoever is next
+                self._defer(job, chat_delay)
+                continue
+
+            await self._send(job)
+
+    async def _send(self, job):
+        self.global_bucket.take()
+        self._bucket_for(job.chat_id, job.is_private).take()
+        job.attempts += 1
+        self._in_flight += 1
+        try:
+            result = await job.send()
+        except asyncio.CancelledError:
+            self._finish(job)
+            job.future.cancel()
+            raise
+        except Exception as e:
+            seconds = flood_wait_seconds(e)
+            if seconds is None or job.attempts >= self.max_attempts:
+                self.stats["failed"] += 1
+                self._finish(job)
+                if not job.future.done():
+                    job.future.set_exception(e)
+                return
+            self._on_flood_wait(job, e, seconds)
+            return
+        finally:
+            self._in_flight -= 1
+
+        self.stats["sent"] += 1
+        self._recover_rate()
+        self._finish(job)
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def _on_flood_wait(self, job, error, seconds):
+        self.stats["flood_waits"] += 1
+        if type(error).__name__ == "SlowModeWaitError":
+            # Slow mode only affects this chat
+            self._bucket_for(job.chat_id, job.is_private).block(seconds)
+        else:
+            # Account-wide flood wait: stop everything and halve the send rate
+            self.global_bucket.block(seconds)
+            self.global_bucket.rate = max(self.base_global_rate / 16, self.global_bucket.rate / 2)
+            logger.warning(f"Flood wait of {seconds}s, send rate now {self.global_bucket.rate:.1f}/s")
+        self._defer(job, seconds)
+
+    def _recover_rate(self):
+        bucket = self.global_bucket
+        if bucket.rate < self.base_global_rate:
+            bucket.rate = min(self.base_global_rate, bucket.rate + self.base_global_rate / 100)
+
+    def start(self):
+        """Start the worker on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def drain(self, timeout=5.0):
+        """Wait until queued and in-flight sends are done; False on timeout"""
+        deadline = self.clock() + timeout
+        while self.queued() or self._in_flight:
+            if self.clock() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    async def stop(self):
+        """Stop the worker and cancel sends still waiting in the queue"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        dropped = 0
+        for _, _, job in self._ready + self._delayed:
+            if job.future.cancel():
+                dropped += 1
+        self._ready.clear()
+        self._delayed.clear()
+        self._pending.clear()
+        if dropped:
+            logger.warning(f"Cancelled {dropped} queued sends on stop")
@@ -0,0 +1,475 @@
+# service.py - Headless bot service and the local IPC the desktop GUI attaches through
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import secrets
+import argparse
+import threading
+from collections import deque
+
+from bot import TelegramBot
+from config import RESPONSES_FILE, CONVERSATION_FILE
+from matcher_index import CompiledMatcher, PendingEdits, build_for_store, snapshot_path_for, load_for_store as load_matcher
+from response_store import open_response_store
+from send_scheduler import SendScheduler
+from ingress_queue import IngressQueue
+from session_store import SessionStore, SESSIONS_FILE
+from media_stream import MediaStreamer
+from keyword_stats import KeywordStats
+from broadcast import BroadcastStore, BroadcastEngine, BROADCASTS_FILE
+from text_normalizer import TextNormalizer
+from hinglish_lexicon import HinglishLexicon
+from typo_index import TypoIndex
+from conversation_store import ConversationStore, segments_dir_for
+from bot_lifecycle import BotLifecycle, STOPPED
+from control_api import CONTROL_API_PORT, start_control_api
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8765"))
+TOKEN_FILE = "service.token"
+
+logger = logging.getLogger(__name__)
+
+
+def shard_file(path, shard):
+    """`path` with the shard name added before the extension"""
+    root, ext = os.path.splitext(path)
+    return f"{root}_{shard}{ext}"
+
+
+class BotRuntime:
+    """The bot with its stores and scheduler, independent of any UI.
+
+    A shard (one account run by shard_manager) keeps its own history and
+    flow sessions, and with `snapshot_path` maps the matcher snapshot the
+    manager compiled instead of building one.
+    """
+
+    def __init__(self, shard=None, snapshot_path=None):
+        self.shard = shard
+        self.snapshot_path = snapshot_path
+        self.store = open_response_store(RESPONSES_FILE)
+        conversation_file = shard_file(CONVERSATION_FILE, shard) if shard else CONVERSATION_FILE
+        # Read-only until this process runs the bot, so a GUI left open does not
+        # keep a --service started later from recording anything
+        self.conversations = ConversationStore(segments_dir_for(conversation_file), readonly=True)
+        self.bot = TelegramBot()
+        self.matcher = None
+        self._matcher_lock = threading.Lock()
+        # One rebuild at a time: they share the staging file
+        self._reload_lock = threading.Lock()
+        self.rebuild_delay = 2.0
+        self._rebuild_timer = None
+        self._timer_lock = threading.Lock()
+        # Kept across restarts so the stem cache stays warm
+        self.lexicon = HinglishLexicon()
+        self.normalizer = TextNormalizer(lexicon=self.lexicon)
+        # Keywords are compiled through the same normalizer as incoming messages
+        self.typo_index = TypoIndex(normalize=self.normalizer.match_key)
+        # Single GUI edits, matched from here until a debounced rebuild compiles them
+        self.pending_edits = PendingEdits(normalize=self.normalizer.match_key)
+        self._typo_index_built = False
+        self.send_scheduler = SendScheduler()
+        self.ingress_queue = IngressQueue()
+        self.media_streamer = MediaStreamer()
+        # Shared by every process running the bot, so hits from all accounts add up
+        self.keyword_stats = KeywordStats().start()
+        self.sessions = SessionStore(shard_file(SESSIONS_FILE, shard) if shard else SESSIONS_FILE).open()
+        self.broadcast_store = BroadcastStore(shard_file(BROADCASTS_FILE, shard) if shard else BROADCASTS_FILE)
+        self.broadcasts = BroadcastEngine(self.broadcast_store, self.send_scheduler, self._send_text,
+                                          self.conversations.chats)
+        self.state_listeners = []
+        self.lifecycle = BotLifecycle(self.bot, self.send_scheduler,
+                                      prepare=self.prepare, on_state=self._on_state,
+                                      ingress_queue=self.ingress_queue, broadcasts=self.broadcasts)
+        self.started_at = time.time()
+
+    def prepare(self):
+        """Runs before every (re)start, off the caller's thread"""
+        if not self.conversations.promote():
+            logger.warning("Conversation history is written by another process; "
+                           "messages handled here will not be recorded")
+
+        # Compiled matcher snapshot; only rebuilt when the responses changed
+        with self._matcher_lock:
+            if self.matcher:
+                self.matcher.close()
+            if self.snapshot_path:
+                self.matcher = CompiledMatcher(self.snapshot_path, self.normalizer)
+            else:
+                mark = self.pending_edits.mark()
+                self.matcher = load_matcher(self.store, self.normalizer)
+                self.pending_edits.settle(mark)
+            if not self._typo_index_built:
+                # Built once; kept current by responses_changed() and reload_matcher()
+                self.typo_index.rebuild(self.store.keywords())
+                self._typo_index_built = True
+            self.matcher.typo_index = self.typo_index
+            self.matcher.pending = self.pending_edits
+            self.bot.matcher = self.matcher
+
+        # Outgoing replies go through the flood-aware scheduler
+        self.bot.send_scheduler = self.send_scheduler
+        # Incoming updates are queued, and shed under load, before matching
+        self.bot.ingress_queue = self.ingress_queue
+        # Image and audio replies stream from mapped files, one upload per file
+        self.bot.media_streamer = self.media_streamer
+        # Hits, last hit and reply latency per keyword
+        self.bot.keyword_stats = self.keyword_stats
+        self.keyword_stats.track(self.store.keywords())
+        self.bot.conversation_store = self.conversations
+        self.bot.normalizer = self.normalizer
+        # Chats part-way through a multi-step flow
+        self.bot.sessions = self.sessions
+        self.bot.flow_steps = self.flow_steps
+
+    def reload_matcher(self):
+        """Rebuild the matcher after bulk changes and swap it in without stopping the bot
+
+        Safe to call from any thread; concurrent calls (control API handlers,
+        GUI workers) run one after the other.
+        """
+        final_path = snapshot_path_for(self.store.path)
+        staging_path = final_path + ".staging"
+        with self._reload_lock:
+            mark = self.pending_edits.mark()
+            build_for_store(self.store, staging_path, self.normalizer)
+
+            def open_snapshot():
+                os.replace(staging_path, final_path)
+                return CompiledMatcher(final_path, self.normalizer)
+            self._swap_matcher(open_snapshot)
+            self.pending_edits.settle(mark)
+
+    def use_snapshot(self, snapshot_path):
+        """Switch to a snapshot compiled by another process (the shard manager)"""
+        self.snapshot_path = snapshot_path
+        self._swap_matcher(lambda: CompiledMatcher(snapshot_path, self.normalizer))
+
+    def _swap_matcher(self, open_snapshot):
+        self.typo_index.rebuild(self.store.keywords())
+        self._typo_index_built = True
+
+        def swap():
+            with self._matcher_lock:
+                if self.matcher:
+                    self.matcher.close()
+                self.matcher = open_snapshot()
+                self.matcher.typo_index = self.typo_index
+                self.matcher.pending = self.pending_edits
+                self.bot.matcher = self.matcher
+
+        loop = self.lifecycle.loop
+        if loop is None or self.lifecycle.state == STOPPED:
+            swap()
+        else:
+            # On the bot loop no handler can be in the middle of a match
+            async def swap_on_loop():
+                swap()
+            asyncio.run_coroutine_threadsafe(swap_on_loop(), loop).result()
+
+    def _send_text(self, chat_id, text):
+        # Broadcast sends use the bot's client directly; the scheduler paces them
+        return self.bot.client.send_message(chat_id, text)
+
+    def flow_steps(self, keyword):
+        """Prompts of the flow response `keyword`, or None if it is not a flow"""
+        data = self.store.get(keyword)
+        if data is None or data.get('type') != "flow":
+            return None
+        return data['content']
+
+    def responses_changed(self, added=(), removed=()):
+        """Apply single edits from the GUI to the live matcher, then rebuild it once they settle"""
+        for keyword in removed:
+            self.pending_edits.remove(keyword)
+            self.typo_index.remove(keyword)
+        for keyword in added:
+            self.pending_edits.add(keyword)
+            self.typo_index.add(keyword)
+
+        timer = threading.Timer(self.rebuild_delay, self._rebuild_after_edits)
+        timer.daemon = True
+        with self._timer_lock:
+            if self._rebuild_timer is not None:
+                self._rebuild_timer.cancel()
+            self._rebuild_timer = timer
+        timer.start()
+
+    def _rebuild_after_edits(self):
+        try:
+            self.reload_matcher()
+        except Exception as e:
+            # The edits stay pending, so they keep matching until the next rebuild
+            logger.warning(f"Matcher rebuild after edits failed: {e}")
+
+    def _on_state(self, state, error=None):
+        for listener in list(self.state_listeners):
+            listener(state, error)
+
+    def stats(self):
+        """Snapshot of runtime counters"""
+        midnight = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+        return {
+            "shard": self.shard,
+            "state": self.lifecycle.state,
+            "uptime": time.time() - self.started_at,
+            "responses": self.store.count(),
+            "messages_today": len(self.conversations.record_range(midnight)),
+            "messages_total": len(self.conversations),
+            "send_queue": self.send_scheduler.queued(),
+            "sends": dict(self.send_scheduler.stats),
+            "ingress_queue": self.ingress_queue.queued(),
+            "ingress": dict(self.ingress_queue.stats),
+            "private_wait": self.ingress_queue.private_wait,
+            "sessions": self.sessions.info(),
+            "media": self.media_streamer.info(),
+            "broadcasts": sum(job["status"] == "running" for job in self.broadcast_store.jobs()),
+        }
+
+    def close(self):
+        with self._timer_lock:
+            if self._rebuild_timer is not None:
+                self._rebuild_timer.cancel()
+        self.lifecycle.shutdown()
+        self.sessions.close()
+        self.broadcast_store.close()
+        self.keyword_stats.close()
+        self.conversations.close()
+        self.lexicon.close()
+
+
+class _Subscriber:
+    """One attached client; a bounded outbox so a slow GUI never holds the bot up"""
+
+    def __init__(self, writer, limit=1000):
+        self.writer = writer
+        self.outbox = deque(maxlen=limit)
+        self.ready = asyncio.Event()
+
+    def push(self, message):
+        self.outbox.append(message)
+        self.ready.set()
+
+
+class BotService:
+    """Serves a BotRuntime to local clients over newline-delimited JSON on TCP"""
+
+    def __init__(self, runtime, host=SERVICE_HOST, port=SERVICE_PORT, token_file=TOKEN_FILE, stats_interval=2.0):
+        self.runtime = runtime
+        self.host = host
+        self.port = port
+        self.token_file = token_file
+        self.stats_interval = stats_interval
+        self.token = secrets.token_hex(16)
+        self.subscribers = set()
+        self.loop = None
+        self._closing = None
+
+        runtime.state_listeners.append(self._on_state)
+
+    def publish(self, message):
+        """Queue an event for every attached client (any thread)"""
+        if self.loop is not None and self.subscribers:
+            self.loop.call_soon_threadsafe(self._publish, message)
+
+    def _publish(self, message):
+        for subscriber in self.subscribers:
+            subscriber.push(message)
+
+    def _on_state(self, state, error=None):
+        self.publish({"event": "state", "state": state, "error": str(error) if error else None})
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._closing = asyncio.Event()
+        server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        port = server.sockets[0].getsockname()[1]
+
+        # Only processes that can read this file may attach
+        with open(self.token_file, 'w') as f:
+            f.write(f"{port}\n{self.token}\n")
+        logger.info(f"Bot service listening on {self.host}:{port}")
+
+        async with server:
+            stats_task = asyncio.ensure_future(self._publish_stats())
+            try:
+                await self._closing.wait()
+            finally:
+                stats_task.cancel()
+                # Clients see EOF and their handlers end before the loop does
+                for subscriber in list(self.subscribers):
+                    subscriber.writer.close()
+                await asyncio.sleep(0.1)
+                if os.path.exists(self.token_file):
+                    os.remove(self.token_file)
+
+    async def _publish_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            if self.subscribers:
+                stats = await self.loop.run_in_executor(None, self.runtime.stats)
+                self._publish({"event": "stats", **stats})
+
+    async def _handle_client(self, reader, writer):
+        subscriber = None
+        sender = None
+        try:
+            hello = json.loads(await reader.readline() or b"{}")
+            if not isinstance(hello, dict) or hello.get("cmd") != "hello" or not secrets.compare_digest(str(hello.get("token", "")), self.token):
+                writer.write(b'{"event": "error", "error": "unauthorized"}\n')
+                await writer.drain()
+                return
+
+            subscriber = _Subscriber(writer)
+            self.subscribers.add(subscriber)
+            sender = asyncio.ensure_future(self._send_loop(subscriber))
+            subscriber.push({"event": "state", "state": self.runtime.lifecycle.state, "error": None})
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self._handle_command(json.loads(line), subscriber)
+        except (ConnectionError, json.JSONDecodeError) as e:
+            logger.debug(f"Client connection closed: {e}")
+        finally:
+            if subscriber is not None:
+                self.subscribers.discard(subscriber)
+            if sender is not None:
+                sender.cancel()
+            writer.close()
+
+    def _handle_command(self, message, subscriber):
+        """Run one client command; a malformed one gets an error event, never a dropped connection"""
+        if not isinstance(message, dict):
+            subscriber.push({"event": "error", "error": "command must be a JSON object"})
+            return
+        cmd = message.get("cmd")
+        try:
+            self._run_command(cmd, message, subscriber)
+        except Exception as e:
+            logger.warning(f"Service command {cmd!r} failed: {e}")
+            subscriber.push({"event": "error", "error": f"{cmd}: {e}"})
+
+    def _run_command(self, cmd, message, subscriber):
+        if cmd == "start":
+            self.runtime.lifecycle.start()
+        elif cmd == "stop":
+            self.runtime.lifecycle.stop()
+        elif cmd == "stats":
+            subscriber.push({"event": "stats", **self.runtime.stats()})
+        elif cmd == "use_snapshot":
+            path = message.get("path")
+            if not isinstance(path, str) or not path:
+                raise ValueError("a snapshot path is required")
+            # Mapping the file is quick; the typo index rebuild is not, so off the loop
+            self.loop.run_in_executor(None, self.runtime.use_snapshot, path)
+        elif cmd == "shutdown":
+            self._closing.set()
+        else:
+            subscriber.push({"event": "error", "error": f"unknown command: {cmd}"})
+
+    async def _send_loop(self, subscriber):
+        while True:
+            await subscriber.ready.wait()
+            subscriber.ready.clear()
+            while subscriber.outbox:
+                subscriber.writer.write(json.dumps(subscriber.outbox.popleft()).encode('utf-8') + b"\n")
+            await subscriber.writer.drain()
+
+
+class ServiceLogHandler(logging.Handler):
+    """Forwards log records to attached clients as live messages"""
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def emit(self, record):
+        # Chat messages are logged with a chat_id; other records are plain log lines
+        chat_id = getattr(record, 'chat_id', None)
+        self.service.publish({"event": "log", "text": self.format(record),
+                              "type": "incoming" if chat_id is not None else "log", "chat_id": chat_id})
+
+
+class ServiceClient:
+    """Connection from the desktop GUI to a running BotService.
+
+    `on_event` is called from the client's reader thread for every event.
+    """
+
+    def __init__(self, on_event, token_file=TOKEN_FILE, timeout=5.0):
+        with open(token_file, 'r') as f:
+            port, token = f.read().split()
+        self.sock = socket.create_connection((SERVICE_HOST, int(port)), timeout=timeout)
+        self.sock.settimeout(None)
+        self.on_event = on_event
+        self._send_lock = threading.Lock()
+        self.send({"cmd": "hello", "token": token})
+        self._reader = threading.Thread(target=self._read_loop, name="service-client", daemon=True)
+        self._reader.start()
+
+    def send(self, message):
+        with self._send_lock:
+            self.sock.sendall(json.dumps(message).encode('utf-8') + b"\n")
+
+    def _read_loop(self):
+        try:
+            with self.sock.makefile('rb') as stream:
+                for line in stream:
+                    self.on_event(json.loads(line))
+        except (OSError, ValueError):
+            pass
+        self.on_event({"event": "detached"})
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def main(argv=None):
+    """Run the bot headless, serving attached GUIs over local IPC"""
+    parser = argparse.ArgumentParser(description="Run the Telegram bot as a headless service")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--no-autostart", action="store_true", help="Wait for a GUI to start the bot")
+    parser.add_argument("--control-port", type=int, default=CONTROL_API_PORT,
+                        help="Port of the local control API (0 to disable)")
+    parser.add_argument("--token-file", default=TOKEN_FILE)
+    parser.add_argument("--shard", help="Run as a shard of the shard manager")
+    parser.add_argument("--snapshot", help="Map this compiled matcher snapshot instead of building one")
+    args = parser.parse_args(argv)
+
+    log_file = shard_file('bot.log', args.shard) if args.shard else 'bot.log'
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.FileHandler(log_file), logging.StreamHandler()])
+
+    runtime = BotRuntime(shard=args.shard, snapshot_path=args.snapshot)
+    service = BotService(runtime, port=args.port, token_file=args.token_file)
+    logging.getLogger().addHandler(ServiceLogHandler(service))
+
+    control_api = start_control_api(runtime, port=args.control_port) if args.control_port else None
+
+    if not args.no_autostart:
+        runtime.lifecycle.start()
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if control_api:
+            control_api.shutdown()
+            control_api.server_close()
+        runtime.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+# session_store.py - Compact per-chat session state for multi-step response flows
+
+import re
+import sys
+import time
+import sqlite3
+import logging
+import threading
+
+SESSIONS_FILE = "sessions.db"
+CANCEL_WORDS = frozenset(("cancel", "stop", "exit"))
+
+# A session's state is one int: flow id in the high bits, step in the low byte
+STEP_BITS = 8
+MAX_STEPS = (1 << STEP_BITS) - 1
+# Answers are kept as one string; a tuple of strings costs a tuple per chat
+ANSWER_SEP = "\x1f"
+
+_PLACEHOLDER_RE = re.compile(r"\{(\d+)\}")
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSession:
+    __slots__ = ("state", "answers", "last_seen")
+
+    def __init__(self, state, answers, last_seen):
+        self.state = state
+        self.answers = answers
+        self.last_seen = last_seen
+
+    @property
+    def step(self):
+        return self.state & MAX_STEPS
+
+
+def fill_prompt(prompt, answers):
+    """Replace {1}, {2}, ... with the chat's earlier answers"""
+    answers = answers.split(ANSWER_SEP) if answers else []
+
+    def answer(match):
+        index = int(match.group(1)) - 1
+        return answers[index] if 0 <= index < len(answers) else match.group(0)
+    return _PLACEHOLDER_RE.sub(answer, prompt)
+
+
+class SessionStore:
+    """Where each chat is in a flow, for many chats at a few dozen bytes each.
+
+    A session is a slotted record holding one packed int (flow id and step),
+    the answers given so far as one string and the time of the last message.
+    Flow keywords are interned to small ids once. Sessions live in a plain
+    dict kept in last-message order (a chat is re-inserted on every message),
+    which is the LRU without OrderedDict's per-entry links. At most
+    `max_active` are kept in memory, and chats idle for `spill_after` seconds
+    move to SQLite at `spill_path` (dropped instead without one) until they
+    write again; only the ids of spilled chats stay in memory, so chats
+    outside a flow never touch the disk. A session idle for `ttl` seconds is
+    abandoned, in memory or on disk.
+    """
+
+    def __init__(self, spill_path=None, max_active=100000, spill_after=300.0, ttl=3600.0, clock=time.time):
+        self.spill_path = spill_path
+        self.max_active = max_active
+        self.spill_after = spill_after
+        self.ttl = ttl
+        self.clock = clock
+
+        self._sessions = {}   # chat_id -> ChatSession, least recently used first
+        self._flow_ids = {}
+        self._flow_names = []
+        self._conn = None
+        self._spilled_ids = set()
+        self._next_prune = 0.0
+        self._lock = threading.RLock()
+        self.stats = {"started": 0, "completed": 0, "cancelled": 0, "expired": 0,
+                      "spilled": 0, "restored": 0, "evicted": 0}
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # -- flow ids ------------------------------------------------------------
+
+    def _flow_id(self, keyword):
+        flow_id = self._flow_ids.get(keyword)
+        if flow_id is None:
+            flow_id = self._flow_ids[keyword] = len(self._flow_names)
+            self._flow_names.append(sys.intern(keyword))
+        return flow_id
+
+    def flow_of(self, session):
+        return self._flow_names[session.state >> STEP_BITS]
+
+    # -- spill file ----------------------------------------------------------
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.spill_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                               "chat_id INTEGER PRIMARY KEY, flow TEXT NOT NULL, step INTEGER NOT NULL, "
+                               "answers TEXT NOT NULL, last_seen REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+            with self._conn as conn:
+                conn.execute("DELETE FROM sessions WHERE last_seen < ?", (self.clock() - self.ttl,))
+            self._spilled_ids.update(row[0] for row in self._conn.execute("SELECT chat_id FROM sessions"))
+        return self._conn
+
+    def open(self):
+        """Pick up sessions spilled by a previous run"""
+        if self.spill_path:
+            with self._lock:
+                self._db()
+        return self
+
+    def _spill(self, chat_ids):
+        rows = []
+        for chat_id in chat_ids:
+            session = self._sessions.pop(chat_id)
+            rows.append((chat_id, self.flow_of(session), session.step, session.answers, session.last_seen))
+        if not rows:
+            return
+        if self.spill_path:
+            with self._db() as conn:
+                conn.executemany("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)", rows)
+            self._spilled_ids.update(chat_ids)
+            self.stats["spilled"] += len(rows)
+        else:
+            self.stats["evicted"] += len(rows)
+
+    def _prune_spilled(self, now):
+        """Delete spilled sessions idle past the ttl, and their ids"""
+        cutoff = now - self.ttl
+        with self._db() as conn:
+            expired = [row[0] for row in conn.execute("SELECT chat_id FROM sessions WHERE last_seen < ?",
+                                                      (cutoff,))]
+            conn.execute("DELETE FROM sessions WHERE last_seen < ?", (cutoff,))
+        self._spilled_ids.difference_update(expired)
+        self.stats["expired"] += len(expired)
+
+    def _restore(self, chat_id, now):
+        if chat_id not in self._spilled_ids:
+            return None
+        self._spilled_ids.discard(chat_id)
+        with self._db() as conn:
+            row = conn.execute("SELECT flow, step, answers, last_seen FROM sessions WHERE chat_id = ?",
+                               (chat_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM sessions WHERE chat_id = ?", (chat_id,))
+        flow, step, answers, last_seen = row
+        if now - last_seen > self.ttl:
+            self.stats["expired"] += 1
+            return None
+        self.stats["restored"] += 1
+        return ChatSession((self._flow_id(flow) << STEP_BITS) | step, answers, last_seen)
+
+    # -- sessions ------------------------------------------------------------
+
+    def sweep(self, now=None):
+        """Spill idle sessions and drop abandoned ones; the idle end of the LRU is checked only"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            idle, expired = [], []
+            for chat_id, session in self._sessions.items():
+                if now - session.last_seen < self.spill_after and \
+                        len(self._sessions) - len(idle) - len(expired) <= self.max_active:
+                    break
+                (expired if now - session.last_seen > self.ttl else idle).append(chat_id)
+            for chat_id in expired:
+                del self._sessions[chat_id]
+            self.stats["expired"] += len(expired)
+            self._spill(idle)
+            # Spilled chats that never wrote again would otherwise stay on disk for good
+            if self._spilled_ids and now >= self._next_prune:
+                self._next_prune = now + self.spill_after
+                self._prune_spilled(now)
+
+    def get(self, chat_id):
+        """The chat's session, from memory or the spill file; None if it is not in a flow"""
+        now = self.clock()
+        with self._lock:
+            session = self._sessions.pop(chat_id, None)
+            if session is None:
+                session = self._restore(chat_id, now)
+                if session is None:
+                    return None
+            elif now - session.last_seen > self.ttl:
+                self.stats["expired"] += 1
+                return None
+            session.last_seen = now
+            self._sessions[chat_id] = session
+        return session
+
+    def end(self, chat_id):
+        with self._lock:
+            self._sessions.pop(chat_id, None)
+            if chat_id in self._spilled_ids:
+                self._spilled_ids.discard(chat_id)
+                with self._db() as conn:
+                    conn.execute("DELETE FROM sessions WHERE chat_id = ?", (chat_id,))
+
+    def start_flow(self, chat_id, keyword, steps):
+        """Put the chat at the first step of flow `keyword`; returns the first prompt"""
+        if len(steps) > 1:
+            with self._lock:
+                self._sessions.pop(chat_id, None)
+                self._sessions[chat_id] = ChatSession(self._flow_id(keyword) << STEP_BITS, "", self.clock())
+                self.stats["started"] += 1
+                # Cheap: stops at the first chat that is neither idle nor over the cap
+                self.sweep()
+        return steps[0]
+
+    def continue_flow(self, chat_id, text, steps_for):
+        """Next prompt for a chat in the middle of a flow, or None if it is not in one.
+
+        `steps_for(keyword)` returns the flow's prompts, or None if the flow
+        no longer exists. The answer is recorded; the last prompt ends the flow.
+        """
+        session = self.get(chat_id)
+        if session is None:
+            return None
+        steps = steps_for(self.flow_of(session))
+        if not steps:
+            self.end(chat_id)
+            return None
+        if text.strip().casefold() in CANCEL_WORDS:
+            self.end(chat_id)
+            self.stats["cancelled"] += 1
+            return "Cancelled."
+
+        step = min(session.step + 1, len(steps) - 1, MAX_STEPS)
+        answer = text.strip().replace(ANSWER_SEP, " ")
+        answers = session.answers + ANSWER_SEP + answer if session.step else answer
+        if step >= len(steps) - 1:
+            self.end(chat_id)
+            self.stats["completed"] += 1
+        else:
+            session.state = (session.state & ~MAX_STEPS) | step
+            session.answers = answers
+        return fill_prompt(steps[step], answers)
+
+    def close(self):
+        """Spill every active session (when a spill file is set) so flows survive a restart"""
+        with self._lock:
+            if self.spill_path and self._sessions:
+                self._spill(list(self._sessions))
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def info(self):
+        with self._lock:
+            return {"active": len(self._sessions), "on_disk": len(self._spilled_ids), **self.stats}
@@ -0,0 +1,254 @@
+# shard_manager.py - Runs one bot worker process per Telegram account
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import threading
+import subprocess
+
+from matcher_index import build_for_store, snapshot_path_for
+from service import ServiceClient, shard_file, TOKEN_FILE
+
+SHARDS_FILE = "shards.json"
+SHARD_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+ACCOUNT_FIELDS = ("name", "api_id", "api_hash", "phone")
+
+logger = logging.getLogger(__name__)
+
+
+def load_accounts(path=SHARDS_FILE):
+    """Accounts configured for sharding: [{name, api_id, api_hash, phone}]"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_accounts(accounts, path=SHARDS_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(accounts, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def validate_account(account):
+    """Check an account dict; raises ValueError describing the first problem"""
+    if not SHARD_NAME_RE.match(account.get("name") or ""):
+        raise ValueError("name must be 1-32 letters, digits, '-' or '_'")
+    for field in ACCOUNT_FIELDS[1:]:
+        if not str(account.get(field) or "").strip():
+            raise ValueError(f"{field} is required")
+
+
+def worker_command(account, snapshot_path, token_file):
+    """Command line that runs `account` as a headless service shard"""
+    if getattr(sys, 'frozen', False):
+        command = [sys.executable, "--service"]
+    else:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "service.py")]
+    return command + ["--port", "0", "--control-port", "0", "--token-file", token_file,
+                      "--shard", account["name"], "--snapshot", snapshot_path]
+
+
+class Shard:
+    """One account's worker process and the GUI's connection to it"""
+
+    def __init__(self, account):
+        self.account = account
+        self.name = account["name"]
+        self.token_file = shard_file(TOKEN_FILE, self.name)
+        self.process = None
+        self.client = None
+        self.state = "exited"
+        self.stats = {}
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+
+class ShardManager:
+    """Starts, watches and stops the shard processes of several accounts.
+
+    Every shard is service.py in its own process, with its own event loop,
+    Telegram session, history and flow sessions; credentials reach it through
+    the environment (API_ID, API_HASH, PHONE, TELEGRAM_SESSION). All shards
+    map the same compiled matcher snapshot read-only, so the responses are
+    compiled once and their pages are shared by the OS. A new snapshot is
+    published under a new name and the shards switch to it, since a file
+    mapped by another process cannot be replaced on Windows. `on_event(name,
+    event)` receives every shard's service events from reader threads.
+    """
+
+    def __init__(self, store, on_event, accounts_file=SHARDS_FILE, connect_timeout=30.0, normalizer=None):
+        self.store = store
+        # The snapshot is compiled with the normalizer the shards match with
+        self.normalizer = normalizer
+        self.on_event = on_event
+        self.accounts_file = accounts_file
+        self.connect_timeout = connect_timeout
+        self.shards = {}
+        self.snapshot_path = None
+        self._generation = 0
+        self._old_snapshots = []
+        self._lock = threading.Lock()
+        for account in load_accounts(accounts_file):
+            self.shards[account["name"]] = Shard(account)
+
+    # -- accounts ------------------------------------------------------------
+
+    def add_account(self, account):
+        validate_account(account)
+        with self._lock:
+            if account["name"] in self.shards:
+                raise ValueError(f"shard {account['name']} already exists")
+            self.shards[account["name"]] = Shard(account)
+            self._save()
+
+    def remove_account(self, name):
+        self.stop(name)
+        with self._lock:
+            self.shards.pop(name, None)
+            self._save()
+
+    def _save(self):
+        save_accounts([shard.account for shard in self.shards.values()], self.accounts_file)
+
+    # -- shared snapshot -----------------------------------------------------
+
+    def publish_snapshot(self):
+        """Compile the current responses once and switch every running shard to them"""
+        with self._lock:
+            self._generation += 1
+            path = f"{snapshot_path_for(self.store.path)}.shared-{os.getpid()}-{self._generation}"
+            build_for_store(self.store, path, self.normalizer)
+            if self.snapshot_path:
+                self._old_snapshots.append(self.snapshot_path)
+            self.snapshot_path = path
+            for shard in self.shards.values():
+                if shard.client:
+                    shard.client.send({"cmd": "use_snapshot", "path": path})
+            self._remove_old_snapshots()
+        return path
+
+    def _remove_old_snapshots(self):
+        # A shard may still have an old one mapped; retried on the next publish
+        kept = []
+        for path in self._old_snapshots:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                kept.append(path)
+        self._old_snapshots = kept
+
+    # -- processes -----------------------------------------------------------
+
+    def start(self, name):
+        """Launch the shard's worker process and attach to it in the background"""
+        shard = self.shards[name]
+        if shard.running:
+            return
+        if self.snapshot_path is None:
+            self.publish_snapshot()
+        if os.path.exists(shard.token_file):
+            os.remove(shard.token_file)
+
+        env = dict(os.environ)
+        env.update({"API_ID": str(shard.account["api_id"]), "API_HASH": shard.account["api_hash"],
+                    "PHONE": shard.account["phone"], "TELEGRAM_SESSION": f"shard_{name}"})
+        shard.process = subprocess.Popen(worker_command(shard.account, self.snapshot_path, shard.token_file),
+                                         env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.DEVNULL,
+                                         creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0))
+        self._set_state(shard, "launching")
+        threading.Thread(target=self._attach, args=(shard, shard.process), name=f"shard-{name}",
+                         daemon=True).start()
+
+    def _attach(self, shard, process):
+        deadline = time.monotonic() + self.connect_timeout
+        while not os.path.exists(shard.token_file):
+            if process.poll() is not None or time.monotonic() > deadline:
+                self._set_state(shard, "exited", f"worker exited with code {process.poll()}"
+                                if process.poll() is not None else "worker did not start in time")
+                return
+            time.sleep(0.2)
+        try:
+            shard.client = ServiceClient(lambda event: self._on_shard_event(shard, event),
+                                         token_file=shard.token_file)
+        except (OSError, ValueError) as e:
+            self._set_state(shard, "exited", f"could not attach: {e}")
+
+    def _on_shard_event(self, shard, event):
+        kind = event.get("event")
+        if kind == "state":
+            shard.state = event["state"]
+        elif kind == "stats":
+            shard.stats = event
+        elif kind == "detached":
+            shard.client = None
+            shard.state = "exited"
+        self.on_event(shard.name, event)
+
+    def _set_state(self, shard, state, error=None):
+        shard.state = state
+        self.on_event(shard.name, {"event": "state", "state": state, "error": error})
+
+    def send(self, name, message):
+        """Send a service command ("start", "stop", ...) to a running shard"""
+        client = self.shards[name].client
+        if client is None:
+            raise ValueError(f"shard {name} is not running")
+        client.send(message)
+
+    def stop(self, name, timeout=10.0):
+        """Shut the shard's worker down, killing it if it does not exit in time"""
+        shard = self.shards.get(name)
+        if shard is None or shard.process is None:
+            return
+        if shard.client:
+            try:
+                shard.client.send({"cmd": "shutdown"})
+            except OSError:
+                pass
+        try:
+            shard.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Shard {name} did not exit, terminating it")
+            shard.process.kill()
+            shard.process.wait()
+        if shard.client:
+            shard.client.close()
+            shard.client = None
+        shard.process = None
+        self._set_state(shard, "exited")
+
+    def start_all(self):
+        for name in list(self.shards):
+            self.start(name)
+
+    def shutdown(self):
+        """Stop every shard (application exit)"""
+        for name in list(self.shards):
+            self.stop(name)
+        if self.snapshot_path:
+            self._old_snapshots.append(self.snapshot_path)
+            self.snapshot_path = None
+        self._remove_old_snapshots()
+
+    def totals(self):
+        """Counters summed over the running shards"""
+        totals = {"running": 0, "messages_today": 0, "send_queue": 0, "shed": 0}
+        for shard in self.shards.values():
+            stats = shard.stats if shard.running else {}
+            totals["running"] += shard.state == "running"
+            totals["messages_today"] += stats.get("messages_today", 0)
+            totals["send_queue"] += stats.get("send_queue", 0)
+            ingress = stats.get("ingress", {})
+            totals["shed"] += ingress.get("shed_oldest", 0) + ingress.get("shed_duplicate", 0) + \
+                ingress.get("shed_stale", 0)
+        return totals
@@ -0,0 +1,169 @@
+# text_normalizer.py - Fast tokenization and normalization of incoming messages
+
+import json
+import hashlib
+import logging
+import unicodedata
+import importlib.util
+
+# Bump when light_stem or tokenization changes what normalize() returns
+NORMALIZER_VERSION = 1
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most my
+myself no nor not of off on once only or other our ours ourselves out over own same she should so some
+such than that the their theirs them themselves then there these they this those through to too under
+until up very was we were what when where which while who whom why will with would you your yours
+yourself yourselves
+""".split())
+
+
+class _PunctuationTable(dict):
+    """str.translate table mapping every Unicode punctuation/symbol character to a space.
+
+    Filled lazily: each character is classified once, on first sight, so no
+    table over all of Unicode is built at import time.
+    """
+
+    def __missing__(self, code):
+        category = unicodedata.category(chr(code))
+        value = " " if category[0] in "PSZ" or category == "Cc" else code
+        self[code] = value
+        return value
+
+
+PUNCTUATION_TABLE = _PunctuationTable()
+
+
+def light_stem(word):
+    """Strip common English inflections; cheap and good enough for keyword matching"""
+    if len(word) <= 3 or not word.isascii():
+        return word
+    if word.endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.endswith("sses"):
+        return word[:-2]
+    if word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    if word.endswith("ing") and len(word) > 5:
+        word = word[:-3]
+    elif word.endswith("ed") and len(word) > 4:
+        word = word[:-2]
+    # runn(ing) -> run, stopp(ed) -> stop
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+        word = word[:-1]
+    return word
+
+
+def _nltk_stemmer():
+    try:
+        from nltk.stem import PorterStemmer
+    except ImportError:
+        logger.warning("nltk is not installed, using the built-in stemmer")
+        return light_stem
+    return PorterStemmer().stem
+
+
+def _nltk_available():
+    # Checked without importing nltk, which would slow every startup
+    return importlib.util.find_spec("nltk") is not None
+
+
+class TextNormalizer:
+    """Normalization stage run on every incoming message before matching.
+
+    Text is casefolded, punctuation and symbols become spaces via one
+    translate() call, and tokens are what str.split() leaves. Each token is
+    mapped through the optional Hinglish lexicon and then stemmed; the result
+    is memoized in a bounded cache, so the lexicon and the stemmer only run the
+    first time a word is seen.
+
+    The default stemmer="auto" uses the built-in light_stem and falls back to
+    nltk's Porter stemmer (when installed) for ASCII words light_stem leaves
+    as they are. stemmer="builtin" never loads nltk; stemmer="nltk" uses
+    Porter for every word.
+    """
+
+    def __init__(self, stopwords=STOPWORDS, cache_size=100000, stemmer="auto", lexicon=None):
+        self.stopwords = frozenset(stopwords)
+        self.cache_size = cache_size
+        self.lexicon = lexicon
+        self._lexicon_generation = lexicon.generation if lexicon else 0
+        if stemmer == "auto" and not _nltk_available():
+            stemmer = "builtin"
+        # Part of signature(): keywords compiled with another stemmer are rebuilt
+        self.stemmer = stemmer
+        self._porter = None
+        if stemmer == "nltk":
+            self._stem = _nltk_stemmer()
+        elif stemmer == "auto":
+            self._stem = self._stem_with_fallback
+        else:
+            self._stem = light_stem
+        self._stems = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _stem_with_fallback(self, word):
+        stem = light_stem(word)
+        if stem != word or len(word) <= 3 or not word.isascii():
+            return stem
+        if self._porter is None:
+            # Loaded on the first word that needs it, not at startup
+            self._porter = _nltk_stemmer()
+        return self._porter(word)
+
+    def clean(self, text):
+        """Casefolded text with punctuation removed and whitespace collapsed"""
+        return " ".join(text.casefold().translate(PUNCTUATION_TABLE).split())
+
+    def stem(self, word):
+        stem = self._stems.get(word)
+        if stem is not None:
+            self.hits += 1
+            return stem
+        self.misses += 1
+        stem = self._stem(self.lexicon.canonical(word) if self.lexicon else word)
+        if len(self._stems) >= self.cache_size:
+            # Drop the older half; dicts keep insertion order
+            # pop(): the bot loop and GUI workers (compiling keywords) may evict at once
+            for old in list(self._stems)[:self.cache_size // 2]:
+                self._stems.pop(old, None)
+        if self.cache_size:
+            self._stems[word] = stem
+        return stem
+
+    def tokens(self, text):
+        """Stemmed content words of a message, stopwords removed"""
+        if self.lexicon and self.lexicon.generation != self._lexicon_generation:
+            # Variants were added; cached tokens may map differently now
+            self._lexicon_generation = self.lexicon.generation
+            self._stems = {}
+        stopwords = self.stopwords
+        stem = self.stem
+        return [stem(token) for token in text.casefold().translate(PUNCTUATION_TABLE).split()
+                if token not in stopwords]
+
+    def normalize(self, text):
+        """Message reduced to its stemmed content words, joined by spaces"""
+        return " ".join(self.tokens(text))
+
+    def match_key(self, text):
+        """normalize(), or the cleaned text when nothing but stopwords is left ("how are you")"""
+        return self.normalize(text) or self.clean(text)
+
+    def signature(self):
+        """Changes whenever normalize() may map a text differently; keys compiled keywords"""
+        digest = hashlib.sha256(f"{NORMALIZER_VERSION}:{self.stemmer}:".encode('utf-8'))
+        digest.update(" ".join(sorted(self.stopwords)).encode('utf-8'))
+        if self.lexicon:
+            digest.update(self.lexicon.header["seed_hash"].encode('utf-8'))
+            digest.update(json.dumps(self.lexicon.overlay, sort_keys=True).encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def cache_info(self):
+        return {"size": len(self._stems), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,115 @@
+# tray.py - System tray icon on one long-lived thread, and batched message notifications
+
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationCoalescer:
+    """Turns a stream of incoming messages into at most one notification per `interval`.
+
+    The first message after a quiet period is shown right away; anything
+    arriving within `interval` of the last notification waits for the next
+    digest ("37 new messages from 5 chats"). Not thread-safe: use it from
+    the Tk thread only.
+    """
+
+    def __init__(self, interval=10.0, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.last_shown = float("-inf")
+        self._count = 0
+        self._chats = set()
+        self._last_text = None
+
+    def __len__(self):
+        return self._count
+
+    def add(self, text, chat_id=None):
+        """Queue a message; returns the seconds until its digest is due when one must be
+        scheduled (the first message of a batch), else None"""
+        self._count += 1
+        self._last_text = text
+        if chat_id is not None:
+            self._chats.add(chat_id)
+        if self._count == 1:
+            return max(0.0, self.last_shown + self.interval - self.clock())
+        return None
+
+    def digest(self):
+        """(title, text) of the pending messages, or None; starts a new batch"""
+        count, chats, text = self._count, len(self._chats), self._last_text
+        self._count = 0
+        self._chats.clear()
+        self._last_text = None
+        if not count:
+            return None
+        self.last_shown = self.clock()
+        if count == 1:
+            return "New Message", text[:100]
+        summary = f"{count} new messages"
+        if chats:
+            summary += f" from {chats} chat{'s' if chats != 1 else ''}"
+        return "New Messages", summary
+
+
+class TrayThread:
+    """Runs a pystray icon on a single thread for the whole life of the app.
+
+    Menu callbacks arrive on that thread, so every action goes through
+    `dispatch` (the app passes ``lambda f: root.after(0, f)``) and runs on
+    the Tk thread. Hiding and showing the window only changes the window;
+    the icon and its thread stay until stop().
+    """
+
+    def __init__(self, icon, dispatch):
+        self.icon = icon
+        self.dispatch = dispatch
+        self._thread = None
+        self._ready = threading.Event()
+
+    def action(self, callback):
+        """Menu callback that runs `callback` on the Tk thread"""
+        return lambda: self.dispatch(callback)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="tray", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        def setup(icon):
+            icon.visible = True
+            self._ready.set()
+        try:
+            self.icon.run(setup=setup)
+        except Exception as e:
+            logger.warning(f"System tray stopped: {e}")
+        finally:
+            self._ready.set()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def notify(self, title, text):
+        """Show a notification; dropped while the icon is not up"""
+        if not self._ready.is_set() or not self.running:
+            return
+        try:
+            self.icon.notify(text, title)
+        except Exception as e:
+            logger.debug(f"Notification failed: {e}")
+
+    def stop(self, timeout=2.0):
+        if self._thread is None:
+            return
+        try:
+            self.icon.stop()
+        except Exception as e:
+            logger.debug(f"Tray stop failed: {e}")
+        self._thread.join(timeout)
+        self._thread = None
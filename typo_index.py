@@ -0,0 +1,180 @@
+# typo_index.py - SymSpell-style deletion index for misspelled single-word keywords
+
+import threading
+
+from matcher_index import normalize_keyword, keyword_key
+
+
+def _deletes(word, max_distance, prefix_length):
+    """Every string reachable from `word`'s prefix by up to `max_distance` deletions"""
+    word = word[:prefix_length]
+    found = {word}
+    frontier = [word]
+    for _ in range(max_distance):
+        next_frontier = []
+        for term in frontier:
+            if len(term) <= 1:
+                continue
+            for i in range(len(term)):
+                deleted = term[:i] + term[i + 1:]
+                if deleted not in found:
+                    found.add(deleted)
+                    next_frontier.append(deleted)
+        frontier = next_frontier
+    return found
+
+
+def edit_distance(a, b, limit):
+    """Optimal-string-alignment distance between a and b, or limit + 1 once it exceeds `limit`"""
+    # Only the differing middle needs the DP; a typo rarely leaves more than a few characters
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not a or not b:
+        return len(a) or len(b)
+
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] * (len(b) + 1)
+        row_min = i
+        char_a = a[i - 1]
+        for j in range(1, len(b) + 1):
+            value = previous[j - 1] if char_a == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == b[j - 1] and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class TypoIndex:
+    """Precomputed deletion neighbourhoods of single-word keywords.
+
+    A keyword is indexed under every string its first `prefix_length`
+    characters turn into after up to `max_distance` deletions; a message word
+    is looked up the same way, so candidates within the edit distance come
+    from a handful of dict probes instead of a scan over all keywords. Short
+    words allow fewer edits, so "menu" does not match "me". Safe to update
+    from the GUI thread while the bot thread looks words up.
+    """
+
+    def __init__(self, max_distance=2, prefix_length=7, min_length=3, normalize=normalize_keyword):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_length = min_length
+        # The matcher's normalizer, so keywords and messages reduce the same way
+        self.normalize = normalize
+        self._words = {}      # normalized word -> keyword as written
+        self._deletes = {}    # deletion -> word, or tuple of words sharing it
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._words)
+
+    def __contains__(self, keyword):
+        return keyword_key(keyword, self.normalize) in self._words
+
+    def distance_for(self, word):
+        """Edits allowed for a word of this length"""
+        if len(word) < self.min_length:
+            return 0
+        return 1 if len(word) <= 4 else self.max_distance
+
+    @staticmethod
+    def _indexable(word):
+        return word and " " not in word and "*" not in word
+
+    def add(self, keyword):
+        """Index `keyword` if it is a single word; returns whether it was"""
+        word = keyword_key(keyword, self.normalize)
+        if not self._indexable(word):
+            return False
+        with self._lock:
+            if word in self._words:
+                self._words[word] = keyword
+                return True
+            self._words[word] = keyword
+            deletes = self._deletes
+            for deleted in _deletes(word, self.distance_for(word), self.prefix_length):
+                entry = deletes.get(deleted)
+                if entry is None:
+                    deletes[deleted] = word
+                elif isinstance(entry, str):
+                    deletes[deleted] = (entry, word)
+                else:
+                    deletes[deleted] = entry + (word,)
+        return True
+
+    def remove(self, keyword):
+        word = keyword_key(keyword, self.normalize)
+        with self._lock:
+            if self._words.pop(word, None) is None:
+                return
+            deletes = self._deletes
+            for deleted in _deletes(word, self.distance_for(word), self.prefix_length):
+                entry = deletes.get(deleted)
+                if entry == word:
+                    del deletes[deleted]
+                elif isinstance(entry, tuple):
+                    rest = tuple(w for w in entry if w != word)
+                    deletes[deleted] = rest[0] if len(rest) == 1 else rest
+
+    def rebuild(self, keywords):
+        """Replace the index contents with `keywords`"""
+        fresh = TypoIndex(self.max_distance, self.prefix_length, self.min_length, self.normalize)
+        for keyword in keywords:
+            fresh.add(keyword)
+        with self._lock:
+            self._words, self._deletes = fresh._words, fresh._deletes
+
+    def lookup(self, text, limit=None):
+        """[(keyword, distance)] for keywords within the allowed edit distance, closest first"""
+        word = self.normalize(text)
+        if not self._indexable(word):
+            return []
+        words, deletes = self._words, self._deletes
+        if limit == 1 and word in words:
+            return [(words[word], 0)]
+        max_distance = self.distance_for(word)
+
+        candidates = set()
+        for deleted in _deletes(word, max_distance, self.prefix_length):
+            entry = deletes.get(deleted)
+            if entry is None:
+                continue
+            if isinstance(entry, str):
+                candidates.add(entry)
+            else:
+                candidates.update(entry)
+
+        results = []
+        for candidate in candidates:
+            limit_for = min(max_distance, self.distance_for(candidate))
+            distance = 0 if candidate == word else edit_distance(word, candidate, limit_for)
+            if distance <= limit_for:
+                keyword = words.get(candidate)
+                if keyword is not None:
+                    results.append((distance, candidate, keyword))
+        results.sort()
+        return [(keyword, distance) for distance, _, keyword in results[:limit]]
+
+    def best(self, text):
+        """Closest keyword for a one-word message, or None"""
+        found = self.lookup(text, limit=1)
+        return found[0][0] if found else None
@@ -0,0 +1,103 @@
+# unmatched_clusters.py - Cluster unmatched messages to suggest new responses
+
+import re
+import heapq
+from collections import Counter
+
+import numpy as np
+
+WORD_RE = re.compile(r"(?u)\b\w\w+\b")
+
+
+def iter_unmatched(store, chunk_size=5000):
+    """Yield normalized texts of incoming messages that matched no keyword"""
+    batch = []
+    for _, record in store.since(0, chunk_size):
+        if record.get("direction") == "incoming" and not record.get("keyword") and record.get("text"):
+            batch.append(" ".join(WORD_RE.findall(record["text"].casefold())))
+            if len(batch) >= chunk_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class _BoundedCounter(Counter):
+    """Counter that drops its rarest half when it grows past `limit` entries"""
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def add(self, key):
+        self[key] += 1
+        if len(self) > self.limit:
+            for key, _ in self.most_common()[self.limit // 2:]:
+                del self[key]
+
+
+def cluster_unmatched(segments_dir, max_clusters=50, batch_size=5000, examples=5, n_features=2 ** 18):
+    """Cluster unmatched messages; returns clusters ranked by size.
+
+    Runs two streaming passes over history (fit, then assign) with a hashing
+    vectorizer and mini-batch k-means, so memory is bounded by the batch size
+    and the number of clusters, not by how many messages there are.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.feature_extraction.text import HashingVectorizer
+    from conversation_store import ConversationStore
+
+    store = ConversationStore(segments_dir, readonly=True)
+    vectorizer = HashingVectorizer(n_features=n_features, ngram_range=(1, 2), alternate_sign=False, norm='l2')
+
+    total = sum(len(batch) for batch in iter_unmatched(store, batch_size))
+    if total < 2:
+        return {"messages": total, "clusters": []}
+    n_clusters = int(min(max_clusters, max(2, np.sqrt(total / 2))))
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, random_state=0, n_init=3)
+
+    # Pass 1: fit; carry short batches over so every partial_fit has enough samples
+    pending = []
+    for batch in iter_unmatched(store, batch_size):
+        pending.extend(t for t in batch if t)
+        if len(pending) >= max(batch_size, n_clusters):
+            kmeans.partial_fit(vectorizer.transform(pending))
+            pending = []
+    if pending:
+        if not hasattr(kmeans, "cluster_centers_") and len(pending) < n_clusters:
+            return {"messages": total, "clusters": []}
+        kmeans.partial_fit(vectorizer.transform(pending))
+
+    # Pass 2: assign, keeping only bounded per-cluster state
+    sizes = np.zeros(n_clusters, dtype=np.int64)
+    phrases = [_BoundedCounter(2000) for _ in range(n_clusters)]
+    closest = [[] for _ in range(n_clusters)]
+    for batch in iter_unmatched(store, batch_size):
+        batch = [t for t in batch if t]
+        if not batch:
+            continue
+        distances = kmeans.transform(vectorizer.transform(batch))
+        labels = distances.argmin(axis=1)
+        sizes += np.bincount(labels, minlength=n_clusters)
+        for text, label, distance in zip(batch, labels, distances[np.arange(len(batch)), labels]):
+            phrases[label].add(text)
+            heap = closest[label]
+            # Max-heap (by negated distance) of the nearest distinct messages
+            if text not in (t for _, t in heap):
+                if len(heap) < examples:
+                    heapq.heappush(heap, (-distance, text))
+                elif -heap[0][0] > distance:
+                    heapq.heapreplace(heap, (-distance, text))
+
+    clusters = []
+    for label in np.argsort(sizes)[::-1]:
+        if not sizes[label]:
+            continue
+        common = phrases[label].most_common(examples)
+        clusters.append({
+            "size": int(sizes[label]),
+            "keyword": common[0][0],
+            "phrases": [text for text, _ in common],
+            "examples": [text for _, text in sorted(closest[label], reverse=True)],
+        })
+    return {"messages": total, "clusters": clusters}